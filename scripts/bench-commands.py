@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compare looking up command names in a trie, the way parser_.py used
+to, with looking them up in a prefix table.  The command names are
+taken from src/block_codes.py, and the words looked up are a mix of
+full names, unique prefixes, ambiguous prefixes and unknown words.
+Run this script from the top of the source tree."""
+
+import sys
+import time
+import random
+
+sys.path.insert(0, 'src/')
+import trie
+import prefix_table
+import block_codes
+
+
+class FakeCommand(object):
+    def __init__(self, name):
+        self.name = name
+
+
+def trie_lookup(cmds, word):
+    """The old way of finding a command, from parser_._do_parse()."""
+    try:
+        return (cmds[word], None)
+    except KeyError:
+        return (None, None)
+    except trie.NeedMore:
+        matches = cmds.all_children(word)
+        if len(matches) == 1:
+            return (matches[0], None)
+        else:
+            return (None, matches)
+
+
+def make_words(names, count):
+    words = []
+    for i in range(count):
+        name = random.choice(names)
+        r = random.random()
+        if r < 0.5:
+            words.append(name)
+        elif r < 0.95:
+            words.append(name[0:random.randint(1, len(name))])
+        else:
+            words.append(name + 'xyz')
+    return words
+
+
+def bench(name, f, words):
+    start = time.time()
+    for word in words:
+        f(word)
+    elapsed = time.time() - start
+    print('%-12s %10.0f commands/sec' % (name, len(words) / elapsed))
+
+
+def main():
+    names = [k[len('BLKCMD_'):].lower() for k in dir(block_codes)
+        if k.startswith('BLKCMD_') and not k.startswith('BLKCMD_ERROR')]
+    old = trie.Trie()
+    new = prefix_table.PrefixTable()
+    for name in names:
+        old[name] = new[name] = FakeCommand(name)
+
+    words = make_words(names, 200000)
+    for word in words:
+        (cmd, matches) = trie_lookup(old, word)
+        (cmd2, matches2) = new.lookup(word)
+        assert(cmd is cmd2)
+        if matches:
+            assert(sorted(c.name for c in matches) ==
+                [c.name for c in matches2])
+        else:
+            assert(matches2 is None)
+
+    print('%d commands, %d words' % (len(names), len(words)))
+    bench('trie', lambda word: trie_lookup(old, word), words)
+    bench('prefix', new.lookup, words)
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
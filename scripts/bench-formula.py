@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Time the formula checks done when a seek is posted, with many users
+online: each user's formula is checked against the seek, and the
+seeker's formula against each user.  Formulas are either parsed for
+every check, or compiled once and cached per user.  Run this script
+from the top of the source tree."""
+
+import sys
+import time
+import random
+
+sys.path.insert(0, 'src/')
+import formula
+from game_constants import WHITE, BLACK
+
+FORMULAS = [None, None, None, 'blitz', '!lightning && !blitz',
+    'time >= 3 && inc <= 5', 'rating > 1400 && rating < 2200',
+    'ratingdiff < 300 && ratingdiff > -300', 'ratingdiff > -200 && !computer',
+    'f1 && (standard || time > 10)', 'registered && timeseal',
+    '!abuser # no abusers', 'time + inc * 2 / 3 >= 5 minutes',
+    'nocolor || white']
+FVARS = ['myrating - rating < 400', 'timeseal || time >= 15', None]
+
+
+class FakeUser(object):
+    def __init__(self, name):
+        self.name = name
+        self.rating = random.randint(800, 2600)
+        self.is_guest = random.random() < 0.2
+        self.titles = ['computer'] if random.random() < 0.05 else []
+        self.timeseal = random.random() < 0.7
+        self.vars_ = dict(('f%d' % i, None) for i in range(1, 10))
+        self.vars_['formula'] = random.choice(FORMULAS)
+        self.vars_['f1'] = random.choice(FVARS)
+        self.compiled_formulas = {}
+
+    def has_title(self, title):
+        return title in self.titles
+
+    def get_rating(self, speed_variant):
+        return self.rating
+
+    def has_timeseal(self):
+        return self.timeseal
+
+
+class FakeVariant(object):
+    name = 'chess'
+
+
+class FakeSeek(object):
+    """ The attributes of a seek that formulas can refer to. """
+    def __init__(self, a):
+        self.a = a
+        self.b = None
+        self.time = 3
+        self.inc = 0
+        self.speed_variant = None
+        self.speed_name = 'blitz'
+        self.variant = FakeVariant()
+        self.side = random.choice([WHITE, BLACK, None])
+
+
+def post_parse(seek, users):
+    """ Like Seek.post() before formulas were compiled. """
+    count = 0
+    for u in users:
+        seek.b = u
+        ok = formula.check_formula(seek, u.vars_['formula'])
+        seek.b = seek.a
+        seek.a = u
+        ok = ok and formula.check_formula(seek, seek.b.vars_['formula'])
+        seek.a = seek.b
+        seek.b = None
+        if ok:
+            count += 1
+    return count
+
+
+def post_compiled(seek, users):
+    """ Like Seek.post(). """
+    count = 0
+    for u in users:
+        seek.b = u
+        ok = formula.check_user_formula(seek, u)
+        seek.b = seek.a
+        seek.a = u
+        ok = ok and formula.check_user_formula(seek, seek.b)
+        seek.a = seek.b
+        seek.b = None
+        if ok:
+            count += 1
+    return count
+
+
+def bench(name, f, seeks, users):
+    start = time.time()
+    for seek in seeks:
+        f(seek, users)
+    elapsed = time.time() - start
+    print('%-10s %8.1f ms per seek' % (name, 1000 * elapsed / len(seeks)))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    users = [FakeUser('User%d' % i) for i in range(count)]
+    seeks = [FakeSeek(random.choice(users)) for i in range(20)]
+
+    for seek in seeks:
+        assert(post_parse(seek, users) == post_compiled(seek, users))
+
+    print('%d users online' % count)
+    bench('parse', post_parse, seeks, users)
+    bench('compiled', post_compiled, seeks, users)
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Measure the memory used by the position, move history and moves of
+a game, by playing random games of a given length (in plies) as the
+server would, and adding up the sizes of the objects reachable from
+the position.  Also times a draw by repetition check at the end of
+each game.  Run this script from the top of the source tree."""
+
+import sys
+import time
+import types
+import random
+
+sys.path.insert(0, 'src/')
+from game_constants import WHITE
+from variant import chess, crazyhouse
+
+# objects shared between games, which are not counted
+_shared_types = (type, types.ModuleType, types.FunctionType,
+    types.BuiltinFunctionType, types.MethodType, bool, type(None))
+
+
+def _is_shared(obj):
+    if isinstance(obj, _shared_types):
+        return True
+    # small ints and one-character strings are cached by the interpreter
+    if type(obj) is int and -5 <= obj <= 256:
+        return True
+    if type(obj) is str and len(obj) <= 1:
+        return True
+    return False
+
+
+def deep_size(obj):
+    """ Add up the sizes of all the objects reachable from obj. """
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or _is_shared(o):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        if hasattr(o, '__dict__'):
+            stack.append(o.__dict__)
+        for cls in type(o).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if hasattr(o, name):
+                    stack.append(getattr(o, name))
+    return total
+
+
+def play_game(pos, plies, rng):
+    """ Play random moves, recording the things a played game does. """
+    pos.detect_check()
+    clock = 180.0
+    while pos.ply < plies:
+        moves = pos.generate_legal_moves()
+        if not moves:
+            break
+        mv = rng.choice(moves)
+        mv.to_san()
+        pos.make_move(mv)
+        pos.detect_check()
+        mv.add_san_decorator()
+        mv.to_verbose_alg()
+        mv.time = rng.uniform(0.1, 5.0)
+        clock -= mv.time
+        if hasattr(pos.history, 'set_clock_time'):
+            pos.history.set_clock_time(pos.ply - 1, clock)
+        else:
+            mv.clock_time = clock
+    return pos
+
+
+def main():
+    plies = int(sys.argv[1]) if len(sys.argv) > 1 else 160
+    count = 20
+    for mod in [chess, crazyhouse]:
+        rng = random.Random(2010)
+        name = mod.__name__.split('.')[-1]
+        total = 0
+        total_plies = 0
+        rep_time = 0.0
+        for i in range(count):
+            pos = play_game(mod.initial_pos.clone(), plies, rng)
+            total += deep_size(pos)
+            total_plies += pos.ply
+            start = time.time()
+            for j in range(1000):
+                pos.is_draw_repetition(WHITE)
+            rep_time += time.time() - start
+        print('%-10s %6.1f plies %8.0f bytes per game %6.0f bytes per ply '
+            '%6.2f us per repetition check' % (name,
+            float(total_plies) / count, float(total) / count,
+            float(total) / total_plies, 1e6 * rep_time / count / 1000))
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
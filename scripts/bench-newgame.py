@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Time setting up the starting position of a new game in each
+variant, by deep-copying the template position as was done before, by
+cloning it, and for chess960 by parsing the FEN of a random starting
+position.  Run this script from the top of the source tree."""
+
+import sys
+import time
+import copy
+import random
+
+sys.path.insert(0, 'src/')
+from variant import chess, chess960, crazyhouse, bughouse, suicide
+
+
+def bench(name, f, count):
+    start = time.time()
+    for i in xrange(count):
+        f()
+    elapsed = time.time() - start
+    print('%-24s %8.1f us per game %10.0f games/sec' % (name,
+        1e6 * elapsed / count, count / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for mod in [chess, crazyhouse, bughouse, suicide]:
+        pos = mod.initial_pos
+        name = mod.__name__.split('.')[-1]
+        bench('%s deepcopy' % name, lambda: copy.deepcopy(pos), count)
+        bench('%s clone' % name, pos.clone, count)
+
+    idns = [random.randint(0, 959) for i in xrange(count)]
+    it = iter(idns)
+    bench('chess960 parse', lambda: chess960.Position(
+        chess960.fen_from_idn(next(it))), count)
+    # the first game with each idn parses its position
+    it = iter(idns)
+    bench('chess960 clone', lambda: chess960.initial_pos_from_idn(next(it)),
+        count)
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
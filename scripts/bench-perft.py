@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Run perft (count the nodes of the legal move tree to a given depth)
+on standard test positions for each variant, checking the counts and
+timing the move generator.  Give a variant name to test only that
+variant, and a maximum depth to go deeper or shallower than the
+default.  Run this script from the top of the source tree."""
+
+import sys
+import time
+
+sys.path.insert(0, 'src/')
+from variant.base_variant import perft
+from variant import chess, chess960, crazyhouse, bughouse, suicide
+
+INITIAL_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+KIWIPETE_FEN = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+# For each variant, a list of (fen, pieces in holding, node counts at
+# depths 1, 2, ...).  By default each position is searched as deep as
+# its counts go, which keeps a full run to a minute or two.
+#
+# The chess and chess960 counts are the published ones; chess960
+# castling rights are given as KQkq, meaning the outermost rooks,
+# instead of as Shredder-FEN rook files.  The suicide counts from the
+# initial position match those published for antichess, whose rules
+# only differ later in the game.  The other crazyhouse, bughouse and
+# suicide counts come from this generator, checked against the move
+# parsers.  Holdings can only be given for bughouse, since the FEN
+# parsers do not read them.
+POSITIONS = {
+    'chess': [
+        (INITIAL_FEN, '', [20, 400, 8902, 197281]),
+        (KIWIPETE_FEN, '', [48, 2039, 97862]),
+        ('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', '',
+            [14, 191, 2812, 43238]),
+        ('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+            '', [6, 264, 9467]),
+        ('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', '',
+            [44, 1486, 62379]),
+    ],
+    'chess960': [
+        ('bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w KQkq - 2 9',
+            '', [21, 528, 12189]),
+        ('2nnrbkr/p1qppppp/8/1ppb4/6PP/3PP3/PPP2P2/BQNNRBKR w KQkq - 1 9',
+            '', [21, 807, 18002]),
+        ('qbbnnrkr/2pp2pp/p7/1p2pp2/8/P3PP2/1PPP1KPP/QBBNNR1R w kq - 0 9',
+            '', [22, 593, 13440]),
+        ('1nbbnrkr/p1p1ppp1/3p4/1p3P1p/3Pq2P/8/PPP1P1P1/QNBBNRKR w KQkq - 0 9',
+            '', [28, 1120, 31058]),
+    ],
+    'crazyhouse': [
+        (INITIAL_FEN, '', [20, 400, 8902]),
+        (KIWIPETE_FEN, '', [48, 2039, 106456]),
+    ],
+    'bughouse': [
+        (INITIAL_FEN, 'Pn', [52, 2662]),
+        (KIWIPETE_FEN, 'Qr', [80, 5585]),
+    ],
+    'suicide': [
+        ('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1', '',
+            [20, 400, 8067, 153299]),
+        ('4k3/1P6/8/3pP3/8/8/6p1/4K3 w - d6 0 1', '',
+            [12, 125, 1125, 11441]),
+    ],
+}
+
+
+def make_pos(name, fen, holding):
+    if name == 'chess':
+        pos = chess.Position(fen)
+    elif name == 'chess960':
+        pos = chess960.Position(fen)
+    elif name == 'crazyhouse':
+        pos = crazyhouse.Position(fen)
+    elif name == 'bughouse':
+        # captured pieces are passed to the partner's board
+        pos = bughouse.Position(fen)
+        pos.bug_link = bughouse.Position(INITIAL_FEN)
+        pos.bug_link.bug_link = pos
+        for pc in holding:
+            pos.add_to_holding(pc, True)
+    elif name == 'suicide':
+        pos = suicide.Position(fen)
+    pos.detect_check()
+    return pos
+
+
+def main():
+    names = ['chess', 'chess960', 'crazyhouse', 'bughouse', 'suicide']
+    max_depth = None
+    for arg in sys.argv[1:]:
+        if arg.isdigit():
+            max_depth = int(arg)
+        else:
+            names = [arg]
+
+    failed = False
+    for name in names:
+        for (fen, holding, counts) in POSITIONS[name]:
+            pos = make_pos(name, fen, holding)
+            print('%s %s%s' % (name, fen,
+                ' [%s]' % holding if holding else ''))
+            for depth in range(1, (max_depth or len(counts)) + 1):
+                start = time.time()
+                nodes = perft(pos, depth)
+                elapsed = time.time() - start
+                if depth <= len(counts):
+                    expected = counts[depth - 1]
+                    ok = 'ok' if nodes == expected else (
+                        'WRONG, expected %d' % expected)
+                    if nodes != expected:
+                        failed = True
+                else:
+                    ok = 'unchecked'
+                print('  depth %d %10d nodes %8.2fs %8.0f nodes/sec  %s' % (
+                    depth, nodes, elapsed, nodes / max(elapsed, 1e-6), ok))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
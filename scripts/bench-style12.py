@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Time rendering the style12 boards sent to the players and observers
+of a game after each move, either rendering each board from scratch or
+sharing the parts that are the same for everyone.  Give the number of
+observers as an argument.  Run this script from the top of the source
+tree."""
+
+import sys
+import time
+import random
+
+sys.path.insert(0, 'src/')
+from game_constants import PLAYED
+from variant import chess
+
+
+class FakeSession(object):
+    def __init__(self, ms):
+        self.ivars = {'ms': ms}
+
+
+class FakeUser(object):
+    def __init__(self, name):
+        self.name = name
+        self.session = FakeSession(random.random() < 0.8)
+        self.vars_ = {'flip': random.random() < 0.1}
+
+
+class FakeClock(object):
+    is_ticking = True
+
+    def get_white_time(self):
+        return 123.456
+
+    def get_black_time(self):
+        return 98.765
+
+
+class FakeGame(object):
+    """ The attributes of a game that style12 boards refer to. """
+    def __init__(self, observers):
+        self.gtype = PLAYED
+        self.number = 17
+        self.white = FakeUser('WhitePlayer')
+        self.black = FakeUser('BlackPlayer')
+        self.players = set([self.white, self.black])
+        self.observers = set([FakeUser('Observer%d' % i)
+            for i in range(observers)])
+        self.white_time = 3
+        self.inc = 0
+        self.clock = FakeClock()
+
+
+def send_boards(game, variant, shared):
+    """ Like Game.send_boards(). """
+    for u in game.players | game.observers:
+        if not shared:
+            variant._style12_key = None
+        variant.to_style12(u)
+
+
+def main():
+    observers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    game = FakeGame(observers)
+    variant = chess.Chess(game)
+    pos = variant.pos
+    pos.detect_check()
+    rng = random.Random(2010)
+    plies = 60
+    elapsed = {False: 0.0, True: 0.0}
+    for i in range(plies):
+        mv = rng.choice(pos.generate_legal_moves())
+        mv.time = rng.uniform(0.1, 5.0)
+        variant.do_move(mv)
+        for shared in [False, True]:
+            start = time.time()
+            send_boards(game, variant, shared)
+            elapsed[shared] += time.time() - start
+
+    count = plies * (observers + 2)
+    print('%d players and observers' % (observers + 2))
+    print('separate  %6.2f us per board' % (1e6 * elapsed[False] / count))
+    print('shared    %6.2f us per board' % (1e6 * elapsed[True] / count))
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
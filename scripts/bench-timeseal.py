@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compare the speed of the in-process timeseal and zipseal decoders
+with the external decoder programs, in lines per second.  The decoders
+must be compiled first (see README); run this script from the top of
+the source tree."""
+
+import sys
+import time
+import random
+
+sys.path.insert(0, 'src/')
+import timeseal
+
+COMMANDS = ['e4', 'Nf3', 'exf8=Q+', 'tell 1 hello everyone', 'finger',
+    'say good game', 'seek 1 0 r', 'match admin 3 0 white', 'who',
+    'kibitz what a move!', 'observe 12', '\x02\x39']
+
+
+def timeseal_encode(s, t):
+    """A port of crypt() from timeseal/openseal.c."""
+    s = list('%s\x18%d\x19' % (s, t))
+    while len(s) % 12:
+        s.append('1')
+    for n in range(0, len(s), 12):
+        for (a, b) in [(0, 11), (2, 9), (4, 7)]:
+            s[n + a], s[n + b] = s[n + b], s[n + a]
+    key = timeseal._timeseal_key
+    for n in range(len(s)):
+        s[n] = chr((((ord(s[n]) | 0x80) ^ ord(key[n % 50])) - 32) & 0xff)
+    return ''.join(s) + '\x80'
+
+
+def zipseal_encode(s, t):
+    """A port of crypt() from timeseal/zipseal.c."""
+    return '%s\x18%x' % (s, t)
+
+
+def bench(name, f, lines):
+    start = time.time()
+    for line in lines:
+        f(line)
+    elapsed = time.time() - start
+    print('%-24s %10.0f lines/sec' % (name, len(lines) / elapsed))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    ts_lines = []
+    zs_lines = []
+    for i in range(count):
+        cmd = random.choice(COMMANDS)
+        t = random.randint(1, 9999999)
+        ts_lines.append(timeseal_encode(cmd, t))
+        zs_lines.append(zipseal_encode(cmd, t))
+
+    sp = timeseal.Timeseal(inprocess=False)
+    ip = timeseal.Timeseal(inprocess=True)
+
+    # make sure both paths agree before timing them
+    for line in ts_lines[0:1000]:
+        assert(sp.decode_timeseal(line) == ip.decode_timeseal(line))
+    for line in zs_lines[0:1000]:
+        assert(sp.decode_zipseal(line) == ip.decode_zipseal(line))
+
+    bench('timeseal subprocess', sp.decode_timeseal, ts_lines)
+    bench('timeseal in-process', ip.decode_timeseal, ts_lines)
+    bench('zipseal subprocess', sp.decode_zipseal, zs_lines)
+    bench('zipseal in-process', ip.decode_zipseal, zs_lines)
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
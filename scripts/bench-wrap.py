@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Compare the word wrapping in src/wrap.py with wrapping every line
+using textwrap.TextWrapper.  The input is a file with one message per
+line, such as channel tells taken from a server log; by default,
+messages are made up from words in the help files.  Run this script
+from the top of the source tree."""
+
+import sys
+import time
+import glob
+import random
+import textwrap
+
+sys.path.insert(0, 'src/')
+import wrap
+
+WIDTH = 79
+
+
+def textwrap_wrap(wrapper, data):
+    """The old way of wrapping, from TelnetTransport.write()."""
+    udata = data.decode('utf-8')
+    wrapped_lines = [wrapper.fill(line)
+        for line in udata.splitlines(True)]
+    return ''.join(wrapped_lines).encode('utf-8')
+
+
+def make_messages(count):
+    words = ''.join(open(f).read() for f in glob.glob('help/*')).split()
+    names = ['GuestABCD(U)', 'admin(*)', 'Kasparov(GM)', 'seberg']
+    messages = []
+    for i in range(count):
+        # most channel tells are short
+        nwords = int(random.expovariate(1.0 / 8)) + 1
+        messages.append('\n%s(%d): %s\n' % (random.choice(names),
+            random.choice([1, 4, 53]),
+            ' '.join(random.choice(words) for j in range(nwords))))
+    return messages
+
+
+def bench(name, f, messages):
+    start = time.time()
+    for msg in messages:
+        f(msg)
+    elapsed = time.time() - start
+    print('%-12s %10.0f messages/sec' % (name, len(messages) / elapsed))
+
+
+def main():
+    if len(sys.argv) > 1:
+        messages = ['\n%s\n' % line.rstrip('\n')
+            for line in open(sys.argv[1])]
+    else:
+        messages = make_messages(50000)
+
+    old = textwrap.TextWrapper(width=WIDTH, expand_tabs=True,
+        replace_whitespace=False, drop_whitespace=False,
+        break_long_words=True, subsequent_indent=r'\   ')
+    new = wrap.get_wrapper(WIDTH)
+
+    for msg in messages:
+        assert(textwrap_wrap(old, msg) == new.wrap(msg))
+
+    long_count = len([msg for msg in messages if not new.fits(msg)])
+    print('%d messages, %d needing wrapping' % (len(messages), long_count))
+    bench('textwrap', lambda msg: textwrap_wrap(old, msg), messages)
+    bench('wrap', new.wrap, messages)
+
+if __name__ == '__main__':
+    main()
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
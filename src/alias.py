@@ -187,7 +187,8 @@ if 1:
     alias_re = re.compile(r'^(\S+)(?:\s+(.*))?$')
     space_re = re.compile(r'\s+')
     def expand(s, syslist, userlist, user):
-        """ Expand system and user aliases in a given command. """
+        """ Expand system and user aliases in a given command.  The alias
+        lists map names to aliases compiled by compile_alias(). """
         m = punct_re.match(s)
         if m:
             word = m.group(1)
@@ -205,92 +206,145 @@ if 1:
                 s = _expand_params(syslist[word], rest, user)
         return s
 
-    def _expand_params(alias_str, rest, user):
+    def _expand_params(compiled, rest, user):
         # unlike lasker, but like FICS, there is no implicit
         # $@ after simple aliases
-        assert(alias_str is not None)
+        (ops, needs_split) = compiled
         if rest is None:
             rest = ''
-        rest_split = None
-        ret = []
+        if needs_split:
+            rest_split = space_re.split(rest)
+        else:
+            rest_split = None
+        return ''.join([op if isinstance(op, basestring)
+            else op(rest, rest_split, user) for op in ops])
+
+    def _rest(rest, rest_split, user):
+        return rest
+
+    def _words_before(d):
+        # $-n
+        return lambda rest, rest_split, user: ' '.join(rest_split[:d])
+
+    def _words_from(d):
+        # $n-
+        return lambda rest, rest_split, user: ' '.join(rest_split[d:])
+
+    def _word(d):
+        # $n
+        def f(rest, rest_split, user):
+            try:
+                return rest_split[d]
+            except IndexError:
+                # not fatal since parameters can be optional
+                return ''
+        return f
+
+    def _my_name(rest, rest_split, user):
+        return user.name
+
+    def _say_to_name(rest, rest_split, user):
+        say_to = user.session.say_to
+        if not say_to:
+            raise AliasError(_("I don't know whom to say that to.\n"))
+        elif len(say_to) > 1:
+            raise AliasError(_('You cannot use $o in an alias after a bughouse game.\n'))
+        else:
+            # note the user may be offline, but we can still
+            # use the name in an alias
+            return list(say_to)[0].name
+
+    def _partner_name(rest, rest_split, user):
+        p = user.session.partner
+        if not p:
+            raise AliasError(_('You do not have a partner at present.\n'))
+        return p.name
+
+    def _last_tell_name(rest, rest_split, user):
+        if user.session.last_tell_user is None:
+            raise AliasError(_('No previous tell.\n'))
+        return user.session.last_tell_user.name
+
+    def _last_tell_ch(rest, rest_split, user):
+        if user.session.last_tell_ch is None:
+            raise AliasError(_('No previous channel.\n'))
+        return '%s' % user.session.last_tell_ch.id_
+
+    def _bad_param(rest, rest_split, user):
+        raise AliasError()
+
+    _simple_params = {
+        '@': _rest,
+        'm': _my_name,
+        'o': _say_to_name,
+        'p': _partner_name,
+        '.': _last_tell_name,
+        ',': _last_tell_ch,
+        # from help new_features: $_ in an alias goes to -,
+        # this allows handling of '$2-' vs '$2'-
+        '_': '-',
+        '$': '$',
+    }
+
+    def compile_alias(alias_str):
+        """ Convert an alias into a list of literal strings and functions
+        that fill in the parameters, so that expanding the alias is
+        just a join.  Returns (ops, needs_split), where needs_split is
+        true if the alias refers to words of the arguments.  Errors are
+        raised when the alias is expanded, not when it is compiled. """
+        assert(alias_str is not None)
+        ops = []
+        literal = []
+        needs_split = False
         i = 0
         aliaslen = len(alias_str)
         while i < aliaslen:
-            if alias_str[i] == '$':
+            if alias_str[i] != '$':
+                literal.append(alias_str[i])
                 i += 1
-                # raises an error if beyond the end
-                try:
-                    char = alias_str[i]
-                except IndexError:
-                    raise AliasError
-                if char == '@':
-                    if rest is not None:
-                        ret.append(rest)
+                continue
+            i += 1
+            op = None
+            if i >= aliaslen:
+                op = _bad_param
+            else:
+                char = alias_str[i]
+                if char in _simple_params:
+                    op = _simple_params[char]
                 elif char == '-':
                     if i < aliaslen - 1 and alias_str[i + 1].isdigit():
-                        # $-n
                         i += 1
-                        char = alias_str[i]
-                        if rest_split is None:
-                            rest_split = space_re.split(rest)
-                        d = int(char, 10)
-                        ret.append(' '.join(rest_split[:d]))
+                        op = _words_before(int(alias_str[i], 10))
+                        needs_split = True
                     else:
-                        ret.append('-')
+                        op = '-'
                 elif char.isdigit():
-                    if rest_split is None:
-                        rest_split = space_re.split(rest)
                     d = int(char, 10) - 1
                     if i < aliaslen - 1 and alias_str[i + 1] == '-':
-                        # $n-
                         i += 1
-                        ret.append(' '.join(rest_split[d:]))
-                    else:
-                        # $n
-                        try:
-                            ret.append(rest_split[d])
-                        except IndexError:
-                            # not fatal since parameters can be optional
-                            pass
-                elif char == 'm':
-                    ret.append(user.name)
-                elif char == 'o':
-                    say_to = user.session.say_to
-                    if not say_to:
-                        raise AliasError(_("I don't know whom to say that to.\n"))
-                    elif len(say_to) > 1:
-                        raise AliasError(_('You cannot use $o in an alias after a bughouse game.\n'))
-                    else:
-                        # note the user may be offline, but we can still
-                        # use the name in an alias
-                        ret.append(list(say_to)[0].name)
-                elif char == 'p':
-                    p = user.session.partner
-                    if not p:
-                        raise AliasError(_('You do not have a partner at present.\n'))
+                        op = _words_from(d)
                     else:
-                        ret.append(p.name)
-                elif char == '.':
-                    if user.session.last_tell_user is None:
-                        raise AliasError(_('No previous tell.\n'))
-                    ret.append(user.session.last_tell_user.name)
-                elif char == ',':
-                    if user.session.last_tell_ch is None:
-                        raise AliasError(_('No previous channel.\n'))
-                    ret.append('%s' % user.session.last_tell_ch.id_)
-                elif char == '_':
-                    # from help new_features: $_ in an alias goes to -,
-                    # this allows handling of '$2-' vs '$2'-
-                    ret.append('-')
-                elif char == '$':
-                    ret.append('$')
+                        op = _word(d)
+                    needs_split = True
                 else:
                     # unrecognized $ variable
-                    raise AliasError()
+                    op = _bad_param
+            if isinstance(op, basestring):
+                literal.append(op)
             else:
-                ret.append(alias_str[i])
+                if literal:
+                    ops.append(''.join(literal))
+                    literal = []
+                ops.append(op)
+                if op is _bad_param:
+                    # nothing after this is reached
+                    return (ops, needs_split)
             i += 1
+        if literal:
+            ops.append(''.join(literal))
+        return (ops, needs_split)
 
-        return ''.join(ret)
+    system_compiled = dict((name, compile_alias(val))
+        for (name, val) in system.iteritems())
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
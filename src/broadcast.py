@@ -0,0 +1,94 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Sending the same message to many users.
+
+Instead of wrapping, escaping and formatting a message separately
+for every recipient, a message is rendered once for each distinct
+output profile (language, wrap width, compatibility port and prompt),
+and the same bytes are queued on every transport in that profile.
+Each function returns the number of users the message was sent to.
+Low-priority messages, such as channel tells and shouts, may be
+dropped for users who are not reading their output. """
+
+import global_
+import config
+
+
+def _get_prompt(u):
+    if u.session.ivars['defprompt']:
+        return config.prompt
+    else:
+        return u.vars_['prompt']
+
+
+def _send(users, s, args, wrap, prompt, low_priority, fallback):
+    count = 0
+    cache = {}
+    curuser = global_.curuser
+    for u in users:
+        if not u.is_online:
+            print("warning: tried to write to offline user %s" % u)
+            continue
+        conn = u.session.conn
+        if u == curuser or conn.buffer_output:
+            # the user whose command is being handled gets the message
+            # without a prompt, and block mode output must be
+            # collected by the connection
+            fallback(u)
+            count += 1
+            continue
+        transport = conn.transport
+        prompt_str = _get_prompt(u) if prompt else None
+        lang = u.vars_['lang'] if args is not None else None
+        key = (transport.render_key(wrap), prompt_str, lang)
+        try:
+            data = cache[key]
+        except KeyError:
+            if args is not None:
+                msg = global_.langs[lang].gettext(s) % args
+            else:
+                msg = s
+            data = transport.render(msg, wrap)
+            if prompt_str is not None:
+                data += transport.render(prompt_str, wrap=False)
+            cache[key] = data
+        transport.write_rendered(data, low_priority)
+        count += 1
+    return count
+
+
+def write(users, s, low_priority=False):
+    """ Like calling u.write(s) for each user. """
+    return _send(users, s, None, True, True, low_priority,
+        lambda u: u.write(s))
+
+
+def write_(users, s, args={}, low_priority=False):
+    """ Like calling u.write_(s, args) for each user, localizing
+    the message for each language. """
+    return _send(users, s, args, True, True, low_priority,
+        lambda u: u.write_(s, args))
+
+
+def write_nowrap(users, s, prompt=True, low_priority=False):
+    """ Like calling u.write_nowrap(s, prompt) for each user. """
+    return _send(users, s, None, False, prompt, low_priority,
+        lambda u: u.write_nowrap(s, prompt=prompt))
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
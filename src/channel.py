@@ -24,6 +24,7 @@ import admin
 import db
 import global_
 import config
+import broadcast
 
 USER_CHANNEL_START = 1024
 
@@ -55,23 +56,15 @@ class Channel(object):
             msg = '[%s] %s' % (user.vars_['interface'], msg)
         msg = '\n%s(%d): %s\n' % (user.get_display_name(), self.id_, msg)
         is_guest = user.is_guest
-        count = 0
         name = user.name
-        for u in self.online:
-            if is_guest and not u.vars_['ctell']:
-                continue
-            if not u.hears_channels():
-                continue
-            if not name in u.censor:
-                u.write(msg)
-                count += 1
-        return count
+        recipients = [u for u in self.online
+            if (not is_guest or u.vars_['ctell']) and u.hears_channels()
+                and name not in u.censor]
+        return broadcast.write(recipients, msg, low_priority=True)
 
     def qtell(self, msg):
-        for u in self.online:
-            if not u.hears_channels():
-                continue
-            u.write(msg)
+        broadcast.write([u for u in self.online if u.hears_channels()], msg,
+            low_priority=True)
 
     def log_on(self, user):
         self.online.add(user)
@@ -16,19 +16,23 @@
 # along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from twisted.internet import defer
-
-import time
+from twisted.internet import defer, reactor
 
 import time_format
 
-from game_constants import WHITE, BLACK
+from game_constants import WHITE, BLACK, opp
 
 clock_names = {}
 
 
 class Clock(object):
+    # While the clock is ticking, a reactor call is scheduled for the
+    # moment the time of the side to move runs out, so that the player
+    # can be flagged then if the opponent has autoflag set.
+    _deadline = None
+
     def __init__(self, g, white_time, black_time):
+        self.game = g
         self._white_time = white_time
         self._black_time = black_time
         self.inc = g.inc
@@ -38,10 +42,62 @@ class Clock(object):
     def start(self, side):
         self.is_ticking = True
         self._side_ticking = side
-        self.started_time = time.time()
+        self.started_time = reactor.seconds()
+        self._arm()
 
     def stop(self):
         self.is_ticking = False
+        self._disarm()
+
+    def _disarm(self):
+        if self._deadline is not None:
+            if self._deadline.active():
+                self._deadline.cancel()
+            self._deadline = None
+
+    def _arm(self):
+        """ Schedule the flag check for the side to move, replacing
+        any earlier one. """
+        self._disarm()
+        if self.is_ticking:
+            if self._side_ticking == WHITE:
+                remaining = self.get_white_time()
+            else:
+                remaining = self.get_black_time()
+            self._deadline = reactor.callLater(max(remaining, 0),
+                self._deadline_reached)
+
+    def _deadline_reached(self):
+        self._deadline = None
+        self.check_autoflag()
+
+    def check_autoflag(self):
+        """ Flag the side to move if its time has run out and the
+        opponent has autoflag set.  This is called when the deadline
+        is reached, and when a player turns on autoflag, since the
+        deadline may have passed while it was off. """
+        if not self.is_ticking:
+            return
+        g = self.game
+        if not g.is_active:
+            return
+        side = self._side_ticking
+        if side == WHITE:
+            remaining = self.get_white_time()
+        else:
+            remaining = self.get_black_time()
+        if remaining > 0:
+            # rounding; try again when the time is really up
+            self._arm()
+            return
+        if g.get_side_user(opp(side)).vars_['autoflag']:
+            # TODO: send auto-flagging message a la original fics.
+            d = self.check_flag(g, side)
+            d.addErrback(self._flag_failed)
+
+    def _flag_failed(self, failure):
+        print('exception checking flag in game %d' % self.game.number)
+        failure.printTraceback()
 
     def _time_to_str(self, secs):
         if secs < 0:
@@ -63,6 +119,7 @@ class Clock(object):
             self._white_time += secs
         else:
             self._black_time += secs
+        self._arm()
 
     def got_move(self, side, ply, elapsed, minmovetime):
         """ Stop the clock, and record the time remaining for the player
@@ -73,7 +130,7 @@ class Clock(object):
         assert(self._side_ticking == side)
 
         self.stop()
-        self.real_elapsed = time.time() - self.started_time
+        self.real_elapsed = reactor.seconds() - self.started_time
         if elapsed is None:
             # no timeseal, so use our own timer
             elapsed = self.real_elapsed
@@ -91,20 +148,22 @@ class Clock(object):
     def get_white_time(self):
         ret = self._white_time
         if self.is_ticking and self._side_ticking == WHITE:
-            ret -= time.time() - self.started_time
+            ret -= reactor.seconds() - self.started_time
         return ret
 
     def get_black_time(self):
         ret = self._black_time
         if self.is_ticking and self._side_ticking == BLACK:
-            ret -= time.time() - self.started_time
+            ret -= reactor.seconds() - self.started_time
         return ret
 
     def set_white_time(self, white_time):
         self._white_time = white_time
+        self._arm()
 
     def set_black_time(self, black_time):
         self._black_time = black_time
+        self._arm()
 
     @defer.inlineCallbacks
     def check_flag(self, game, side):
@@ -205,7 +264,6 @@ class OvertimeClock(Clock):
             if ply == 2 * self.overtime_move_num - 1:
                 self._white_time += self.overtime_bonus
         else:
-            self._white_time += elapsed
             if ply == 2 * self.overtime_move_num:
                 self._black_time += self.overtime_bonus
 
@@ -234,6 +292,9 @@ class UntimedClock(Clock):
     def check_flag(self, game, side):
         return False
 
+    def _arm(self):
+        pass
+
     def add_increment(self, side):
         pass
 clock_names['untimed'] = UntimedClock
@@ -32,6 +32,7 @@ import var
 import find_user
 import config
 import logger
+import timer
 
 from reload import reload
 from .command import Command, ics_command
@@ -591,6 +592,7 @@ class Asetidle(Command):
         if u:
             secs = 60 * args[1]
             u.session.last_command_time = time.time() - secs
+            timer.schedule_idle(u.session)
             conn.write(A_('Idle time for "%s" set to %d seconds.\n') %
                 (u.name, secs))
             u.write_("\n%s has set your idle time to %d seconds.\n",
@@ -21,6 +21,7 @@ import channel
 import global_
 import config
 import block_codes
+import parser_
 
 from twisted.internet import defer
 
@@ -42,6 +43,7 @@ class Command(object):
         self.name = name
         self.block_code = block_codes.__dict__["BLKCMD_%s" % name.upper()]
         self.param_str = param_str
+        self.parse_params = parser_.compile_param_str(param_str)
         self.admin_level = admin_level
         global_.admin_commands[name] = self
         if admin_level <= admin.Level.user:
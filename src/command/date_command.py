@@ -24,6 +24,7 @@ import config
 
 import time_format
 import server
+import telnet
 
 from .command import ics_command, Command
 
@@ -50,5 +51,12 @@ class Uptime(Command):
             % time.strftime("%a %b %e, %H:%M UTC %Y", time.gmtime(server.start_time)))
         conn.write(_("Up for: %s\n") % time_format.hms_words(time.time() -
             server.start_time))
+        if conn.user.is_admin():
+            stats = telnet.output_stats
+            conn.write(A_("Output: %(fragments)d writes sent as %(writes)d (%(saved)d saved)\n") %
+                {'fragments': stats['fragments'], 'writes': stats['writes'],
+                'saved': stats['fragments'] - stats['writes']})
+            conn.write(A_("Slow clients: %(dropped_bytes)d bytes dropped in %(dropped_writes)d writes, %(slow_disconnects)d disconnected\n") %
+                stats)
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
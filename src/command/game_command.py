@@ -23,10 +23,10 @@ from twisted.internet import defer
 
 import offer
 import game
-import block_codes
-import db
+import eco
 
 from .command import ics_command, Command
+from parser_ import BadCommandError
 from game_constants import opp, PLAYED
 
 
@@ -123,7 +123,6 @@ class Eco(Command, GameMixin):
     eco_pat = re.compile(r'[a-e][0-9][0-9][a-z]?')
     nic_pat = re.compile(r'[a-z][a-z]\.[0-9][0-9]')
 
-    @defer.inlineCallbacks
     def run(self, args, conn):
         g = None
         if args[1] is not None:
@@ -133,15 +132,14 @@ class Eco(Command, GameMixin):
                 if not self.eco_pat.match(args[1]):
                     conn.write(_("You haven't specified a valid ECO code.\n"))
                 else:
-                    rows = yield db.look_up_eco(args[1])
+                    rows = eco.look_up_eco(args[1])
             elif args[0] == 'n':
                 if not self.nic_pat.match(args[1]):
                     conn.write(_("You haven't specified a valid NIC code.\n"))
                 else:
-                    rows = yield db.look_up_nic(args[1])
+                    rows = eco.look_up_nic(args[1])
             else:
-                self.usage(conn)
-                defer.returnValue(block_codes.BLKCMD_ERROR_BADCOMMAND)
+                raise BadCommandError
             first = True
             for row in rows:
                 if not first:
@@ -163,10 +161,9 @@ class Eco(Command, GameMixin):
             g = self._game_param(args[0], conn)
 
         if g:
-            (ply, eco, long_) = yield g.get_eco()
-            (nicply, nic) = yield g.get_nic()
+            ((ply, eco_, long_), (nicply, nic)) = g.variant.get_opening()
             conn.write(_('Eco for game %d (%s vs. %s):\n') % (g.number, g.white_name, g.black_name))
-            conn.write(_(' ECO[%3d]: %s\n') % (ply, eco))
+            conn.write(_(' ECO[%3d]: %s\n') % (ply, eco_))
             conn.write(_(' NIC[%3d]: %s\n') % (nicply, nic))
             conn.write(_('LONG[%3d]: %s\n') % (ply, long_))
 
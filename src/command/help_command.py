@@ -24,7 +24,6 @@ from .command import ics_command, Command
 import global_
 import server
 
-import trie
 
 help_dir = 'help/'
 
@@ -55,21 +54,14 @@ class Help(Command):
             conn.write('Current command list:\n\n%s\n' % help_cmds)
             return
 
-        cmd = None
-        try:
-            cmd = cmds[args[0]]
-        except KeyError:
+        (cmd, matches) = cmds.lookup(args[0])
+        if matches:
+            conn.write(_("""Ambiguous command "%(cmd)s". Matches: %(matches)s\n""")
+                % {'cmd': args[0], 'matches':
+                    ' '.join([c.name for c in matches])})
+        elif not cmd:
             conn.write(_('There is no help available for "%s".\n')
                 % args[0])
-        except trie.NeedMore:
-            matches = cmds.all_children(args[0])
-            assert(len(matches) > 0)
-            if len(matches) == 1:
-                cmd = matches[0]
-            else:
-                conn.write(_("""Ambiguous command "%(cmd)s". Matches: %(matches)s\n""")
-                    % {'cmd': args[0], 'matches':
-                        ' '.join([c.name for c in matches])})
 
         if cmd:
             cmd = cmd.name
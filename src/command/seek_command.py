@@ -50,9 +50,8 @@ class Seek(Command):
             conn.write(e.args[0])
             return
 
-        # Check if the user has already posted the same seek.  It might be
-        # more efficient to do this check as part of seek.find_matching()
-        if s in global_.seeks.values():
+        # Check if the user has already posted the same seek.
+        if s in conn.user.session.seeks:
             conn.write(_('You already have an active seek with the same parameters.\n'))
             return
 
@@ -142,9 +141,6 @@ class Play(Command):
             except KeyError:
                 # no such seek
                 ad = None
-            else:
-                if ad.expired:
-                    ad = None
             if not ad:
                 conn.write(_('That seek is not available.\n'))
 
@@ -195,15 +191,14 @@ class Sought(Command):
     def run(self, args, conn):
         if args[0] is not None:
             if args[0] == 'all':
-                slist = [s for s in global_.seeks.values() if not s.expired]
+                slist = global_.seeks.values()
             else:
                 raise BadCommandError
         else:
-            slist = [s for s in global_.seeks.values() if not s.expired and
+            slist = [s for s in global_.seeks.values() if
                 not conn.user.censor_or_noplay(s.a) and
                 s.check_formula(conn.user) and s.meets_formula_for(conn.user)]
 
-        slist.sort(key=lambda s: s.num)
         count = 0
         for s in slist:
             conn.write('%s\n' % s)
@@ -20,6 +20,7 @@
 from .command import ics_command, Command, requires_registration
 
 import global_
+import broadcast
 
 
 @ics_command('shout', 'S')
@@ -35,16 +36,14 @@ class Shout(Command):
         if not conn.user.vars_['shout'] or conn.user.in_silence():
             conn.write(_("(Did not shout because you are not listening to shouts)\n"))
         else:
-            count = 0
             name = conn.user.name
             shouter = conn.user
             dname = conn.user.get_display_name()
             shout_str = "\n%s shouts: %s\n" % (dname, args[0])
-            for u in global_.online:
-                if u.vars_['shout'] and not u.in_silence() and u != shouter:
-                    if name not in u.censor:
-                        u.write_prompt(shout_str)
-                        count += 1
+            count = broadcast.write([u for u in global_.online
+                if u.vars_['shout'] and not u.in_silence() and u != shouter
+                    and name not in u.censor], shout_str,
+                low_priority=True)
             conn.write("%s shouts: %s\n" % (dname, args[0]))
             conn.write(ngettext("(shouted to %d player)\n", "(shouted to %d players)\n", count) % count)
 
@@ -62,16 +61,14 @@ class It(Command):
         if not conn.user.vars_['shout'] or conn.user.in_silence():
             conn.write(_("(Did not it-shout because you are not listening to shouts)\n"))
         else:
-            count = 0
             name = conn.user.name
             shouter = conn.user
             dname = conn.user.get_display_name()
             shout_str = "\n--> %s %s\n" % (dname, args[0])
-            for u in global_.online:
-                if u.vars_['shout'] and not u.in_silence() and u != shouter:
-                    if name not in u.censor:
-                        u.write_prompt(shout_str)
-                        count += 1
+            count = broadcast.write([u for u in global_.online
+                if u.vars_['shout'] and not u.in_silence() and u != shouter
+                    and name not in u.censor], shout_str,
+                low_priority=True)
             conn.write("--> %s %s\n" % (dname, args[0]))
             conn.write(ngettext("(it-shouted to %d player)\n", "(it-shouted to %d players)\n", count) % count)
 
@@ -90,16 +87,14 @@ class Cshout(Command):
         if not conn.user.vars_['cshout'] or conn.user.in_silence():
             conn.write(_("(Did not c-shout because you are not listening to c-shouts)\n"))
         else:
-            count = 0
             name = conn.user.name
             shouter = conn.user
             dname = conn.user.get_display_name()
             shout_str = "\n%s c-shouts: %s\n" % (dname, args[0])
-            for u in global_.online:
-                if u.vars_['cshout'] and not u.in_silence() and u != shouter:
-                    if name not in u.censor:
-                        u.write_prompt(shout_str)
-                        count += 1
+            count = broadcast.write([u for u in global_.online
+                if u.vars_['cshout'] and not u.in_silence() and u != shouter
+                    and name not in u.censor], shout_str,
+                low_priority=True)
             conn.write("%s c-shouts: %s\n" % (dname, args[0]))
             conn.write(ngettext("(c-shouted to %d player)\n", "(c-shouted to %d players)\n", count) % count)
 
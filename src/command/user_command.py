@@ -327,6 +327,7 @@ class Llogons(Command, LogMixin):
             limit = 200
 
         rows = yield db.get_log_all(limit)
+        rows = global_.user_log.merge(rows, limit)
         self._display_log(rows, conn)
 
 
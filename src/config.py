@@ -51,6 +51,24 @@ max_channels_owned = 8
 
 prompt = 'fics% '
 
+# decode timeseal and zipseal input in the server process, rather than
+# piping every line through the external decoder programs
+timeseal_inprocess = True
+
+# Huffman-compress zipseal output; the zipseal client must be compiled
+# with COMPRESS defined to understand it
+zipseal_compress = False
+
+# Limits, in bytes, on output held for a client that is not reading
+# it, beyond what Twisted buffers itself.  Above the high water mark,
+# channel tells and shouts are dropped until the held output falls
+# below the low water mark; only the latest board of each observed
+# game is kept.  A client with more held output than the disconnect
+# limit is disconnected; set it to None to never disconnect.
+output_high_water = 256 * 1024
+output_low_water = 64 * 1024
+output_disconnect_limit = 4 * 1024 * 1024
+
 assert(admin_reserve + maxguest <= maxplayer)
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -288,7 +288,6 @@ class Connection(basic.LineReceiver):
             self.user = None
         self.transport.loseConnection()
         if reason == 'quit':
-            #timeseal.print_stats()
             self.write(global_.server_message['logout'])
 
     def connectionLost(self, reason):
@@ -334,11 +333,11 @@ class Connection(basic.LineReceiver):
             self.transport.write(s)
 
     # TODO: perhaps merge with conn.write
-    def write_nowrap(self, s):
+    def write_nowrap(self, s, supersede=None):
         if self.buffer_output:
             self.output_buffer += s
         else:
-            self.transport.write(s, wrap=False)
+            self.transport.write(s, wrap=False, supersede=supersede)
 
     def log(self, s):
         # log to stdout
@@ -73,15 +73,68 @@ if 1:
             " FROM user WHERE user_id=%s", (user_id,))
         defer.returnValue(rows[0])
 
+    def user_get_init_state(user_id, vnames):
+        """ Load what is needed to create a registered user object:
+        channels, variables, formulas, notes and titles, in one
+        round trip to the database. """
+        def do(txn):
+            ret = {}
+            txn.execute(_channels_sql, (user_id,))
+            ret['channels'] = [r['channel_id'] for r in txn.fetchall()]
+            txn.execute(("SELECT %s" % ','.join(vnames)) +
+                " FROM user WHERE user_id=%s", (user_id,))
+            ret['vars'] = txn.fetchall()[0]
+            txn.execute(_formula_sql, (user_id,))
+            ret['formulas'] = txn.fetchall()
+            txn.execute(_notes_sql, (user_id,))
+            ret['notes'] = txn.fetchall()
+            txn.execute(_titles_sql, (user_id,))
+            ret['titles'] = txn.fetchall()
+            return ret
+        return adb.runInteraction(do)
+
+    def user_get_login_state(user_id, last_logout, set_first_login):
+        """ Load the rest of a registered user's state when the user
+        logs in, in one round trip to the database.  If set_first_login
+        is true, the first login time is also set to now. """
+        def do(txn):
+            ret = {}
+            for (key, sql) in [('notified', _notified_sql),
+                    ('notifiers', _notifiers_sql),
+                    ('gnotified', _gnotified_sql),
+                    ('gnotifiers', _gnotifiers_sql),
+                    ('censored', _censored_sql),
+                    ('noplayed', _noplayed_sql)]:
+                txn.execute(sql, (user_id,))
+                ret[key] = [r['user_name'] for r in txn.fetchall()]
+            txn.execute(_all_ratings_sql, (user_id,))
+            ret['ratings'] = txn.fetchall()
+            txn.execute(_history_sql, (user_id,))
+            ret['history'] = txn.fetchall()
+            txn.execute(_aliases_sql, (user_id,))
+            ret['aliases'] = txn.fetchall()
+            txn.execute(_news_since_sql, ('0', last_logout))
+            ret['news'] = txn.fetchall()
+            txn.execute(_message_count_sql, (user_id,))
+            ret['message_count'] = _message_count(txn.fetchall()[0])
+            if set_first_login:
+                txn.execute("""UPDATE user SET user_first_login=NOW()
+                    WHERE user_id=%s""", (user_id,))
+                txn.execute("""SELECT user_first_login FROM user
+                    WHERE user_id=%s""", (user_id,))
+                ret['first_login'] = txn.fetchall()[0]['user_first_login']
+            return ret
+        return adb.runInteraction(do)
+
     def user_set_var(user_id, name, val):
         up = """UPDATE user SET %s""" % name
         d = adb.runOperation(up + """=%s WHERE user_id=%s""",
             (val, user_id))
         return d
 
+    _formula_sql = """SELECT num,f FROM formula WHERE user_id=%s ORDER BY num ASC"""
     def user_get_formula(user_id):
-        return adb.runQuery("""SELECT num,f FROM formula WHERE user_id=%s ORDER BY num ASC""",
-            (user_id,))
+        return adb.runQuery(_formula_sql, (user_id,))
 
     def user_set_formula(user_id, name, val):
         # ON DUPLICATE KEY UPDATE is probably not very portable to
@@ -101,8 +154,9 @@ if 1:
         return d
 
     # notes
+    _notes_sql = """SELECT num,txt FROM note WHERE user_id=%s ORDER BY num ASC"""
     def user_get_notes(user_id):
-        return adb.runQuery("""SELECT num,txt FROM note WHERE user_id=%s ORDER BY num ASC""", (user_id,))
+        return adb.runQuery(_notes_sql, (user_id,))
 
     def user_set_note(user_id, name, val):
         num = int(name, 10)
@@ -148,9 +202,9 @@ if 1:
             d = adb.runInteraction(do_del)
         return d
 
+    _aliases_sql = """SELECT name,val FROM user_alias WHERE user_id=%s ORDER BY name ASC"""
     def user_get_aliases(user_id):
-        return adb.runQuery("""SELECT name,val FROM user_alias WHERE user_id=%s ORDER BY name ASC""",
-            (user_id,))
+        return adb.runQuery(_aliases_sql, (user_id,))
 
     def user_get_by_prefix(prefix, limit=8):
         d = adb.runQuery("""SELECT user_id,user_name,user_passwd,
@@ -209,26 +263,28 @@ if 1:
             SET user_total_time_online=user_total_time_online+%s
             WHERE user_id=%s""", (secs, uid))
 
-    @defer.inlineCallbacks
-    def user_log_add(user_name, login, ip):
-        """Add an entry to a user's log."""
-        # delete old log entry, if necessary
-        # XXX it would probably be more efficient to periodically
-        # delete extra entries
-        rows = yield adb.runQuery("""SELECT COUNT(*) AS c FROM user_log
-            WHERE log_who_name=%s""", (user_name,))
-        count = rows[0]['c']
-        if count >= 10:
-            #assert(count == 10)
-            limit = count - 9
-            yield adb.runOperation("""DELETE FROM user_log
-                WHERE log_who_name=%s ORDER BY log_when DESC LIMIT %s""",
-                    (user_name, limit))
-
-        which = 'login' if login else 'logout'
-        yield adb.runOperation("""INSERT INTO user_log
-            SET log_who_name=%s,log_which=%s,log_ip=%s,log_when=NOW()""",
-                (user_name, which, ip))
+    def user_log_add_many(entries):
+        """ Add log entries, given as (user_name, which, ip, when) tuples,
+        with a single INSERT. """
+        args = []
+        for e in entries:
+            args.extend(e)
+        return adb.runOperation("""INSERT INTO user_log
+            (log_who_name,log_which,log_ip,log_when) VALUES """ +
+            ','.join(['(%s,%s,%s,%s)'] * len(entries)), args)
+
+    def user_log_trim(user_names, keep):
+        """ Delete all but the newest entries in each given user's log. """
+        def do_trim(txn):
+            for user_name in user_names:
+                txn.execute("""SELECT COUNT(*) AS c FROM user_log
+                    WHERE log_who_name=%s""", (user_name,))
+                count = txn.fetchall()[0]['c']
+                if count > keep:
+                    txn.execute("""DELETE FROM user_log
+                        WHERE log_who_name=%s ORDER BY log_when ASC
+                        LIMIT %s""", (user_name, count - keep))
+        return adb.runInteraction(do_trim)
 
     def user_get_log(user_name):
         return adb.runQuery("""SELECT log_who_name,log_when,
@@ -457,10 +513,11 @@ if 1:
         defer.returnValue(rows)
 
     # channels
+    _channels_sql = """SELECT channel_id FROM channel_user
+            WHERE user_id=%s"""
     @defer.inlineCallbacks
     def user_get_channels(id_):
-        rows = yield adb.runQuery("""SELECT channel_id FROM channel_user
-            WHERE user_id=%s""", (id_,))
+        rows = yield adb.runQuery(_channels_sql, (id_,))
         defer.returnValue([r['channel_id'] for r in rows])
 
     def channel_new(chid, name):
@@ -561,10 +618,10 @@ if 1:
                 raise DeleteError()
         return adb.runInteraction(do_del)
 
+    _titles_sql = """SELECT title_name,title_flag,title_light FROM user_title LEFT JOIN title USING (title_id) WHERE user_id=%s ORDER BY title_id ASC"""
     def user_get_titles(user_id):
         """Get a list of a player's titles, such as TM, admin, or abuser."""
-        return adb.runQuery("""SELECT title_name,title_flag,title_light FROM user_title LEFT JOIN title USING (title_id) WHERE user_id=%s ORDER BY title_id ASC""",
-            (user_id,))
+        return adb.runQuery(_titles_sql, (user_id,))
 
     def toggle_title_light(user_id, title_id):
         """Toggle the light that appears after a player's
@@ -591,13 +648,13 @@ if 1:
                 raise DeleteError()
         return adb.runInteraction(do_del)
 
+    _notified_sql = """SELECT user_name FROM user LEFT JOIN user_notify ON (user.user_id=user_notify.notified) WHERE notifier=%s"""
     def user_get_notified(user_id):
-        return adb.runQuery("""SELECT user_name FROM user LEFT JOIN user_notify ON (user.user_id=user_notify.notified) WHERE notifier=%s""",
-            (user_id,))
+        return adb.runQuery(_notified_sql, (user_id,))
 
+    _notifiers_sql = """SELECT user_name FROM user LEFT JOIN user_notify ON (user.user_id=user_notify.notifier) WHERE notified=%s"""
     def user_get_notifiers(user_id):
-        return adb.runQuery("""SELECT user_name FROM user LEFT JOIN user_notify ON (user.user_id=user_notify.notifier) WHERE notified=%s""",
-            (user_id,))
+        return adb.runQuery(_notifiers_sql, (user_id,))
 
     # game notifications
     @defer.inlineCallbacks
@@ -616,15 +673,17 @@ if 1:
                 raise DeleteError()
         return adb.runInteraction(do_del)
 
-    def user_get_gnotified(user_id):
-        return adb.runQuery("""SELECT user_name FROM user
+    _gnotified_sql = """SELECT user_name FROM user
             LEFT JOIN user_gnotify ON (user.user_id=user_gnotify.gnotified)
-            WHERE gnotifier=%s""", (user_id,))
+            WHERE gnotifier=%s"""
+    def user_get_gnotified(user_id):
+        return adb.runQuery(_gnotified_sql, (user_id,))
 
-    def user_get_gnotifiers(user_id):
-        return adb.runQuery("""SELECT user_name FROM user
+    _gnotifiers_sql = """SELECT user_name FROM user
             LEFT JOIN user_gnotify ON (user.user_id=user_gnotify.gnotifier)
-            WHERE gnotified=%s""", (user_id,))
+            WHERE gnotified=%s"""
+    def user_get_gnotifiers(user_id):
+        return adb.runQuery(_gnotifiers_sql, (user_id,))
 
     # censor list
     def user_add_censor(censorer, censored):
@@ -643,9 +702,9 @@ if 1:
                 raise DeleteError()
         return adb.runInteraction(do_del)
 
+    _censored_sql = """SELECT user_name FROM user LEFT JOIN censor ON (user.user_id=censor.censored) WHERE censorer=%s"""
     def user_get_censored(user_id):
-        return adb.runQuery("""SELECT user_name FROM user LEFT JOIN censor ON (user.user_id=censor.censored) WHERE censorer=%s""",
-            (user_id,))
+        return adb.runQuery(_censored_sql, (user_id,))
 
     # noplay list
     @defer.inlineCallbacks
@@ -663,8 +722,9 @@ if 1:
                 raise DeleteError()
         return adb.runInteraction(do_del)
 
+    _noplayed_sql = """SELECT user_name FROM user LEFT JOIN noplay ON (user.user_id=noplay.noplayed) WHERE noplayer=%s"""
     def user_get_noplayed(user_id):
-        return adb.runQuery("""SELECT user_name FROM user LEFT JOIN noplay ON (user.user_id=noplay.noplayed) WHERE noplayer=%s""", (user_id,))
+        return adb.runQuery(_noplayed_sql, (user_id,))
 
     def title_get_all():
         return adb.runQuery("""SELECT title_id,title_name,title_descr,title_flag,title_public FROM title""")
@@ -676,59 +736,60 @@ if 1:
         ret = [r['user_name'] for r in rows]
         defer.returnValue(ret)
 
-    @defer.inlineCallbacks
-    def get_eco(hash_):
-        rows = yield adb.runQuery("""SELECT eco,long_ FROM eco WHERE hash=%s""",
-            (hash_,))
-        ret = rows[0] if rows else None
-        defer.returnValue(ret)
-
-    @defer.inlineCallbacks
-    def get_nic(hash_):
-        rows = yield adb.runQuery("""SELECT nic FROM nic WHERE hash=%s""",
-            (hash_,))
-        ret = rows[0] if rows else None
-        defer.returnValue(ret)
-
-    def look_up_eco(eco):
-        if len(eco) == 3:
-            # match all subvariations
-            eco = '%s%%' % eco
-        d = adb.runQuery("""SELECT eco,nic,long_,eco.fen AS fen FROM eco LEFT JOIN nic USING(hash) WHERE eco LIKE %s LIMIT 100""", (eco,))
-        return d
-
-    def look_up_nic(nic):
-        d = adb.runQuery("""SELECT eco,nic,long_,nic.fen AS fen FROM nic LEFT JOIN eco USING(hash) WHERE nic = %s LIMIT 100""", (nic,))
-        return d
+    def get_eco_all():
+        return adb.runQuery("""SELECT eco,long_,hash,fen FROM eco ORDER BY eco_id""")
+
+    def get_nic_all():
+        return adb.runQuery("""SELECT nic,hash,fen FROM nic ORDER BY nic_id""")
+
+    def _game_add_txn(txn, g):
+        txn.execute("""INSERT INTO game SET
+            white_user_id=%(white_user_id)s,
+            black_user_id=%(black_user_id)s,
+            white_clock=%(white_clock)s,
+            black_clock=%(black_clock)s,
+            white_rating=%(white_rating)s,
+            black_rating=%(black_rating)s,
+            eco=%(eco)s,variant_id=%(variant_id)s,speed_id=%(speed_id)s,
+            time=%(time)s,inc=%(inc)s,is_rated=%(is_rated)s,
+            adjourn_reason=%(adjourn_reason)s,ply_count=%(ply_count)s,
+            movetext=%(movetext)s,
+            white_material=%(white_material)s,
+            black_material=%(black_material)s,
+            when_started=%(when_started)s,
+            when_ended=%(when_ended)s,
+            clock_id=%(clock_id)s,
+            result=%(result)s,
+            result_reason=%(result_reason)s,
+            draw_offered=%(draw_offered)s,
+            is_adjourned=%(is_adjourned)s
+            """, g)
+            #overtime_move_num=%(overtime_move_num),
+            #overtime_bonus=%(overtime_bonus),
+        return txn.lastrowid
 
     def game_add(g):
         """Add a completed or adjourned game to the main game table."""
-        def do(txn, g):
-            txn.execute("""INSERT INTO game SET
-                white_user_id=%(white_user_id)s,
-                black_user_id=%(black_user_id)s,
-                white_clock=%(white_clock)s,
-                black_clock=%(black_clock)s,
-                white_rating=%(white_rating)s,
-                black_rating=%(black_rating)s,
-                eco=%(eco)s,variant_id=%(variant_id)s,speed_id=%(speed_id)s,
-                time=%(time)s,inc=%(inc)s,is_rated=%(is_rated)s,
-                adjourn_reason=%(adjourn_reason)s,ply_count=%(ply_count)s,
-                movetext=%(movetext)s,
-                white_material=%(white_material)s,
-                black_material=%(black_material)s,
-                when_started=%(when_started)s,
-                when_ended=%(when_ended)s,
-                clock_id=%(clock_id)s,
-                result=%(result)s,
-                result_reason=%(result_reason)s,
-                draw_offered=%(draw_offered)s,
-                is_adjourned=%(is_adjourned)s
-                """, g)
-                #overtime_move_num=%(overtime_move_num),
-                #overtime_bonus=%(overtime_bonus),
-            return txn.lastrowid
-        return adb.runInteraction(do, g)
+        return adb.runInteraction(_game_add_txn, g)
+
+    def game_complete_many(completions):
+        """Save finished games, with the players' history entries and
+        new ratings, in one transaction.  Returns a list of the new
+        game IDs."""
+        def do(txn):
+            game_ids = []
+            for c in completions:
+                game_id = _game_add_txn(txn, c.game)
+                if c.game['idn'] is not None:
+                    _game_add_idn_txn(txn, game_id, c.game['idn'])
+                for (user_id, entry) in c.history:
+                    _add_history_txn(txn, user_id, dict(entry,
+                        game_id=game_id))
+                for r in c.ratings:
+                    _set_rating_txn(txn, *r)
+                game_ids.append(game_id)
+            return game_ids
+        return adb.runInteraction(do)
 
     @defer.inlineCallbacks
     def get_clock_id(clock_name):
@@ -770,10 +831,7 @@ if 1:
                 raise DeleteError()
         return adb.runInteraction(do_del)
 
-    def user_get_history(user_id):
-        """Get recent game history for the given user.  In the future
-        this function could be extended to allow looking farther back."""
-        return adb.runQuery("""SELECT h.game_id AS game_id,
+    _history_sql = """SELECT h.game_id AS game_id,
                 white_user_id, black_user_id, white.user_name AS white_name,
                 black.user_name AS black_name, white_rating, black_rating,
                 num, eco, game.time AS time, game.inc AS inc, result_reason,
@@ -786,16 +844,17 @@ if 1:
                 LEFT JOIN game_idn USING (game_id)
             WHERE h.user_id=%s
             ORDER BY when_ended ASC
-            LIMIT 10""", (user_id,))
+            LIMIT 10"""
+    def user_get_history(user_id):
+        """Get recent game history for the given user.  In the future
+        this function could be extended to allow looking farther back."""
+        return adb.runQuery(_history_sql, (user_id,))
 
-    def user_add_history(entry, user_id):
+    def _add_history_txn(txn, user_id, entry):
         """Add a history entry for a user, removing old entries if
         necessary."""
-        entry.update({'user_id': user_id})
-        def do(txn):
-            txn.execute("""DELETE FROM history WHERE user_id=%s AND num=%s""", (user_id, entry['num']))
-            txn.execute("""INSERT INTO history SET user_id=%(user_id)s,game_id=%(game_id)s, num=%(num)s, guest_opp_name=%(guest_opp_name)s""", entry)
-        return adb.runInteraction(do)
+        txn.execute("""DELETE FROM history WHERE user_id=%s AND num=%s""", (user_id, entry['num']))
+        txn.execute("""INSERT INTO history SET user_id=%s,game_id=%s, num=%s, guest_opp_name=%s""", (user_id, entry['game_id'], entry['num'], entry['guest_opp_name']))
 
     def user_del_history(user_id):
         """Delete all entries from a user's history."""
@@ -814,24 +873,28 @@ if 1:
             AS tmp ORDER BY variant_id,speed_id""",
         (user_id,))
 
+    _all_ratings_sql = """SELECT variant_id,speed_id,rating,rd,volatility,win,loss,draw,total,best,when_best,ltime FROM rating WHERE user_id=%s"""
     def user_get_all_ratings(user_id):
         """Get all of a user's ratings for all variants and speeds."""
-        return adb.runQuery("""SELECT variant_id,speed_id,rating,rd,volatility,win,loss,draw,total,best,when_best,ltime FROM rating WHERE user_id=%s""",
-            (user_id,))
+        return adb.runQuery(_all_ratings_sql, (user_id,))
 
-    def user_set_rating(user_id, speed_id, variant_id,
+    def _set_rating_txn(txn, user_id, speed_id, variant_id,
             rating, rd, volatility, win, loss, draw, total, ltime):
-        def do(txn):
-            txn.execute("""UPDATE rating SET rating=%s,rd=%s,volatility=%s,win=%s,loss=%s,draw=%s,total=%s,ltime=%s WHERE user_id = %s AND speed_id = %s and variant_id = %s""",
+        txn.execute("""UPDATE rating SET rating=%s,rd=%s,volatility=%s,win=%s,loss=%s,draw=%s,total=%s,ltime=%s WHERE user_id = %s AND speed_id = %s and variant_id = %s""",
+            (rating, rd, volatility, win, loss, draw, total, ltime,
+            user_id, speed_id, variant_id))
+        if txn.rowcount == 0:
+            txn.execute("""INSERT INTO rating SET rating=%s,rd=%s,volatility=%s,win=%s,loss=%s,draw=%s,total=%s,ltime=%s,user_id=%s,speed_id=%s,variant_id=%s""",
                 (rating, rd, volatility, win, loss, draw, total, ltime,
                 user_id, speed_id, variant_id))
-            if txn.rowcount == 0:
-                txn.execute("""INSERT INTO rating SET rating=%s,rd=%s,volatility=%s,win=%s,loss=%s,draw=%s,total=%s,ltime=%s,user_id=%s,speed_id=%s,variant_id=%s""",
-                    (rating, rd, volatility, win, loss, draw, total, ltime,
-                    user_id, speed_id, variant_id))
-            if txn.rowcount != 1:
-                raise UpdateError
-        return adb.runInteraction(do)
+        if txn.rowcount != 1:
+            raise UpdateError
+
+    def user_set_rating(user_id, speed_id, variant_id,
+            rating, rd, volatility, win, loss, draw, total, ltime):
+        return adb.runInteraction(_set_rating_txn, user_id, speed_id,
+            variant_id, rating, rd, volatility, win, loss, draw, total,
+            ltime)
 
     def user_del_rating(user_id, speed_id, variant_id):
         return adb.runOperation("""DELETE FROM rating WHERE user_id = %s AND speed_id = %s and variant_id = %s""",
@@ -878,12 +941,13 @@ if 1:
             FROM news_index WHERE news_is_admin=%s
             ORDER BY news_id DESC LIMIT 10""", (is_admin,))
 
-    def get_news_since(when, is_admin):
-        is_admin = '1' if is_admin else '0'
-        return adb.runQuery("""
+    _news_since_sql = """
             SELECT news_id,news_title,DATE(news_when) as news_date,news_poster
             FROM news_index WHERE news_is_admin=%s AND news_when > %s
-            ORDER BY news_id DESC LIMIT 10""", (is_admin, when))
+            ORDER BY news_id DESC LIMIT 10"""
+    def get_news_since(when, is_admin):
+        is_admin = '1' if is_admin else '0'
+        return adb.runQuery(_news_since_sql, (is_admin, when))
 
     @defer.inlineCallbacks
     def get_news_item(news_id):
@@ -993,20 +1057,21 @@ if 1:
             ret = None
         defer.returnValue(ret)
 
-    @defer.inlineCallbacks
-    def get_message_count(uid):
-        """ Get counts of total and unread messages for a given user. """
-        rows = yield adb.runQuery("""SELECT COUNT(*) AS c,
+    _message_count_sql = """SELECT COUNT(*) AS c,
             SUM(unread) AS s
             FROM message
-            WHERE to_user_id=%s""",
-            (uid,))
-        ret = rows[0]
-        if ret['c'] == 0:
-            ret = (0, 0)
+            WHERE to_user_id=%s"""
+    def _message_count(row):
+        if row['c'] == 0:
+            return (0, 0)
         else:
-            ret = (ret['c'], ret['s'])
-        defer.returnValue(ret)
+            return (row['c'], row['s'])
+
+    @defer.inlineCallbacks
+    def get_message_count(uid):
+        """ Get counts of total and unread messages for a given user. """
+        rows = yield adb.runQuery(_message_count_sql, (uid,))
+        defer.returnValue(_message_count(rows[0]))
 
     def get_messages_all(user_id):
         return adb.runQuery("""SELECT
@@ -1123,15 +1188,6 @@ if 1:
         yield _renumber_messages(to_user_id)
         defer.returnValue(ret)
 
-    @defer.inlineCallbacks
-    def fen_from_idn(idn):
-        """Get the FEN representing a chess960 position, given an idn."""
-        assert(0 <= idn <= 959)
-        rows = yield adb.runQuery("""SELECT fen FROM chess960_pos
-            WHERE idn=%s""", (idn,))
-        fen = rows[0]['fen']
-        defer.returnValue(fen)
-
     '''@defer.inlineCallbacks
     def idn_from_fen(fen):
         """Get the idn representing a chess960 position, given a FEN."""
@@ -1143,11 +1199,14 @@ if 1:
         else:
             defer.returnValue(None)'''
 
+    def _game_add_idn_txn(txn, game_id, idn):
+        txn.execute("""INSERT INTO game_idn VALUES(%s,%s)""",
+            (game_id, idn))
+
     def game_add_idn(game_id, idn):
         """Save the idn representing the starting position of a specified
         chess960 game."""
-        return adb.runOperation("""INSERT INTO game_idn VALUES(%s,%s)""",
-            (game_id, idn))
+        return adb.runInteraction(_game_add_idn_txn, game_id, idn)
 
     def get_server_messages():
         """Fetch all dynamic server messages in the DB."""
@@ -0,0 +1,126 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" ECO and NIC opening codes, indexed by position hash.
+
+The eco and nic tables are small and never change while the server is
+running (they are filled by scripts/import-eco.py), so they are loaded
+once at startup and looked up in memory. """
+
+from twisted.internet import defer
+
+import db
+
+# the deepest ply at which openings are classified
+MAX_PLY = 36
+
+# maximum number of rows returned by look_up_eco() and look_up_nic()
+LOOK_UP_LIMIT = 100
+
+# the classification of games that match no known position
+UNKNOWN_ECO = (0, 'A00', 'Unknown')
+UNKNOWN_NIC = (0, '-----')
+
+# hash -> (eco, long_, fen)
+_eco = {}
+# hash -> (nic, fen)
+_nic = {}
+# upper-case code -> list of hashes, in table order
+_eco_codes = {}
+_eco_prefixes = {}
+_nic_codes = {}
+
+
+@defer.inlineCallbacks
+def init():
+    _eco.clear()
+    _nic.clear()
+    _eco_codes.clear()
+    _eco_prefixes.clear()
+    _nic_codes.clear()
+    for row in (yield db.get_eco_all()):
+        hash_ = row['hash']
+        _eco[hash_] = (row['eco'], row['long_'], row['fen'])
+        code = row['eco'].upper()
+        _eco_codes.setdefault(code, []).append(hash_)
+        _eco_prefixes.setdefault(code[0:3], []).append(hash_)
+    for row in (yield db.get_nic_all()):
+        hash_ = row['hash']
+        _nic[hash_] = (row['nic'], row['fen'])
+        _nic_codes.setdefault(row['nic'].upper(), []).append(hash_)
+
+
+def get_eco(hash_):
+    """ Return (eco, long_) for a position, or None if it has no ECO
+    code. """
+    e = _eco.get(hash_)
+    if e is None:
+        return None
+    return e[0:2]
+
+
+def get_nic(hash_):
+    """ Return the NIC code for a position, or None. """
+    n = _nic.get(hash_)
+    if n is None:
+        return None
+    return n[0]
+
+
+def classify(history, start_ply, ply):
+    """ Find the ECO and NIC codes of the deepest positions in a game
+    history that have them, looking no deeper than MAX_PLY.  Returns
+    ((ply, eco, long_), (ply, nic)).  Chess positions keep track of
+    this as moves are made; this is for the other variants. """
+    eco = nic = None
+    i = min(ply, MAX_PLY)
+    while i >= start_ply and (eco is None or nic is None):
+        hash_ = history.get_hash(i)
+        if eco is None and hash_ in _eco:
+            e = _eco[hash_]
+            eco = (i, e[0], e[1])
+        if nic is None and hash_ in _nic:
+            nic = (i, _nic[hash_][0])
+        i -= 1
+    return (eco or UNKNOWN_ECO, nic or UNKNOWN_NIC)
+
+
+def _row(hash_, fen):
+    e = _eco.get(hash_)
+    n = _nic.get(hash_)
+    return {'eco': e[0] if e else None, 'long_': e[1] if e else None,
+        'nic': n[0] if n else None, 'fen': fen}
+
+
+def look_up_eco(eco):
+    """ Find the positions with the given ECO code.  A code of three
+    characters also matches all its subvariations. """
+    eco = eco.upper()
+    if len(eco) == 3:
+        hashes = _eco_prefixes.get(eco, [])
+    else:
+        hashes = _eco_codes.get(eco, [])
+    return [_row(h, _eco[h][2]) for h in hashes[0:LOOK_UP_LIMIT]]
+
+
+def look_up_nic(nic):
+    """ Find the positions with the given NIC code. """
+    hashes = _nic_codes.get(nic.upper(), [])
+    return [_row(h, _nic[h][1]) for h in hashes[0:LOOK_UP_LIMIT]]
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
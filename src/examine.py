@@ -46,6 +46,7 @@ class ExaminedGame(Game):
             user, user)
         assert(user.session.game is None)
         user.session.game = self
+        global_.online.update_seek_audience(user)
         self.when_started = datetime.datetime.utcnow()
 
         if hist_game is None:
@@ -74,16 +75,16 @@ class ExaminedGame(Game):
 
         self.gameinfo_str = '\n<g1> %d p=%d t=%s r=%d u=%d,%d it=%d,%d i=%d,%d pt=0 rt=%s,%s ts=%d,%d m=%d n=%d\n' % (self.number, self.private, self.speed_variant.legacy_str(), 0, user.is_guest, user.is_guest, 0, 0, 0, 0, 0, 0, user.has_timeseal(), user.has_timeseal(), 0, 0)
 
-    @defer.inlineCallbacks
     def finish_init(self, user):
         if self.variant.name == 'chess960':
-            yield self.variant.set_idn(self.idn)
+            self.variant.set_idn(self.idn)
         for uf in user.session.followed_by:
             if not uf.session.pfollow:
                 uf.write_('\n%s, whom you are following, has started examining a game.\n', user)
             self.observe(uf)
 
         self.send_boards()
+        return defer.succeed(None)
 
     def forward(self, n, conn):
         assert(self.variant.pos.ply <= len(self.moves))
@@ -203,6 +204,7 @@ class ExaminedGame(Game):
 
         self.players.add(u)
         u.session.game = self
+        global_.online.update_seek_audience(u)
         conn.write(_('%(name)s is now an examiner of game %(num)d.\n') %
             {'name': u.name, 'num': self.number})
         u.write_('\n%(name)s has made you an examiner of game %(num)d.\n',
@@ -244,6 +246,7 @@ class ExaminedGame(Game):
         self.players.remove(user)
         assert(user.session.game == self)
         user.session.game = None
+        global_.online.update_seek_audience(user)
         # user may be offline if he or she disconnected unexpectedly
         if user.is_online:
             user.write_('You are no longer examining game %d.\n',
@@ -63,6 +63,10 @@ class Online(object):
         self.pin_ivar = set()
         self.pin_var = set()
         self.gin_var = set()
+        # users who are not in a game and get seek announcements
+        self.seekinfo_ivar = set()
+        self.seekremove_ivar = set()
+        self.seek_var = set()
         #self.shouts_var = set()
 
     def add(self, u):
@@ -76,6 +80,7 @@ class Online(object):
             self.gin_var.add(u)
         if u.is_guest:
             self.guest_count += 1
+        self.update_seek_audience(u)
 
     def remove(self, u):
         if u in self.pin_ivar:
@@ -86,10 +91,26 @@ class Online(object):
             self.gin_var.remove(u)
         #if u in shouts_var:
         #    shouts_var.remove(u)
+        self.seekinfo_ivar.discard(u)
+        self.seekremove_ivar.discard(u)
+        self.seek_var.discard(u)
         del self._online_names[u.name.lower()]
         del self._online[u.name.lower()]
         self.guest_count -= int(u.is_guest)
 
+    def update_seek_audience(self, u):
+        """ Update the users who get seek announcements, after a user's
+        seek variables change or the user starts or stops playing or
+        examining a game. """
+        free = u.is_online and not u.session.game
+        for (s, val) in [(self.seekinfo_ivar, u.session.ivars['seekinfo']),
+                (self.seekremove_ivar, u.session.ivars['seekremove']),
+                (self.seek_var, u.vars_['seek'])]:
+            if free and val:
+                s.add(u)
+            else:
+                s.discard(u)
+
     def is_online(self, name):
         return name.lower() in self._online_names
 
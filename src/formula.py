@@ -27,6 +27,12 @@ Terminology:
     led = left denotation
     lbp = left binding power
 
+Instead of evaluating the formula as it is parsed, the parser builds
+a tree of closures, so a formula is parsed once and can then be
+evaluated against any number of challenges.  Each closure takes the
+challenge as its only argument; a challenge of None means the formula
+is only being checked for validity.
+
 Kudos to Dave Herscovici for the excellent original FICS implementation
 of formulas, which I tried to emulate.
 """
@@ -37,10 +43,6 @@ from game_constants import WHITE, BLACK
 all_tokens = {}
 
 
-# pacify pyflakes
-token = nextt = chal = f_num = None
-
-
 class FormulaError(Exception):
     def __init__(self, msg):
         super(FormulaError, self).__init__()
@@ -49,10 +51,10 @@ class FormulaError(Exception):
 
 class Symbol(object):
     tokens = []
-    def nud(self):
+    def nud(self, p):
         raise FormulaError('unexpected use as unary operator')
 
-    def led(self, left):
+    def led(self, p, left):
         raise FormulaError('unexpected use as binary operator')
 
 
@@ -72,158 +74,140 @@ class Token(object):
 class NumSymbol(Symbol):
     def __init__(self, val):
         self.val = val
-    def nud(self):
-        return self.val
-
-
-def advance(sym):
-    global token
-    if sym not in token.tokens:
-        raise FormulaError('expected %s' % sym)
-    token = nextt()
+    def nud(self, p):
+        val = self.val
+        return lambda chal: val
 
 
 @Token(['!'])
 class NotSymbol(Symbol):
     lbp = 90
-    def nud(self):
-        return int(not expression(90))
+    def nud(self, p):
+        right = p.expression(90)
+        return lambda chal: int(not right(chal))
 
 
 @Token(['*'])
 class MultSymbol(Symbol):
     lbp = 80
-    def led(self, left):
-        right = expression(80)
-        return left * right
+    def led(self, p, left):
+        right = p.expression(80)
+        return lambda chal: left(chal) * right(chal)
 
 
 @Token(['/'])
 class DivSymbol(Symbol):
     lbp = 80
-    def led(self, left):
-        right = expression(80)
-        if right == 0:
-            right = .001  # fudge factor
-        return left // right
+    def led(self, p, left):
+        right = p.expression(80)
+        def f(chal):
+            l = left(chal)
+            r = right(chal)
+            if r == 0:
+                r = .001  # fudge factor
+            return l // r
+        return f
 
 
 @Token(['+'])
 class AddSymbol(Symbol):
     lbp = 70
-    def nud(self):
+    def nud(self, p):
         # unary + has higher precedence
-        return expression(90)
-    def led(self, left):
-        right = expression(70)
-        return left + right
+        return p.expression(90)
+    def led(self, p, left):
+        right = p.expression(70)
+        return lambda chal: left(chal) + right(chal)
 
 
 @Token(['-'])
 class SubSymbol(Symbol):
     lbp = 70
-    def nud(self):
+    def nud(self, p):
         # unary - has higher precedence
-        return -expression(90)
-    def led(self, left):
-        right = expression(70)
-        return left - right
+        right = p.expression(90)
+        return lambda chal: -right(chal)
+    def led(self, p, left):
+        right = p.expression(70)
+        return lambda chal: left(chal) - right(chal)
+
+
+def _compare(op, left, right):
+    """ Build a closure for a comparison or logical operator, which
+    gives None if its operands can't be compared. """
+    def f(chal):
+        l = left(chal)
+        r = right(chal)
+        try:
+            return int(op(l, r))
+        except TypeError:
+            return None
+    return f
 
 
 @Token(['<'])
 class LTSymbol(Symbol):
     lbp = 60
-    def led(self, left):
-        right = expression(60)
-        try:
-            return int(left < right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l < r, left, p.expression(60))
 
 
 @Token(['<=', '=<'])
 class LTESymbol(Symbol):
     lbp = 60
-    def led(self, left):
-        right = expression(60)
-        try:
-            return int(left <= right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l <= r, left, p.expression(60))
 
 
 @Token(['>'])
 class GTSymbol(Symbol):
     lbp = 60
-    def led(self, left):
-        right = expression(60)
-        try:
-            return int(left > right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l > r, left, p.expression(60))
 
 
 @Token(['>=', '=>'])
 class GTESymbol(Symbol):
     lbp = 60
-    def led(self, left):
-        right = expression(60)
-        try:
-            return int(left >= right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l >= r, left, p.expression(60))
 
 
 @Token(['=', '=='])
 class EqSymbol(Symbol):
     lbp = 50
-    def led(self, left):
-        right = expression(50)
-        try:
-            return int(left == right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l == r, left, p.expression(50))
 
 
 @Token(['!=', '<>'])
 class NeqSymbol(Symbol):
     lbp = 40
-    def led(self, left):
-        right = expression(40)
-        try:
-            return int(left != right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l != r, left, p.expression(40))
 
 
 @Token(['&', '&&', 'and'])
 class AndSymbol(Symbol):
     lbp = 30
-    def led(self, left):
-        right = expression(30)
-        try:
-            return int(left and right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        # both sides are always evaluated, as in original FICS
+        return _compare(lambda l, r: l and r, left, p.expression(30))
 
 
 @Token(['|', '||', 'or'])
 class OrSymbol(Symbol):
     lbp = 20
-    def led(self, left):
-        right = expression(20)
-        try:
-            return int(left or right)
-        except TypeError:
-            return None
+    def led(self, p, left):
+        return _compare(lambda l, r: l or r, left, p.expression(20))
 
 
 @Token(['('])
 class LParenSymbol(Symbol):
     lbp = 0
-    def nud(self):
-        expr = expression(0)
-        advance(')')
+    def nud(self, p):
+        expr = p.expression(0)
+        p.advance(')')
         return expr
 
 
@@ -236,162 +220,183 @@ class EndSymbol(Symbol):
     lbp = 0
 
 
-@Token(['abuser'])
-class AbuserSymbol(Symbol):
+class ChalSymbol(Symbol):
+    """ A symbol whose value depends on the challenge. """
     lbp = 0
-    def nud(self):
-        return int(chal.a.has_title('abuser')) if chal else None
+    def nud(self, p):
+        value = self.value
+        return lambda chal: value(chal) if chal else None
+
+
+@Token(['abuser'])
+class AbuserSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.a.has_title('abuser'))
 
 
 @Token(['computer'])
-class ComputerSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.a.has_title('computer')) if chal else None
+class ComputerSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.a.has_title('computer'))
 
 
 @Token(['time'])
-class TimeSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return chal.time if chal else None
+class TimeSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return chal.time
 
 
 @Token(['inc'])
-class IncSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return chal.inc if chal else None
+class IncSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return chal.inc
 
 
 @Token(['rating'])
-class RatingSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.a.get_rating(chal.speed_variant)) if chal else None
+class RatingSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.a.get_rating(chal.speed_variant))
 
 
 @Token(['myrating'])
-class MyratingSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.b.get_rating(chal.speed_variant)) if chal else None
+class MyratingSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.b.get_rating(chal.speed_variant))
 
 
 @Token(['ratingdiff'])
-class RatingdiffSymbol(Symbol):
-    lbp = 0
-    def nud(self):
+class RatingdiffSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
         return (int(chal.a.get_rating(chal.speed_variant)) -
-            int(chal.b.get_rating(chal.speed_variant))) if chal else None
+            int(chal.b.get_rating(chal.speed_variant)))
 
 
 @Token(['white'])
-class WhiteSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.side == WHITE) if chal else None
+class WhiteSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.side == WHITE)
 
 
 @Token(['black'])
-class BlackSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.side == BLACK) if chal else None
+class BlackSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.side == BLACK)
 
 
 @Token(['nocolor'])
-class NocolorSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.side not in [WHITE, BLACK]) if chal else None
+class NocolorSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.side not in [WHITE, BLACK])
 
 
 @Token(['slow'])
-class SlowSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.speed_name == 'slow') if chal else None
+class SlowSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.speed_name == 'slow')
 
 
 @Token(['standard'])
-class StandardSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.speed_name == 'standard') if chal else None
+class StandardSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.speed_name == 'standard')
 
 
 @Token(['blitz'])
-class BlitzSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.speed_name == 'blitz') if chal else None
+class BlitzSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.speed_name == 'blitz')
 
 
 @Token(['lightning'])
-class LightningSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.speed_name == 'lightning') if chal else None
+class LightningSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.speed_name == 'lightning')
 
 
 @Token(['registered'])
-class RegisteredSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return (0 if chal.a.is_guest else 1) if chal else None
+class RegisteredSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return 0 if chal.a.is_guest else 1
 
 
 @Token(['timeseal'])
-class TimesealSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.a.has_timeseal()) if chal else None
+class TimesealSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.a.has_timeseal())
 
 
 @Token(['crazyhouse'])
-class CrazyhouseSymbol(Symbol):
-    lbp = 0
-    def nud(self):
-        return int(chal.variant.name == 'crazyhouse') if chal else None
+class CrazyhouseSymbol(ChalSymbol):
+    @staticmethod
+    def value(chal):
+        return int(chal.variant.name == 'crazyhouse')
 
 
 class FSymbol(Symbol):
     lbp = 0
     def __init__(self, num):
         self.num = num
-    def nud(self):
-        global token, nextt, chal, f_num
-        if self.num <= f_num:
+    def nud(self, p):
+        if self.num <= p.num:
             raise FormulaError('A formula variable may not refer to itself or an earlier formula variable')
-        if not chal:
-            # no need to evaluate
-            return 0
-        old_token = token
-        old_nextt = nextt
-        ret = check_formula(chal, chal.b.vars_['f' + str(self.num)], self.num)
-        token = old_token
-        nextt = old_nextt
-        return ret
-
-
-def expression(rbp=0):
-    global token, nextt
-    t = token
-    try:
-        token = nextt()
-    except StopIteration:
-        # consider an empty formula to be 1
-        if rbp == 0:
-            return 1
-        else:
-            raise FormulaError('unexpected end of formula')
-    left = t.nud()
-    while rbp < token.lbp:
-        t = token
-        token = nextt()
-        left = t.led(left)
-    return left
+        name = 'f' + str(self.num)
+        def f(chal):
+            if not chal:
+                # no need to evaluate
+                return 0
+            # the formula variables of the user receiving the challenge
+            return get_compiled(chal.b, name)(chal)
+        return f
+
+
+class _Parser(object):
+    """ The state for parsing one formula. """
+    def __init__(self, s, num):
+        # the number of the formula variable being parsed
+        self.num = num
+        try:
+            self.nextt = tokenize(s).next
+            self.token = self.nextt()
+        except StopIteration:
+            raise FormulaError('got formula with no tokens')
+
+    def advance(self, sym):
+        if sym not in self.token.tokens:
+            raise FormulaError('expected %s' % sym)
+        self.token = self.nextt()
+
+    def expression(self, rbp=0):
+        t = self.token
+        try:
+            self.token = self.nextt()
+        except StopIteration:
+            # consider an empty formula to be 1
+            if rbp == 0:
+                return lambda chal: 1
+            else:
+                raise FormulaError('unexpected end of formula')
+        left = t.nud(self)
+        while rbp < self.token.lbp:
+            t = self.token
+            self.token = self.nextt()
+            left = t.led(self, left)
+        return left
 
 escaped_re = re.compile(r'([*+()|])')
 
@@ -440,10 +445,13 @@ def tokenize(s):
     yield EndSymbol()
 
 
-def check_formula(chal_, s, num=0):
-    """ Check whether the challenge CHAL_ meets the formula described by S.
-    If chal_ is None, we parse the formula for validity but don't worry
-    about its evaulation.
+def _no_formula(chal):
+    return 1
+
+
+def compile_formula(s, num=0):
+    """ Parse the formula S, returning a function that takes a
+    challenge and gives the value of the formula for it.
 
     NUM is 0 for the main formula var, 1 for f1, 2 for f2, etc.
 
@@ -451,17 +459,44 @@ def check_formula(chal_, s, num=0):
     """
     if s is None:
         # no formula
-        return 1
+        return _no_formula
     assert(isinstance(s, basestring))
-    global token, nextt, chal, f_num
-    chal = chal_
+    return _Parser(s, num).expression()
+
+
+def get_compiled(u, name):
+    """ Get the compiled form of the formula variable NAME ('formula'
+    or 'f1' through 'f9') of user U, compiling it if it has not been
+    compiled since it was last set. """
+    s = u.vars_[name]
     try:
-        nextt = tokenize(s).next
-    except StopIteration:
-        raise FormulaError('got formula with no tokens')
-    f_num = num
-    token = nextt()
-    return expression()
+        (cached_s, f) = u.compiled_formulas[name]
+    except KeyError:
+        pass
+    else:
+        if cached_s is s:
+            return f
+    f = compile_formula(s, 0 if name == 'formula' else int(name[1:]))
+    u.compiled_formulas[name] = (s, f)
+    return f
+
+
+def check_user_formula(chal_, u):
+    """ Check whether the challenge CHAL_ meets the formula of user U.
+    Raises FormulaError on an error. """
+    return get_compiled(u, 'formula')(chal_)
+
+
+def check_formula(chal_, s, num=0):
+    """ Check whether the challenge CHAL_ meets the formula described by S.
+    If chal_ is None, we parse the formula for validity but don't worry
+    about its evaulation.
+
+    NUM is 0 for the main formula var, 1 for f1, 2 for f2, etc.
+
+    Raises FormulaError on an error.
+    """
+    return compile_formula(s, num)(chal_)
 
 if __name__ == '__main__':
     print(check_formula(None, '7 * (3 * (3 + 2) /  2) - 42 * 2'))
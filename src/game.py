@@ -30,6 +30,7 @@ import time_format
 import variant
 import global_
 import db
+import broadcast
 
 from game_constants import WHITE, BLACK, opp, PLAYED, EXAMINED, file_
 
@@ -205,10 +206,13 @@ class Game(object):
         for p in self.players:
             self.send_board(p)
         for u in self.observers:
-            self.send_board(u)
+            self.send_board(u, observer=True)
 
-    def send_board(self, u, isolated=False):
+    def send_board(self, u, isolated=False, observer=False):
         prompt = (u != global_.curuser)
+        # an observer who is not keeping up only needs the latest
+        # full board
+        supersede = ('board', self.number) if observer else None
         if u.vars_['style'] == 12:
             if (self.gtype == PLAYED and self.variant.name == 'chess' and
                     u.session.ivars['compressmove'] and
@@ -216,10 +220,12 @@ class Game(object):
                     not isolated):
                 u.write_nowrap(self.variant.to_deltaboard(u), prompt=prompt)
             else:
-                u.write_nowrap(self.variant.to_style12(u), prompt=prompt)
+                u.write_nowrap(self.variant.to_style12(u), prompt=prompt,
+                    supersede=supersede)
         else:
             # style 1, the default
-            u.write_nowrap(self.variant.to_style1(u), prompt=prompt)
+            u.write_nowrap(self.variant.to_style1(u), prompt=prompt,
+                supersede=supersede)
 
     def __eq__(self, other):
         return self.number == other.number
@@ -286,39 +292,14 @@ class Game(object):
         assert(not self.observers)
         del global_.games[self.number]
 
-    @defer.inlineCallbacks
     def get_eco(self):
-        """Get a tuple containing eco code information for this game.
-        Return a Deferred that fires with the result."""
-        i = min(self.variant.pos.ply, 36)
-        row = None
-        while i >= self.variant.pos.start_ply:
-            hash_ = self.variant.pos.history.get_hash(i)
-            row = yield db.get_eco(hash_)
-            if row:
-                break
-            i -= 1
-        if row:
-            ret = (i, row['eco'], row['long_'])
-        else:
-            ret = (0, 'A00', 'Unknown')
-        defer.returnValue(ret)
+        """Get a tuple (ply, eco, long) containing eco code information
+        for this game."""
+        return self.variant.get_opening()[0]
 
-    @defer.inlineCallbacks
     def get_nic(self):
-        i = min(self.variant.pos.ply, 36)
-        row = None
-        while i >= self.variant.pos.start_ply:
-            hash_ = self.variant.pos.history.get_hash(i)
-            row = yield db.get_nic(hash_)
-            if row:
-                break
-            i -= 1
-        if row:
-            ret = (i, row['nic'])
-        else:
-            ret = (0, '-----')
-        defer.returnValue(ret)
+        """Get a tuple (ply, nic) for this game."""
+        return self.variant.get_opening()[1]
 
     def get_movetext(self):
         i = self.variant.pos.start_ply
@@ -376,7 +357,7 @@ class Game(object):
         """Check if the given string represents a move for this
         game."""
         try:
-            mv = self.variant.parse_move(s, conn)
+            mv = self.variant.get_move(s, conn)
             parsed = mv is not None
             legal = True
         except variant.base_variant.IllegalMoveError:
@@ -535,7 +516,7 @@ class PlayedGame(Game):
 
         self.variant = global_.variant_class[self.speed_variant.variant.name](self)
         if self.variant.name == 'chess960':
-            yield self.variant.set_idn(self.idn)
+            self.variant.set_idn(self.idn)
         # play the stored moves for an adjourned game
         if chal.adjourned:
             moves = chal.adjourned['movetext'].split(' ')
@@ -543,13 +524,16 @@ class PlayedGame(Game):
             for san_mv in moves:
                 mv = self.variant.pos.move_from_san(san_mv)
                 mv.time = 0.0  # XXX
-                mv.clock_time = None  # XXX
                 self.variant.do_move(mv)
+                self.variant.pos.history.set_clock_time(
+                    self.variant.pos.ply - 1, None)  # XXX
 
         assert(self.white.session.game is None)
         assert(self.black.session.game is None)
         self.white.session.game = self
         self.black.session.game = self
+        global_.online.update_seek_audience(self.white)
+        global_.online.update_seek_audience(self.black)
 
         self.white.session.say_to = set([self.black])
         self.black.session.say_to = set([self.white])
@@ -594,8 +578,7 @@ class PlayedGame(Game):
                     self.white_time, self.inc, self.number))
 
         # notify users with the gin variable set
-        for u in global_.online.gin_var:
-            u.write_nowrap(create_str_2, prompt=True)
+        broadcast.write_nowrap(global_.online.gin_var, create_str_2)
 
         # currently we do not send pings at the start of the game
 
@@ -805,9 +788,11 @@ class PlayedGame(Game):
         assert(mv == self.variant.pos.get_last_move())
         mv.time = time
         if self.variant.get_turn() == WHITE:
-            mv.clock_time = self.clock.get_black_time()
+            clock_time = self.clock.get_black_time()
         else:
-            mv.clock_time = self.clock.get_white_time()
+            clock_time = self.clock.get_white_time()
+        self.variant.pos.history.set_clock_time(self.variant.pos.ply - 1,
+            clock_time)
 
         super(PlayedGame, self).next_move(mv, conn)
         p = self.get_user_to_move()
@@ -910,7 +895,7 @@ class PlayedGame(Game):
 
         self.clock.stop()
         if result_code != '*':
-            yield history.save_game(self, msg, result_code)
+            c = history.save_game(self, msg, result_code)
             if self.rated:
                 if result_code == '1-0':
                     (white_score, black_score) = (1.0, 0.0)
@@ -920,7 +905,10 @@ class PlayedGame(Game):
                     (white_score, black_score) = (0.0, 1.0)
                 else:
                     raise RuntimeError('game.result: unexpected result code')
-                yield rating.update_ratings(self, white_score, black_score)
+                rating.update_ratings(self, white_score, black_score, c)
+            # the players don't have to wait for the game to be saved
+            d = global_.games_writer.add(c)
+            d.addErrback(self._save_failed)
 
         if self.bug_link and self.bug_link.is_active:
             if result_code == '1-0':
@@ -947,15 +935,16 @@ class PlayedGame(Game):
         # games are over until everything is cleaned up
         line = '\n{Game %d (%s vs. %s) %s} %s\n' % (self.number,
             self.white_name, self.black_name, msg, result_code)
-        self.white.write_nowrap(line, prompt=True)
-        self.black.write_nowrap(line, prompt=True)
-        for u in self.observers:
-            u.write_nowrap(line, prompt=True)
-        for u in global_.online.gin_var:
-            u.write_nowrap(line, prompt=True)
+        broadcast.write_nowrap([self.white, self.black], line)
+        broadcast.write_nowrap(self.observers, line)
+        broadcast.write_nowrap(global_.online.gin_var, line)
 
         self._free()
 
+    def _save_failed(self, failure):
+        print('error saving game %d: %s' % (self.number,
+            failure.getErrorMessage()))
+
     def moretime(self, secs, u):
         """ Player "u" adds more time to the clock of his or her
         opponent. """
@@ -985,11 +974,13 @@ class PlayedGame(Game):
             self.variant.undo_move()
 
         self.clock.stop()
-        last_clock = self.variant.pos.get_last_move().clock_time
+        last_clock = self.variant.pos.history.get_clock_time(
+            self.variant.pos.ply - 1)
         if self.variant.pos.ply == 1:
             other_clock = self.initial_secs
         else:
-            other_clock = self.variant.pos.history.get_move(self.variant.pos.ply - 2).clock_time
+            other_clock = self.variant.pos.history.get_clock_time(
+                self.variant.pos.ply - 2)
         if last_clock is not None and other_clock is not None:
             if self.variant.pos.wtm:
                 self.clock.set_white_time(other_clock)
@@ -1062,7 +1053,7 @@ class PlayedGame(Game):
             'movetext': self.get_movetext(),
             'white_material': self.variant.pos.material[1],
             'black_material': self.variant.pos.material[0],
-            'eco': (yield self.get_eco())[1],
+            'eco': self.get_eco()[1],
             'ply_count': self.get_ply_count(),
             'variant_id': self.speed_variant.variant.id_,
             'speed_id': self.speed_variant.speed.id_,
@@ -1109,6 +1100,8 @@ class PlayedGame(Game):
         assert(self.black.session.game == self)
         self.white.session.game = None
         self.black.session.game = None
+        global_.online.update_seek_audience(self.white)
+        global_.online.update_seek_audience(self.black)
 
     '''def __getitem__(self, key):
         """ Used to make game objects subscriptable, so they can
@@ -0,0 +1,130 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Finished games, saved to the DB in batches. """
+
+from twisted.internet import defer, reactor
+
+import db
+
+# seconds to wait after a game ends before writing it, so that games
+# ending at about the same time are written together
+FLUSH_DELAY = 0.005
+
+# write without waiting once this many games are queued
+FLUSH_COUNT = 50
+
+
+class Completion(object):
+    """ Everything saved when a game ends: the game itself, the
+    players' history entries and their new ratings. """
+    def __init__(self, game):
+        # the row for the game table
+        self.game = game
+        # (user_id, history entry) for each registered player
+        self.history = []
+        # arguments to db.user_set_rating() for each new rating
+        self.ratings = []
+
+    def set_game_id(self, game_id):
+        """ Fill in the game ID of the history entries, which are
+        also kept in memory, once the game has been saved. """
+        for (user_id, entry) in self.history:
+            entry['game_id'] = game_id
+
+
+class GameWriter(object):
+    """ Queues finished games, so that the players are told the result
+    without waiting on the DB.  Queued games are saved in a single
+    transaction, shortly after the first one ends or as soon as enough
+    are queued; if that fails, each game is tried again on its own.
+    Only one transaction is written at a time, so a player's ratings
+    are saved in order; games that end meanwhile are written together
+    when it finishes. """
+    def __init__(self):
+        # (completion, deferred) for each game not yet written
+        self._queue = []
+        self._writing = False
+        self._flush_call = None
+        # deferreds to fire when there is nothing left to write
+        self._waiters = []
+
+    def add(self, c):
+        """ Queue a completed game.  Returns a deferred that fires with
+        the game ID once the game is saved. """
+        d = defer.Deferred()
+        self._queue.append((c, d))
+        if len(self._queue) >= FLUSH_COUNT:
+            self._start()
+        elif self._flush_call is None and not self._writing:
+            self._flush_call = reactor.callLater(FLUSH_DELAY, self._start)
+        return d
+
+    def flush(self):
+        """ Start writing the queued games.  Returns a deferred that fires
+        when every game added so far has been written. """
+        self._start()
+        if not self._writing:
+            return defer.succeed(None)
+        d = defer.Deferred()
+        self._waiters.append(d)
+        return d
+
+    def _start(self):
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._queue and not self._writing:
+            batch = self._queue
+            self._queue = []
+            self._writing = True
+            self._write(batch).addBoth(self._done)
+
+    def _write(self, batch):
+        d = db.game_complete_many([c for (c, cd) in batch])
+        d.addCallbacks(self._written, self._failed, callbackArgs=(batch,),
+            errbackArgs=(batch,))
+        return d
+
+    def _written(self, game_ids, batch):
+        for ((c, cd), game_id) in zip(batch, game_ids):
+            c.set_game_id(game_id)
+            cd.callback(game_id)
+
+    def _failed(self, failure, batch):
+        if len(batch) == 1:
+            batch[0][1].errback(failure)
+        else:
+            # don't let one bad game keep the others from being saved
+            d = defer.succeed(None)
+            for item in batch:
+                d.addCallback(lambda _, item=item: self._write([item]))
+            return d
+
+    def _done(self, result):
+        self._writing = False
+        if self._queue:
+            self._start()
+        else:
+            waiters = self._waiters
+            self._waiters = []
+            for d in waiters:
+                d.callback(None)
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
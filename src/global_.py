@@ -23,7 +23,10 @@ from twisted.internet import defer
 
 import server
 import find_user
-import trie
+import seek_book
+import log_writer
+import game_writer
+import prefix_table
 import list_
 import filter_
 import lang
@@ -32,6 +35,7 @@ import var
 import speed_variant
 import db
 import logger
+import eco
 
 # add a builtin to mark strings for translation that should not
 # automatically be translated dynamically.
@@ -57,16 +61,22 @@ games = {}
 online = find_user.Online()
 
 # seeks
-seeks = {}
+seeks = seek_book.SeekBook()
+
+# logins and logouts not yet written to the DB
+user_log = log_writer.LogWriter()
+
+# finished games not yet saved to the DB
+games_writer = game_writer.GameWriter()
 
 # player variables and ivariables
-vars_ = trie.Trie()
-ivars = trie.Trie()
+vars_ = prefix_table.PrefixTable()
+ivars = prefix_table.PrefixTable()
 var_defaults = var.Defaults()
 
 # lists
-lists = trie.Trie()
-admin_lists = trie.Trie()
+lists = prefix_table.PrefixTable()
+admin_lists = prefix_table.PrefixTable()
 
 # filters and gaetways: will be initialized by filter_.init()
 filters = None
@@ -79,8 +89,8 @@ langs = lang.get_langs()
 channels = None
 
 # commands
-commands = trie.Trie()
-admin_commands = trie.Trie()
+commands = prefix_table.PrefixTable()
+admin_commands = prefix_table.PrefixTable()
 
 # map variant names to the classes that implement them
 variant_class = {}
@@ -103,6 +113,7 @@ def init():
     var.init_ivars()
     yield list_.init_lists()
     yield speed_variant.init()
+    yield eco.init()
 
 log = logger.log
 
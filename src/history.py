@@ -18,11 +18,13 @@
 
 from twisted.internet import defer
 
-import db
+import game_writer
 
 
-@defer.inlineCallbacks
 def save_game(game, msg, result_code):
+    """ Add a finished game to the players' histories.  Returns a
+    game_writer.Completion for saving the game and the new history
+    entries. """
     if 'by adjudication' in msg:
         result_reason = 'Adj'
     elif 'by agreement' in msg:
@@ -71,7 +73,7 @@ def save_game(game, msg, result_code):
         'movetext': game.get_movetext(),
         'white_material': game.variant.pos.material[1],
         'black_material': game.variant.pos.material[0],
-        'eco': (yield game.get_eco())[1],
+        'eco': game.get_eco()[1],
         'ply_count': game.get_ply_count(),
         'variant_id': game.speed_variant.variant.id_,
         'speed_id': game.speed_variant.speed.id_,
@@ -101,10 +103,7 @@ def save_game(game, msg, result_code):
     data['variant_abbrev'] = game.speed_variant.variant.abbrev
     data['speed_abbrev'] = game.speed_variant.speed.abbrev
 
-    game_id = yield db.game_add(data)
-
-    if game.idn is not None:
-        yield db.game_add_idn(game_id, game.idn)
+    c = game_writer.Completion(data)
 
     flags = '%s%s%s' % (game.speed_variant.speed.abbrev,
         game.speed_variant.variant.abbrev,
@@ -120,15 +119,19 @@ def save_game(game, msg, result_code):
         assert(result_code == '1/2-1/2')
         white_result_char = '='
         black_result_char = '='
-    yield game.white.save_history(game_id, white_result_char,
+    entry = game.white.save_history(None, white_result_char,
         data['white_rating'], 'W', game.black.name, data['black_rating'],
         data['eco'][0:3], flags, game.white_time, game.inc, result_reason,
         game.when_ended, data['movetext'], game.idn)
-    yield game.black.save_history(game_id, black_result_char,
+    if not game.white.is_guest:
+        c.history.append((game.white.id_, entry))
+    entry = game.black.save_history(None, black_result_char,
         data['black_rating'], 'B', game.white.name, data['white_rating'],
         data['eco'][0:3], flags, game.white_time, game.inc, result_reason,
         game.when_ended, data['movetext'], game.idn)
-    defer.returnValue(game_id)
+    if not game.black.is_guest:
+        c.history.append((game.black.id_, entry))
+    return c
 
 
 @defer.inlineCallbacks
@@ -0,0 +1,135 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" The log of logins and logouts, written to the DB in batches. """
+
+import datetime
+import collections
+
+from twisted.internet import defer, reactor
+from twisted.python import failure
+
+import db
+
+# seconds to wait after an entry is added before writing it
+FLUSH_DELAY = 0.5
+
+# write without waiting once this many entries are queued
+FLUSH_COUNT = 100
+
+# seconds between trims of the logs that have new entries
+TRIM_INTERVAL = 300
+
+# the number of entries kept in each user's log
+LOG_SIZE = 10
+
+_fields = ('log_who_name', 'log_which', 'log_ip', 'log_when')
+
+
+class LogWriter(object):
+    """ Queues log entries so that logging in and out does not wait
+    on the DB.  Queued entries are written together with one INSERT,
+    shortly after the first is added or as soon as enough are queued.
+    Logs are trimmed to LOG_SIZE entries by trim(), which should be
+    called periodically. """
+    def __init__(self):
+        # (user_name, which, ip, when) tuples not yet written
+        self._queue = []
+        # (entries, deferred) for each write in progress
+        self._writing = []
+        self._flush_call = None
+        # names of users with entries added since the last trim
+        self._to_trim = set()
+
+    def add(self, user_name, login, ip):
+        when = datetime.datetime.fromtimestamp(int(reactor.seconds()))
+        which = 'login' if login else 'logout'
+        self._queue.append((user_name, which, ip, when))
+        self._to_trim.add(user_name)
+        if len(self._queue) >= FLUSH_COUNT:
+            self.flush()
+        elif self._flush_call is None:
+            self._flush_call = reactor.callLater(FLUSH_DELAY, self.flush)
+
+    def flush(self):
+        """ Start writing the queued entries.  Returns a deferred that
+        fires when every entry added so far has been written. """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if self._queue:
+            entries = self._queue
+            self._queue = []
+            d = db.user_log_add_many(entries)
+            w = (entries, d)
+            self._writing.append(w)
+            d.addBoth(self._written, w)
+        return defer.DeferredList([d for (entries, d) in self._writing])
+
+    def _written(self, result, w):
+        self._writing.remove(w)
+        if isinstance(result, failure.Failure):
+            print('error writing %d user log entries: %s' %
+                (len(w[0]), result.getErrorMessage()))
+
+    def trim(self):
+        """ Delete the old entries in the logs of users who have logged
+        in or out since the last trim. """
+        if not self._to_trim:
+            return defer.succeed(None)
+        user_names = list(self._to_trim)
+        self._to_trim = set()
+        d = self.flush()
+        d.addCallback(lambda _: db.user_log_trim(user_names, LOG_SIZE))
+        d.addErrback(self._trim_failed)
+        return d
+
+    def _trim_failed(self, result):
+        print('error trimming user logs: %s' % result.getErrorMessage())
+
+    def _unwritten(self):
+        for (entries, d) in self._writing:
+            for e in entries:
+                yield e
+        for e in self._queue:
+            yield e
+
+    def merge(self, rows, limit, user_name=None):
+        """ Add the entries not yet written to log rows read from the
+        DB, for the given user or for all users, and return the newest
+        limit rows, newest first.  Entries being written may already be
+        in rows; those are not repeated. """
+        in_rows = collections.Counter((r['log_who_name'], r['log_which'],
+            r['log_ip'], r['log_when']) for r in rows)
+        unwritten = []
+        for e in self._unwritten():
+            if user_name is not None and e[0] != user_name:
+                continue
+            if in_rows[e] > 0:
+                in_rows[e] -= 1
+            else:
+                unwritten.append(dict(zip(_fields, e)))
+        if not unwritten:
+            return rows
+        unwritten.reverse()
+        ret = unwritten + list(rows)
+        ret.sort(key=lambda r: r['log_when'], reverse=True)
+        return ret[0:limit]
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
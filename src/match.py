@@ -396,7 +396,7 @@ class Challenge(Offer, MatchStringParser):
                 (b.name,))
             return
 
-        if not formula.check_formula(self, b.vars_['formula']):
+        if not formula.check_user_formula(self, b):
             a.write_('Match request does not meet formula for %s:\n', b.name)
             b.write_('Ignoring (formula): %s\n', challenge_str)
             return
@@ -17,6 +17,7 @@
 #
 
 import global_
+import broadcast
 from twisted.internet import defer
 
 
@@ -84,8 +85,7 @@ def notify_pin(user, arrived):
             pin_ivar_str = '\n<wa> %s 001222 1326P1169P0P0P0P0P0P0P\n' % user.name
         else:
             pin_ivar_str = '\n<wd> %s\n' % user.name
-        for u in global_.online.pin_ivar:
-            u.write_nowrap(pin_ivar_str, prompt=True)
+        broadcast.write_nowrap(global_.online.pin_ivar, pin_ivar_str)
 
     if global_.online.pin_var:
         if arrived:
@@ -97,10 +97,12 @@ def notify_pin(user, arrived):
             admin_pin_var_str = '\n[%s (%s: %s) has connected.]\n' % (user.name, reg_flag, user.session.conn.ip)
         else:
             pin_var_str = '\n[%s has disconnected.]\n' % user.name
-        for u in global_.online.pin_var:
-            if u.is_admin() and arrived:
-                u.write_nowrap(admin_pin_var_str, prompt=True)
-            else:
-                u.write_nowrap(pin_var_str, prompt=True)
+        if arrived:
+            admins = [u for u in global_.online.pin_var if u.is_admin()]
+            broadcast.write_nowrap(admins, admin_pin_var_str)
+            broadcast.write_nowrap([u for u in global_.online.pin_var
+                if not u.is_admin()], pin_var_str)
+        else:
+            broadcast.write_nowrap(global_.online.pin_var, pin_var_str)
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -31,9 +31,9 @@ class InternalException(Exception):
 
 
 import alias
-import trie
 import block
 import block_codes
+import timer
 
 _command_re = re.compile(r'^(\S+)(?:\s+(.*))?$')
 
@@ -57,6 +57,7 @@ def _do_parse(s, conn):
         s = s[2:].lstrip()
     else:
         conn.session.last_command_time = time.time()
+        timer.schedule_idle(conn.session)
         conn.user.vars_['busy'] = None
         if conn.session.idlenotified_by:
             for u in conn.session.idlenotified_by:
@@ -90,8 +91,8 @@ def _do_parse(s, conn):
 
     if expand_aliases:
         try:
-            s = alias.expand(s, alias.system,
-                conn.user.aliases, conn.user)
+            s = alias.expand(s, alias.system_compiled,
+                conn.user.compiled_aliases, conn.user)
         except alias.AliasError as e:
             if e.reason:
                 conn.write(e.reason)
@@ -106,24 +107,18 @@ def _do_parse(s, conn):
     assert(m)
     word = m.group(1).lower()
     cmds = conn.session.commands
-    try:
-        cmd = cmds[word]
-    except KeyError:
+    (cmd, matches) = cmds.lookup(word)
+    if matches:
+        conn.write(_("""Ambiguous command "%(cmd)s". Matches: %(matches)s\n""")
+            % {'cmd': word, 'matches':
+                ' '.join([c.name for c in matches])})
+        ret = block_codes.BLKCMD_ERROR_AMBIGUOUS
+    elif not cmd:
         conn.write(_("%s: Command not found.\n") % word)
         ret = block_codes.BLKCMD_ERROR_BADCOMMAND
-    except trie.NeedMore:
-        matches = cmds.all_children(word)
-        assert(len(matches) > 0)
-        if len(matches) == 1:
-            cmd = matches[0]
-        else:
-            conn.write(_("""Ambiguous command "%(cmd)s". Matches: %(matches)s\n""")
-                % {'cmd': word, 'matches':
-                    ' '.join([c.name for c in matches])})
-            ret = block_codes.BLKCMD_ERROR_AMBIGUOUS
     if cmd:
         try:
-            args = parse_args(m.group(2), cmd.param_str)
+            args = cmd.parse_params(m.group(2))
             d = cmd.run(args, conn)
         except BadCommandError:
             ret = block_codes.BLKCMD_ERROR_BADCOMMAND
@@ -159,79 +154,99 @@ def parse(s, conn):
     return d
 
 
-def parse_args(s, param_str):
-    args = []
-    for c in param_str:
-        if c in ['d', 'i', 'w', 'W', 'f']:
-            # required argument
-            if s is None:
-                raise BadCommandError()
-            else:
-                s = s.lstrip()
-                m = re.split(r'\s', s, 1)
-                assert(len(m) > 0)
-                param = m[0]
-                if len(param) == 0:
-                    raise BadCommandError()
-                if c == c.lower():
-                    param = param.lower()
-                if c in ['i', 'd']:
-                    # integer or word
-                    try:
-                        param = int(param, 10)
-                    except ValueError:
-                        if c == 'd':
-                            raise BadCommandError()
-                elif c == 'f':
-                    try:
-                        param = float(param)
-                    except ValueError:
-                        raise BadCommandError()
-                s = m[1] if len(m) > 1 else None
-        elif c in ['o', 'O', 'n', 'p']:
-            # optional argument
-            if s is None:
-                param = None
-            else:
-                s = s.lstrip()
-                m = re.split(r'\s', s, 1)
-                assert(len(m) > 0)
-                param = m[0]
-                if c == c.lower():
-                    param = param.lower()
-                if len(param) == 0:
-                    param = None
-                    assert(len(m) == 1)
-                elif c in ['n', 'p']:
-                    try:
-                        param = int(param, 10)
-                    except ValueError:
-                        if c == 'p':
-                            raise BadCommandError()
-                s = m[1] if len(m) > 1 else None
-        elif c == 'S':
-            # string to end
-            if s is None or len(s) == 0:
-                raise BadCommandError()
-            param = s
-            s = None
-        elif c == 'T' or c == 't':
-            # optional string to end
-            if s is None or len(s) == 0:
-                param = None
-            else:
-                param = s
-                if c == 't':
-                    param = param.lower()
-            s = None
-        else:
-            raise InternalException()
-        args.append(param)
+# regular expressions for each kind of parameter; see command/command.py
+_required_word_re = r'\s*(\S+)(?:\s|\Z)'
+# an optional word is missing only if nothing but whitespace is left
+_optional_word_re = r'(?:\s*(\S+)(?:\s|\Z)|\s*\Z)'
+_required_string_re = r'([\s\S]+)\Z'
+_optional_string_re = r'([\s\S]*)\Z'
+
+
+def _to_int(param):
+    try:
+        return int(param, 10)
+    except ValueError:
+        raise BadCommandError()
+
+
+def _to_int_or_word(param):
+    try:
+        return int(param, 10)
+    except ValueError:
+        return param
 
-    if not (s is None or re.match(r'^\s*$', s)):
-        # extraneous data at the end
+
+def _to_float(param):
+    try:
+        return float(param)
+    except ValueError:
         raise BadCommandError()
 
-    return args
+# code -> (regular expression, whether to lower-case, converter)
+_param_codes = {
+    'w': (_required_word_re, True, None),
+    'W': (_required_word_re, False, None),
+    'd': (_required_word_re, True, _to_int),
+    'i': (_required_word_re, True, _to_int_or_word),
+    'f': (_required_word_re, True, _to_float),
+    'o': (_optional_word_re, True, None),
+    'O': (_optional_word_re, False, None),
+    'p': (_optional_word_re, True, _to_int),
+    'n': (_optional_word_re, True, _to_int_or_word),
+    'S': (_required_string_re, False, None),
+    'T': (_optional_string_re, False, None),
+    't': (_optional_string_re, True, None),
+}
+
+
+def compile_param_str(param_str):
+    """ Make a function that parses the arguments of a command with
+    the given parameter format.  The function takes the text after the
+    command name, or None if there is none, and returns a list of
+    arguments; it raises BadCommandError if the text does not fit the
+    format. """
+    pattern = []
+    convs = []
+    for (i, c) in enumerate(param_str):
+        try:
+            (param_re, lower, conv) = _param_codes[c]
+        except KeyError:
+            raise InternalException()
+        if c in ['S', 'T', 't'] and i != len(param_str) - 1:
+            # a string to the end must be the last parameter
+            raise InternalException()
+        pattern.append(param_re)
+        convs.append((lower, c in ['T', 't'], conv))
+    pattern.append(r'\s*\Z')
+    param_re = re.compile(''.join(pattern))
+
+    # the arguments when there is no text
+    if any(c in ['d', 'i', 'w', 'W', 'f', 'S'] for c in param_str):
+        no_args = None
+    else:
+        no_args = [None] * len(param_str)
+
+    def parse_params(s):
+        if s is None:
+            if no_args is None:
+                raise BadCommandError()
+            return list(no_args)
+        m = param_re.match(s)
+        if not m:
+            raise BadCommandError()
+        args = []
+        for (param, (lower, to_end, conv)) in zip(m.groups(), convs):
+            if param is not None:
+                if to_end and len(param) == 0:
+                    param = None
+                else:
+                    if lower:
+                        param = param.lower()
+                    if conv:
+                        param = conv(param)
+            args.append(param)
+        return args
+
+    return parse_params
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
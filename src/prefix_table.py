@@ -0,0 +1,94 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Name lookup by unique prefix, for tables that rarely change, such
+as commands and variables. """
+
+from trie import NeedMore
+
+
+class PrefixTable(object):
+    """ A mapping from names to values that can also be looked up by
+    any prefix of a name.  Every prefix is stored in a dict, so a lookup
+    is a single dict access.  The dict is rebuilt the first time
+    it is used after a name is added or removed; names are only
+    added at startup and when code is reloaded. """
+    def __init__(self):
+        self._items = {}
+        self._prefixes = None
+
+    def __setitem__(self, k, v):
+        self._items[k] = v
+        self._prefixes = None
+
+    def __delitem__(self, k):
+        del self._items[k]
+        self._prefixes = None
+
+    def __getitem__(self, k):
+        """ Look up an exact name. """
+        return self._items[k]
+
+    def __contains__(self, k):
+        return k in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def itervalues(self):
+        """ Yield values in order of name. """
+        for k in sorted(self._items):
+            yield self._items[k]
+
+    def _build(self):
+        """ Map each prefix to the value with that name, or to the value
+        with the only name starting with the prefix, or else to the list
+        of values with names starting with the prefix. """
+        matches = {}
+        for k in sorted(self._items):
+            for i in range(1, len(k) + 1):
+                matches.setdefault(k[0:i], []).append(self._items[k])
+        prefixes = {}
+        for (p, vals) in matches.iteritems():
+            if p in self._items:
+                prefixes[p] = (self._items[p], None)
+            elif len(vals) == 1:
+                prefixes[p] = (vals[0], None)
+            else:
+                prefixes[p] = (None, vals)
+        self._prefixes = prefixes
+
+    def lookup(self, k):
+        """ Look up a name or prefix.  Returns (value, None) if there is
+        a match, (None, matches) if the prefix is ambiguous, and
+        (None, None) if nothing matches. """
+        if self._prefixes is None:
+            self._build()
+        return self._prefixes.get(k, (None, None))
+
+    def get(self, k):
+        """ Like lookup(), but raises KeyError if nothing matches and
+        NeedMore if the prefix is ambiguous, like Trie.get(). """
+        (v, matches) = self.lookup(k)
+        if matches is not None:
+            raise NeedMore(matches)
+        if v is None:
+            raise KeyError(k)
+        return v
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
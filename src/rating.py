@@ -93,9 +93,10 @@ class NoRating(object):
         return 0
 
 
-def update_ratings(game, white_score, black_score):
-    """Update the ratings for both players after a game.  Return a
-    Deferrred."""
+def update_ratings(game, white_score, black_score, completion):
+    """Update the ratings for both players after a game.  The new
+    ratings are added to the game's completion, to be saved with
+    the game."""
     wp = glicko2.Player(game.white_rating.glicko2_rating(),
         game.white_rating.glicko2_rd(), game.white_rating.volatility,
         game.white_rating.ltime)
@@ -134,13 +135,12 @@ def update_ratings(game, white_score, black_score):
 
     ltime = datetime.datetime.utcnow()
 
-    d1 = game.white.set_rating(game.speed_variant,
+    completion.ratings.append(game.white.update_rating(game.speed_variant,
         white_rating, white_rd, wp.vol,
-        white_win, white_loss, white_draw, ltime)
-    d2 = game.black.set_rating(game.speed_variant,
+        white_win, white_loss, white_draw, ltime))
+    completion.ratings.append(game.black.update_rating(game.speed_variant,
         black_rating, black_rd, bp.vol,
-        black_win, black_loss, black_draw, ltime)
-    return defer.DeferredList([d1, d2])
+        black_win, black_loss, black_draw, ltime))
 
 
 @defer.inlineCallbacks
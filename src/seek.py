@@ -23,33 +23,16 @@ import speed_variant
 import global_
 import game
 import formula
+import broadcast
 
 from match import MatchStringParser, MatchError
 from game_constants import WHITE, BLACK
 from twisted.internet import defer
 
-# Wait 90 seconds after a seek ends to reuse its seek number
-# (this is the value GICS uses; original FICS is likely the
-# same or similar)
-EXPIRE_DELAY = 90
-
 """ Max number of seeks per user. """
 LIMIT = 3
 
 
-def find_free_slot():
-    """ Find the first available seek number. """
-    # This is O(n) in the number of games, but it's simple and should
-    # be more than efficient enough.
-    i = 1
-    expiration_time = time.time() - EXPIRE_DELAY
-    while True:
-        if i not in global_.seeks or (global_.seeks[i].expired
-                and global_.seeks[i].expired_time <= expiration_time):
-            return i
-        i += 1
-
-
 def find_matching(seek):
     """ Find all seeks that match a given seek.  Returns a list of
     matching auto seeks and a list of matching manual seeks. """
@@ -57,7 +40,7 @@ def find_matching(seek):
     # Would that lead to starvation of seeks with a high number?
     auto_matches = []
     manual_matches = []
-    for s in global_.seeks.values():
+    for s in global_.seeks.candidates(seek):
         if seek.matches(s):
             if (not seek.a.censor_or_noplay(s.a) and
                     s.check_formula(seek.a) and seek.check_formula(s.a)):
@@ -193,8 +176,7 @@ class Seek(MatchStringParser):
         assert(not self.expired)
 
         self.when_posted = time.time()
-        self.num = find_free_slot()
-        global_.seeks[self.num] = self
+        global_.seeks.add(self)
         self.a.session.seeks.append(self)
 
         # build the seek string
@@ -240,30 +222,26 @@ class Seek(MatchStringParser):
             self.speed_variant.legacy_str(), color_char, 0, 9999, auto_char,
             formula_char)
 
-        count = 0
-        for u in global_.online:
-            assert(u.is_online)
-            assert('formula' in u.vars_)
-            if not u.session.game:
-                # seekinfo
-                if u.session.ivars['seekinfo']:
-                    u.write_nowrap(seekinfo_str)
-
-                if u.vars_['seek']:
-                    # showownseek is both a variable and an ivariable
-                    if self.rated and (u.is_guest or u.is_ratedbanned):
-                        continue
-                    if not self.meets_formula_for(u):
-                        continue
-                    if not self.check_formula(u):
-                        continue
-                    if u.censor_or_noplay(self.a):
-                        continue
-                    if u == self.a and not (u.vars_['showownseek']
-                            and u.session.ivars['showownseek']):
-                        continue
-                    count += 1
-                    u.write_nowrap(seek_str, prompt=True)
+        # the users in these sets are online and not in a game
+        seek_users = []
+        for u in global_.online.seek_var:
+            # showownseek is both a variable and an ivariable
+            if self.rated and (u.is_guest or u.is_ratedbanned):
+                continue
+            if not self.meets_formula_for(u):
+                continue
+            if not self.check_formula(u):
+                continue
+            if u.censor_or_noplay(self.a):
+                continue
+            if u == self.a and not (u.vars_['showownseek']
+                    and u.session.ivars['showownseek']):
+                continue
+            seek_users.append(u)
+
+        broadcast.write_nowrap(global_.online.seekinfo_ivar, seekinfo_str,
+            prompt=False)
+        count = broadcast.write_nowrap(seek_users, seek_str)
 
         # set the string for use in the "sought" display
         self._str = '%3d %4s %-17s %3d %3d %-7s %-10s%-9s %4d-%4d%s' % (
@@ -283,7 +261,7 @@ class Seek(MatchStringParser):
         try:
             if self.formula:
                 #f = self.a.vars['formula']
-                if not formula.check_formula(self, self.b.vars_['formula']):
+                if not formula.check_user_formula(self, self.b):
                     return False
             return True
         finally:
@@ -296,7 +274,7 @@ class Seek(MatchStringParser):
         assert(self.b is None)
         self.b = b
         try:
-            return formula.check_formula(self, b.vars_['formula'])
+            return formula.check_user_formula(self, b)
         finally:
             self.b = None
 
@@ -312,15 +290,14 @@ class Seek(MatchStringParser):
         assert(self.expired)
 
     def remove(self):
-        assert(global_.seeks[self.num] == self)
         self.expired = True
         self.a.session.seeks.remove(self)
         self.expired_time = time.time()
+        global_.seeks.remove(self)
 
         # seekremove
-        for u in global_.online:
-            if u.session.ivars['seekremove'] and not u.session.game:
-                u.write_nowrap('<sr> %d\n' % self.num)
+        broadcast.write_nowrap(global_.online.seekremove_ivar,
+            '<sr> %d\n' % self.num, prompt=False)
 
     def __str__(self):
         return self._str
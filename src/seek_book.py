@@ -0,0 +1,115 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" The active seeks, indexed for matching. """
+
+import time
+import heapq
+import bisect
+import collections
+
+from game_constants import WHITE, BLACK
+
+# Wait 90 seconds after a seek ends to reuse its seek number
+# (this is the value GICS uses; original FICS is likely the
+# same or similar)
+EXPIRE_DELAY = 90
+
+_opp_side = {WHITE: BLACK, BLACK: WHITE, None: None}
+
+
+def _bucket_key(tags, side):
+    return (tuple(sorted(tags.items())), side)
+
+
+class SeekBook(object):
+    """ Active seeks by number, and grouped into buckets of seeks with
+    the same terms and color, so that a new seek only has to be
+    compared with the seeks in one bucket.  Seek numbers are reused,
+    lowest first, once they have been free for EXPIRE_DELAY
+    seconds. """
+    def __init__(self):
+        self._seeks = {}
+        # bucket key -> list of seeks, in the order posted
+        self._buckets = {}
+        # the seek numbers in use, sorted, and the seeks in the same
+        # order, for the "sought" command
+        self._nums = []
+        self._sorted = []
+        # seek numbers that can be reused now
+        self._free = []
+        # (time freed, number) for seek numbers that can't be reused yet
+        self._expiring = collections.deque()
+        # the next number to use when no old number is free
+        self._next_num = 1
+
+    def __contains__(self, num):
+        return num in self._seeks
+
+    def __getitem__(self, num):
+        return self._seeks[num]
+
+    def __len__(self):
+        return len(self._seeks)
+
+    def values(self):
+        """ All active seeks, in order of seek number. """
+        return list(self._sorted)
+
+    def _get_free_num(self):
+        expiration_time = time.time() - EXPIRE_DELAY
+        while self._expiring and self._expiring[0][0] <= expiration_time:
+            heapq.heappush(self._free, self._expiring.popleft()[1])
+        if self._free:
+            return heapq.heappop(self._free)
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def add(self, s):
+        """ Add a seek, assigning it the first available number. """
+        s.num = self._get_free_num()
+        self._seeks[s.num] = s
+        key = _bucket_key(s.tags, s.side)
+        self._buckets.setdefault(key, []).append(s)
+        i = bisect.bisect(self._nums, s.num)
+        self._nums.insert(i, s.num)
+        self._sorted.insert(i, s)
+
+    def remove(self, s):
+        """ Remove a seek that has expired. """
+        assert(self._seeks[s.num] is s)
+        del self._seeks[s.num]
+        key = _bucket_key(s.tags, s.side)
+        bucket = self._buckets[key]
+        bucket.remove(s)
+        if not bucket:
+            del self._buckets[key]
+        i = bisect.bisect_left(self._nums, s.num)
+        del self._nums[i]
+        del self._sorted[i]
+        self._expiring.append((s.expired_time, s.num))
+
+    def candidates(self, s):
+        """ The seeks that could match the given seek: those with the
+        same terms and the opposite color, if any, in the order they
+        were posted. """
+        return self._buckets.get(
+            _bucket_key(s.tags, _opp_side[s.side]), [])
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -25,6 +25,7 @@ import var
 import timeseal
 import partner
 import global_
+import timer
 
 from game_list import GameList
 
@@ -77,6 +78,7 @@ class Session(object):
             if u])
         for u in self.notified_online:
             u.session.notifiers_online.add(self.user)
+        timer.start_session(self)
 
     def get_idle_time(self):
         """ returns seconds """
@@ -92,6 +94,7 @@ class Session(object):
     def close(self):
         assert(not self.closed)
         self.closed = True
+        timer.end_session(self)
         # XXX this will not remove draw offers; game-related offers
         # should probably be saved when a game is adjourned
         for v in self.offers_sent[:]:
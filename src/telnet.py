@@ -31,12 +31,12 @@
 protocol.  Since the the goal is to be compatible with FICS clients,
 followed the server and not the RFC."""
 
-import textwrap
-
 from zope.interface import implements
-from twisted.internet import protocol, interfaces
+from twisted.internet import protocol, interfaces, reactor
 
 import utf8
+import wrap
+import config
 
 # telnet codes
 ECHO = chr(1)
@@ -57,6 +57,36 @@ IAC = chr(255)  # interpret as command
 
 BS = chr(8)  # backspace
 
+# Output is collected and sent once per reactor iteration; these count
+# the writes requested by the server and the writes actually made to
+# the underlying transports, so the difference is the number of write
+# system calls saved.  The rest count output thrown away for clients
+# that are not reading it.
+output_stats = {'fragments': 0, 'writes': 0, 'dropped_bytes': 0,
+    'dropped_writes': 0, 'slow_disconnects': 0}
+
+# the most output to pass to the underlying transport at once when
+# sending output that was held for a slow client
+HELD_CHUNK_SIZE = 16 * 1024
+
+
+class _OutputProducer(object):
+    """ Registered with the underlying transport, which pauses us when
+    its write buffer is full and resumes us when it has been sent. """
+    implements(interfaces.IPushProducer)
+
+    def __init__(self, telnet_transport):
+        self.telnet_transport = telnet_transport
+
+    def pauseProducing(self):
+        self.telnet_transport.output_paused()
+
+    def resumeProducing(self):
+        self.telnet_transport.output_resumed()
+
+    def stopProducing(self):
+        pass
+
 
 class TelnetTransport(protocol.Protocol):
     implements(interfaces.ITransport)
@@ -66,6 +96,18 @@ class TelnetTransport(protocol.Protocol):
     encoder = None
     send_IAC = True
     _wrapper = None
+    # output waiting to be flushed at the end of this reactor iteration
+    _pending = None
+    _flush_call = None
+    # While the underlying transport's buffer is full, output is held
+    # here as [data, supersede_key] pairs instead of being passed on.
+    _held = None
+    _held_bytes = 0
+    _held_keys = None
+    # whether low-priority output is being dropped
+    _shedding = False
+    _producer = None
+    _abort = False
 
     def __init__(self, protocolFactory=None, *a, **kw):
         self.commandMap = {
@@ -82,8 +124,16 @@ class TelnetTransport(protocol.Protocol):
             self.protocolKwArgs = kw
 
     def _write(self, bytes_):
+        """ Write raw bytes, such as a telnet command, immediately. """
+        if self._held is not None:
+            output_stats['fragments'] += 1
+            self._hold(bytes_, False, None)
+            return
+        self.flush()
         if self.encoder is not None:
             bytes_ = self.encoder(bytes_)
+        output_stats['fragments'] += 1
+        output_stats['writes'] += 1
         self.transport.write(bytes_)
 
     def do(self, option):
@@ -193,6 +243,9 @@ class TelnetTransport(protocol.Protocol):
 
     def connectionMade(self):
         self.transport.setTcpKeepAlive(True)
+        if interfaces.IConsumer.providedBy(self.transport):
+            self._producer = _OutputProducer(self)
+            self.transport.registerProducer(self._producer, True)
         if self.protocolFactory is not None:
             self.protocol = self.protocolFactory(*self.protocolArgs, **self.protocolKwArgs)
             try:
@@ -211,6 +264,12 @@ class TelnetTransport(protocol.Protocol):
             self.transport.resumeProducing()
 
     def connectionLost(self, reason):
+        if self._flush_call is not None and self._flush_call.active():
+            self._flush_call.cancel()
+        self._flush_call = None
+        self._pending = None
+        self._held = None
+        self._held_keys = None
         if self.protocol is not None:
             try:
                 self.protocol.connectionLost(reason)
@@ -234,39 +293,164 @@ class TelnetTransport(protocol.Protocol):
 
     def enableWrapping(self, width):
         """ Enable automatic word wrapping for this transport. """
-        # XXX this doesn't remove whitespace at the beginning of
-        # indented lines like original FICS
-        self._wrapper = textwrap.TextWrapper(
-            width=width, expand_tabs=True,
-            replace_whitespace=False, drop_whitespace=False,
-            break_long_words=True,
-            subsequent_indent=r'\   ')
+        self._wrapper = wrap.get_wrapper(width)
 
     def disableWrapping(self):
         self._wrapper = None
 
-    def write(self, data, wrap=True):
+    def render(self, data, wrap=True):
+        """ Return the bytes that writing the given text would send,
+        before zipseal encoding.  Transports with the same render_key()
+        render any text the same way. """
         if wrap and self._wrapper:
-            # we have to split the text into lines before
-            # wrapping
-            # relevant: http://bugs.python.org/issue1859
-            if type(data) == unicode:
-                udata = data
-            else:
-                udata = data.decode('utf-8')
-            wrapped_lines = [self._wrapper.fill(line)
-                for line in udata.splitlines(True)]
-            udata = ''.join(wrapped_lines)
-            data = udata.encode('utf-8')
-        if type(data) == unicode:
+            data = self._wrapper.wrap(data)
+        elif type(data) == unicode:
             data = data.encode('utf-8')
-        data = self._escape(data)
-        self._write(data)
+        return self._escape(data)
+
+    def render_key(self, wrap=True):
+        if wrap and self._wrapper:
+            return (self._wrapper.width, self.compatibility)
+        return (None, self.compatibility)
+
+    def write(self, data, wrap=True, low_priority=False, supersede=None):
+        self.write_rendered(self.render(data, wrap), low_priority, supersede)
+
+    def write_rendered(self, data, low_priority=False, supersede=None):
+        """ Queue output that has already been rendered by render().
+
+        If the client is not reading its output fast enough,
+        low-priority output may be dropped, and output with a
+        supersede key replaces any earlier output with the same
+        key that has not been sent yet. """
+        output_stats['fragments'] += 1
+        if self._held is not None:
+            self._hold(data, low_priority, supersede)
+        elif self._pending is None:
+            self._pending = [data]
+            if self.disconnecting:
+                # the connection may be closed before the next reactor
+                # iteration, so don't wait
+                self.flush()
+            else:
+                self._flush_call = reactor.callLater(0, self.flush)
+        else:
+            self._pending.append(data)
 
     def writeSequence(self, seq):
-        self.transport.writeSequence(seq)
+        for data in seq:
+            self.write(data)
+
+    def flush(self):
+        """ Encode and send all pending output in one write. """
+        if self._flush_call is not None:
+            if self._flush_call.active():
+                self._flush_call.cancel()
+            self._flush_call = None
+        if not self._pending:
+            return
+        data = ''.join(self._pending)
+        self._pending = None
+        if self.encoder is not None:
+            data = self.encoder(data)
+        output_stats['writes'] += 1
+        self.transport.write(data)
+
+    def _drop(self, data):
+        output_stats['dropped_bytes'] += len(data)
+        output_stats['dropped_writes'] += 1
+
+    def _hold(self, data, low_priority, supersede):
+        """ Keep output for a client whose transport buffer is full. """
+        if low_priority and self._shedding:
+            self._drop(data)
+            return
+        if supersede is not None:
+            i = self._held_keys.get(supersede)
+            if i is not None:
+                old = self._held[i][0]
+                self._held_bytes -= len(old)
+                self._held[i][0] = ''
+                self._drop(old)
+            self._held_keys[supersede] = len(self._held)
+        self._held.append([data, supersede])
+        self._held_bytes += len(data)
+
+        if self._held_bytes > config.output_high_water:
+            self._shedding = True
+        if (config.output_disconnect_limit is not None
+                and self._held_bytes > config.output_disconnect_limit
+                and not self._abort and not self.disconnecting):
+            self._abort = True
+            output_stats['slow_disconnects'] += 1
+            # don't disconnect in the middle of sending output, which
+            # could be a loop over the users who are online
+            reactor.callLater(0, self.protocol.loseConnection,
+                'slow client')
+
+    def output_paused(self):
+        """ Called when the underlying transport's buffer is full. """
+        if self._held is None and not self.disconnecting:
+            self._held = []
+            self._held_keys = {}
+            self._held_bytes = 0
+
+    def output_resumed(self):
+        """ Called when the underlying transport's buffer has been sent.
+        Send held output until the buffer is full again. """
+        held = self._held
+        if held is None:
+            return
+        self._held = None
+        self._held_keys = None
+        self._held_bytes = 0
+        self._shedding = False
+        i = 0
+        while i < len(held):
+            chunk = []
+            size = 0
+            while i < len(held) and size < HELD_CHUNK_SIZE:
+                chunk.append(held[i][0])
+                size += len(held[i][0])
+                i += 1
+            data = ''.join(chunk)
+            if self.encoder is not None:
+                data = self.encoder(data)
+            output_stats['writes'] += 1
+            self.transport.write(data)
+            if self._held is not None:
+                # paused again; keep the rest
+                break
+        if i < len(held):
+            rest = held[i:]
+            self._held = rest
+            self._held_keys = {}
+            for (j, (data, key)) in enumerate(rest):
+                self._held_bytes += len(data)
+                if key is not None:
+                    self._held_keys[key] = j
+            self._shedding = self._held_bytes > config.output_low_water
 
     def loseConnection(self):
+        self.disconnecting = True
+        self.flush()
+        if self._producer is not None:
+            self._producer = None
+            if self._abort and hasattr(self.transport, 'abortConnection'):
+                # there is no point waiting for a slow client to read
+                # the rest of its output
+                self.transport.abortConnection()
+                return
+            held = self._held
+            self._held = None
+            if held:
+                data = ''.join([d for (d, key) in held])
+                if self.encoder is not None:
+                    data = self.encoder(data)
+                output_stats['writes'] += 1
+                self.transport.write(data)
+            # the transport will not close while a producer is registered
+            self.transport.unregisterProducer()
         self.transport.loseConnection()
 
     def getHost(self):
@@ -34,11 +34,16 @@ def hms_words(secs, round_secs=False):
     return ret
 
 
-def hms(secs, user=None):
+def hms(secs, user=None, ms=None):
+    """ Format a time, with milliseconds if ms is true.  If ms is not
+    given, milliseconds are shown unless the user has the ms ivar
+    unset. """
     (hours, secs) = divmod(secs, 3600)
     (mins, secs) = divmod(secs, 60)
 
-    if not user or user.session.ivars['ms']:
+    if ms is None:
+        ms = not user or user.session.ivars['ms']
+    if ms:
         if hours != 0:
             ret = '%d:%02d:%06.3f' % (hours, mins, secs)
         else:
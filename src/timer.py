@@ -16,51 +16,151 @@
 # along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from twisted.internet import defer
+""" Periodic work: idle timeouts and pinging timeseal and zipseal
+clients.
+
+Idle timeouts and pings are kept in a timing wheel, so each heartbeat
+only looks at the sessions that are due, instead of every user
+online. """
 
 import time
+import math
 
-import global_
 import config
 
-from game_constants import PLAYED
+# seconds between calls to heartbeat()
+heartbeat_timeout = 1
 
-heartbeat_timeout = 10
+# seconds between pings of each capable client
+ping_interval = 10
 
 
-def heartbeat():
-    dlist = []
+class TimingWheel(object):
+    """ A hashed timing wheel: each key is scheduled to be due at some
+    time, rounded up to the next tick, and is stored in the slot for
+    that tick.  Scheduling and cancelling take constant time, and
+    advancing the wheel only looks at the slots for the ticks that
+    have passed.  A key due more than one revolution ahead stays in
+    its slot until the wheel comes around to it again. """
+    def __init__(self, tick, size):
+        self.tick = tick
+        self.size = size
+        self._slots = [{} for i in range(size)]
+        # the slot index of each key
+        self._where = {}
+        # the number of the next tick to be processed
+        self._next_tick = None
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def schedule(self, key, when, func):
+        """ Arrange for func() to be returned by advance() once the time
+        is at least when, replacing any earlier schedule for the
+        key. """
+        self.cancel(key)
+        t = int(math.ceil(when / self.tick))
+        if self._next_tick is not None and t < self._next_tick:
+            t = self._next_tick
+        i = t % self.size
+        self._slots[i][key] = (t, func)
+        self._where[key] = i
+
+    def cancel(self, key):
+        i = self._where.pop(key, None)
+        if i is not None:
+            del self._slots[i][key]
+
+    def advance(self, now):
+        """ Remove the keys that are due and return their functions. """
+        cur = int(now // self.tick)
+        if self._next_tick is None:
+            self._next_tick = cur
+        due = []
+        # after a long pause, one revolution visits every slot
+        for t in xrange(max(self._next_tick, cur - self.size + 1), cur + 1):
+            slot = self._slots[t % self.size]
+            if not slot:
+                continue
+            for (key, (due_tick, func)) in slot.items():
+                if due_tick <= cur:
+                    del slot[key]
+                    del self._where[key]
+                    due.append(func)
+        self._next_tick = cur + 1
+        return due
+
+wheel = TimingWheel(heartbeat_timeout, 1024)
+
+# Used to give each new session a different phase, so that pings are
+# sent evenly over the interval instead of all at once.
+_ping_phase = 0
+
+
+def _is_pingable(session):
+    return session.use_zipseal or (session.use_timeseal and
+        session.timeseal_version == 2)
+
 
-    # idle timeout
+def start_session(session):
+    """ Start idle timeouts and pings for a session that has just
+    logged in. """
+    global _ping_phase
+    schedule_idle(session)
+    if _is_pingable(session):
+        # FICS timeseal 2 seems to ping all capable clients every 10
+        # seconds; we do the same, but not in the same second
+        ticks = int(ping_interval // heartbeat_timeout) or 1
+        _ping_phase = (_ping_phase + 1) % ticks
+        wheel.schedule(('ping', session),
+            time.time() + (_ping_phase + 1) * heartbeat_timeout,
+            lambda: _ping(session))
+
+
+def end_session(session):
+    wheel.cancel(('idle', session))
+    wheel.cancel(('ping', session))
+
+
+def schedule_idle(session):
+    """ Reschedule the idle timeout for a session, after its last
+    command time has changed. """
     if config.idle_timeout:
-        now = time.time()
-        for u in global_.online:
-            if (now - u.session.last_command_time > config.idle_timeout and
-                    not u.is_admin() and
-                    not u.has_title('TD')):
-                u.session.conn.idle_timeout(config.idle_timeout // 60)
-
-    # ping all zipseal clients
-    # I wonder if it would be better to spread out the pings in time,
-    # rather than sending a large number of ping requests all at once.
-    # However, this method is simple, and FICS timeseal 2 seems to do it
-    # this way (pinging all capable clients every 10 seconds).
-    for u in global_.online:
-        if u.session.use_zipseal or (u.session.use_timeseal and u.session.timeseal_version == 2):
-            u.session.ping()
-
-    # forfeit games on time
-    for g in global_.games.values():
-        if g.gtype == PLAYED and g.clock.is_ticking:
-            u = g.get_user_to_move()
-            opp = g.get_opp(u)
-            if opp.vars_['autoflag']:
-                # TODO: send auto-flagging message a la original fics.
-                d = g.clock.check_flag(g, g.get_user_side(u))
-                if d:
-                    dlist.append(d)
-
-    if dlist:
-        return defer.DeferredList(dlist)
+        wheel.schedule(('idle', session),
+            session.last_command_time + config.idle_timeout,
+            lambda: _check_idle(session))
+
+
+def _check_idle(session):
+    u = session.user
+    if session.closed or not u.is_online:
+        return
+    now = time.time()
+    if now - session.last_command_time <= config.idle_timeout:
+        schedule_idle(session)
+    elif u.is_admin() or u.has_title('TD'):
+        # check again later, in case the user loses the exemption
+        wheel.schedule(('idle', session), now + config.idle_timeout,
+            lambda: _check_idle(session))
+    else:
+        session.conn.idle_timeout(config.idle_timeout // 60)
+
+
+def _ping(session):
+    if session.closed or not session.user.is_online:
+        return
+    session.ping()
+    wheel.schedule(('ping', session), time.time() + ping_interval,
+        lambda: _ping(session))
+
+
+def heartbeat():
+    """ Handle the idle timeouts and pings that are due.  Games are
+    not checked here; each clock schedules its own flag check. """
+    for func in wheel.advance(time.time()):
+        func()
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -17,8 +17,11 @@
 #
 
 import re
+import binascii
 import subprocess
 
+import config
+
 # the difference between timeseal 1 and 2 is that the
 # timeseal 1 ping always comes at the beginning of a line,
 # whereas timeseal 2's ping can come at any point
@@ -32,16 +35,194 @@ class TimesealError(Exception):
     pass
 
 
+_timeseal_key = 'Timestamp (FICS) v1.0 - programmed by Henrik Gram.'
+# the key with the high bit of each byte flipped, repeated enough times
+# to cover the longest line we accept
+_timeseal_keystream = ''.join(chr(ord(c) ^ 0x80) for c in
+    _timeseal_key) * 22
+# adds 32 to every byte, modulo 256
+_timeseal_add32 = ''.join(chr((i + 32) & 0xff) for i in range(256))
+_timeseal_ts_re = re.compile(r'^\d+$')
+# timestamps that strtol() accepts, even though they are not plain digits
+_timeseal_strtol_re = re.compile(r'^\s*[+-]?\d*$')
+_zipseal_ts_re = re.compile(r'^[0-9a-f]+$')
+
+
+def decode_timeseal_line(line):
+    """ Decode a line from a timeseal 1 or 2 client without using the
+    external openseal_decoder program.  This is a port of
+    timeseal/openseal_decoder.c that gives the same results as the
+    Timeseal.decode_timeseal() subprocess path.  Returns a
+    (timestamp, message) tuple; the timestamp is 0 for a line that
+    is not timeseal-encoded, and -1 for a line that could not be
+    decoded. """
+    l = len(line)
+    if l % 12 != 1:
+        return (0, line)
+    # The last byte is the offset into the key; the decoder program
+    # decodes it along with the rest of the line, but it does not
+    # contribute to the message.
+    l -= 1
+    start = (ord(line[l]) - 0x80) % 50
+    if l == 0:
+        return (0, line)
+
+    # Decode the whole line at once using C-level string and long
+    # operations, rather than looping over the bytes in Python.
+    data = line[0:l].translate(_timeseal_add32)
+    data = int(binascii.hexlify(data), 16) ^ int(binascii.hexlify(
+        _timeseal_keystream[start:start + l]), 16)
+    data = bytearray(binascii.unhexlify('%0*x' % (2 * l, data)))
+
+    # undo the swaps within each 12-byte block
+    data[0::12], data[11::12] = data[11::12], data[0::12]
+    data[2::12], data[9::12] = data[9::12], data[2::12]
+    data[4::12], data[7::12] = data[7::12], data[4::12]
+    data = str(data)
+
+    # the decoder program treats the decoded line as a C string
+    nul = data.find('\x00')
+    if nul >= 0:
+        data = data[0:nul]
+    time_start = data.find('\x18')
+    if time_start < 0:
+        return (0, line)
+    time_end = data.find('\x19', time_start + 1)
+    if time_end < 0:
+        return (0, line)
+    ts = data[time_start + 1:time_end]
+    if not _timeseal_ts_re.match(ts):
+        if _timeseal_strtol_re.match(ts):
+            return (-1, None)
+        return (0, line)
+    msg = data[0:time_start]
+    if '\n' in msg:
+        return (-1, None)
+    return (int(ts, 10), msg)
+
+
+def decode_zipseal_line(line):
+    """ Decode a line from a zipseal client without using the external
+    zipseal_decoder program.  Returns a (timestamp, message) tuple;
+    the timestamp is -1 for a line that could not be decoded. """
+    if not isinstance(line, str):
+        line = line.encode('utf-8')
+    nul = line.find('\x00')
+    if nul >= 0:
+        line = line[0:nul]
+    time_start = line.rfind('\x18')
+    if time_start < 0:
+        return (-1, None)
+    ts = line[time_start + 1:]
+    if not _zipseal_ts_re.match(ts):
+        return (-1, None)
+    t = int(ts, 16)
+    if t == 0:
+        return (-1, None)
+    return (t, line[0:time_start])
+
+# Huffman code lengths for each byte value, plus EOF; copied from
+# timeseal/codes.c, which is generated by timeseal/maketable
+_zipseal_code_lens = (
+    19, 17, 19, 19, 19, 19, 19, 10, 19, 19, 6, 19, 19, 6, 19, 19,
+    19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    2, 11, 9, 12, 16, 7, 16, 10, 7, 7, 12, 10, 10, 4, 8, 8,
+    5, 5, 6, 7, 7, 7, 7, 7, 7, 7, 7, 13, 8, 8, 8, 11,
+    15, 11, 8, 8, 9, 9, 10, 8, 12, 10, 9, 9, 10, 9, 8, 11,
+    6, 9, 7, 9, 9, 12, 10, 9, 11, 12, 12, 10, 9, 10, 15, 8,
+    17, 5, 7, 6, 6, 5, 6, 7, 6, 5, 9, 8, 6, 7, 5, 5,
+    6, 9, 6, 5, 5, 6, 8, 8, 9, 7, 11, 13, 11, 13, 15, 19,
+    19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    19, 19, 19, 19, 18, 18, 18, 18, 18, 14, 18, 18, 18, 18, 18, 17,
+    19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 18, 17, 19, 19, 17,
+    19, 19, 19, 16, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    19, 19, 14, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19, 19,
+    18)
+_ZIPSEAL_EOF = 256
+
+
+def _make_zipseal_codes():
+    """ Assign canonical Huffman codes in the same way as
+    AssignCanonicalCodes() in timeseal/chuffman.c.  Returns a list
+    mapping each symbol to its code, as a string of '0' and '1'
+    characters. """
+    cl = sorted((codelen, value) for (value, codelen) in
+        enumerate(_zipseal_code_lens))
+    codes = [None] * len(cl)
+    code = 0
+    length = cl[-1][0]
+    for (codelen, value) in reversed(cl):
+        if codelen == 0:
+            break
+        if codelen < length:
+            code >>= length - codelen
+            length = codelen
+        codes[value] = bin(code)[2:].zfill(length)
+        code += 1
+    return codes
+
+_zipseal_codes = _make_zipseal_codes()
+_zipseal_char_codes = dict((chr(i), _zipseal_codes[i]) for i in range(256))
+
+
+class ZipsealEncoder(object):
+    """ Encodes output for one zipseal connection.  Each connection has
+    its own encoder, so writes are encoded in this process without
+    waiting on a shared encoder program, and there is no limit on
+    the length of a write. """
+
+    def __init__(self, compress=None):
+        """ If compress is true, output is compressed with the same
+        canonical Huffman code as timeseal/chuffman.c, for clients
+        built with COMPRESS defined; otherwise output is sent
+        unchanged, as by timeseal/zipseal_encoder. """
+        if compress is None:
+            compress = config.zipseal_compress
+        self.compress = compress
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def encode(self, data):
+        if type(data) == unicode:
+            data = data.encode('utf-8')
+        self.bytes_in += len(data)
+        if self.compress:
+            data = self._huffman_encode(data)
+        self.bytes_out += len(data)
+        return data
+
+    def encode_sequence(self, seq):
+        """ Encode a batch of writes as a single unit. """
+        return self.encode(''.join(seq))
+
+    def _huffman_encode(self, data):
+        codes = _zipseal_char_codes
+        bits = ''.join([codes[c] for c in data])
+        bits += _zipseal_codes[_ZIPSEAL_EOF]
+        # pad with zero bits to a whole number of bytes
+        count = (len(bits) + 7) // 8
+        bits = bits.ljust(8 * count, '0')
+        return binascii.unhexlify('%0*x' % (2 * count, int(bits, 2)))
+
+
 class Timeseal(object):
     _timeseal_pat = re.compile(r'''^(\d+): (.*)\n$''')
     _zipseal_pat = re.compile(r'''^([0-9a-f]+): (.*)\n$''')
-    #zipseal_in = 0
-    #zipseal_out = 0
+    timeseal_decoder = None
+    zipseal_decoder = None
 
-    def __init__(self):
-        self.start_timeseal_decoder()
-        self.start_zipseal_decoder()
-        self.zipseal_encoder = subprocess.Popen(['timeseal/zipseal_encoder'], stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+    def __init__(self, inprocess=None):
+        """ If inprocess is true, lines are decoded in this process;
+        otherwise they are sent to the external decoder programs. """
+        if inprocess is None:
+            inprocess = config.timeseal_inprocess
+        self.inprocess = inprocess
+        if not self.inprocess:
+            self.start_timeseal_decoder()
+            self.start_zipseal_decoder()
         self._last_timeseal_line = None
         self._last_zipseal_line = None
 
@@ -52,6 +233,18 @@ class Timeseal(object):
         self.zipseal_decoder = subprocess.Popen(['timeseal/zipseal_decoder'], stdout=subprocess.PIPE, stdin=subprocess.PIPE)
 
     def decode_timeseal(self, line):
+        if self.inprocess:
+            return decode_timeseal_line(line)
+        return self.decode_timeseal_subprocess(line)
+
+    def decode_zipseal(self, line):
+        if self.inprocess:
+            return decode_zipseal_line(line)
+        return self.decode_zipseal_subprocess(line)
+
+    def decode_timeseal_subprocess(self, line):
+        if self.timeseal_decoder is None:
+            self.start_timeseal_decoder()
         # the decoder process will die if it gets a line that is too long
         assert(len(line) <= 1022)
         try:
@@ -71,7 +264,9 @@ class Timeseal(object):
             return (-1, None)
         return (int(m.group(1), 10), m.group(2))
 
-    def decode_zipseal(self, line):
+    def decode_zipseal_subprocess(self, line):
+        if self.zipseal_decoder is None:
+            self.start_zipseal_decoder()
         if not isinstance(line, str):
             line = line.encode('utf-8')
         # the decoder process will die if it gets a line that is too long
@@ -91,21 +286,6 @@ class Timeseal(object):
             return (-1, None)
         return (int(m.group(1), 16), m.group(2))
 
-    def compress_zipseal(self, line):
-        try:
-            line = line[0:1023]  # XXX
-            self.zipseal_encoder.stdin.write('%04x%s' % (len(line), line))
-            count_str = self.zipseal_encoder.stdout.read(4)
-            count = int(count_str, 16)
-            ret = self.zipseal_encoder.stdout.read(count)
-        except IOError:
-            ret = None
-        else:
-            pass
-            #self.zipseal_in += len(line)
-            #self.zipseal_out += len(ret)
-        return ret
-
     _timeseal_1_re = re.compile('TIMESTAMP\|(.+?)\|(.+?)\|')
     _timeseal_2_re = re.compile('TIMESEAL2\|(.+?)\|(.+?)\|')
     def check_hello(self, line, conn):
@@ -135,18 +315,11 @@ class Timeseal(object):
             conn.session.use_zipseal = True
             conn.session.timeseal_acc = m.group(3)
             conn.session.timeseal_system = m.group(4)
-            conn.transport.encoder = self.compress_zipseal
+            conn.transport.encoder = ZipsealEncoder().encode
             return True
 
         return False
 
-    '''def print_stats(self):
-        return
-        if self.zipseal_in > 0:
-            print("compression statistics: %d in, %d out, ratio = %.3f" %
-                (self.zipseal_in, self.zipseal_out,
-                    float(self.zipseal_out) / self.zipseal_in))'''
-
 timeseal = Timeseal()
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
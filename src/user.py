@@ -31,6 +31,7 @@ import global_
 import server
 import db
 import config
+import alias
 import find_user
 
 from twisted.internet import defer, threads
@@ -40,6 +41,8 @@ class BaseUser(object):
     def __init__(self):
         self.is_online = False
         self.notes = {}
+        # formula variable name -> (formula, compiled formula)
+        self.compiled_formulas = {}
         #self._titles = None
         self._title_str = None
 
@@ -54,6 +57,7 @@ class BaseUser(object):
         assert(not self.is_online)
         self.vars_.update(global_.var_defaults.get_transient_vars())
         self.aliases = {}
+        self.compiled_aliases = {}
         self.gnotified = set()
         self.gnotifiers = set()
         self.noplay = set()
@@ -68,7 +72,7 @@ class BaseUser(object):
         self.write(global_.server_message['motd'])
         for ch in self.channels:
             (yield global_.channels.get(ch)).log_on(self)
-        yield db.user_log_add(self.name, login=True, ip=conn.ip)
+        global_.user_log.add(self.name, login=True, ip=conn.ip)
 
     @defer.inlineCallbacks
     def log_off(self):
@@ -80,7 +84,7 @@ class BaseUser(object):
         global_.online.remove(self)
         notify.notify_pin(self, arrived=False)
 
-        yield db.user_log_add(self.name, login=False, ip=self.session.conn.ip)
+        global_.user_log.add(self.name, login=False, ip=self.session.conn.ip)
 
     def write(self, s):
         """ Write a string to the user. """
@@ -93,9 +97,11 @@ class BaseUser(object):
             #s = ''.join(('\n', s))
             self.write_prompt(s)
 
-    def write_nowrap(self, s, prompt=False):
-        """ Write a string to the user without word wrapping. """
-        self.session.conn.write_nowrap(s)
+    def write_nowrap(self, s, prompt=False, supersede=None):
+        """ Write a string to the user without word wrapping.  Output
+        with a supersede key replaces earlier output with the same key
+        that a slow client has not read yet. """
+        self.session.conn.write_nowrap(s, supersede)
         if prompt:
             self.write_prompt()
 
@@ -163,6 +169,7 @@ class BaseUser(object):
 
     def set_formula(self, v, val):
         self.vars_[v.name] = val
+        self.compiled_formulas.pop(v.name, None)
         return defer.succeed(None)
 
     def set_note(self, v, val):
@@ -188,8 +195,10 @@ class BaseUser(object):
     def set_alias(self, name, val):
         if val is not None:
             self.aliases[name] = val
+            self.compiled_aliases[name] = alias.compile_alias(val)
         else:
             del self.aliases[name]
+            del self.compiled_aliases[name]
         return defer.succeed(None)
 
     def add_channel(self, id_):
@@ -275,7 +284,8 @@ class BaseUser(object):
     def save_history(self, game_id, result_char, user_rating, color_char,
             opp_name, opp_rating, eco, flags, initial_time, inc,
             result_reason, when_ended, movetext, idn):
-        """Save history for a user.  Return a Deferred."""
+        """Add an entry to a user's history in memory and return it.
+        The entry is saved to the DB along with the game."""
         assert(self._history is not None)
         if len(self._history) == 0:
             num = 0
@@ -290,7 +300,7 @@ class BaseUser(object):
             'result_reason': result_reason, 'when_ended': when_ended,
             'movetext': movetext, 'idn': idn}
         self._history.append(entry)
-        return defer.succeed(entry)
+        return entry
 
     def clear_history(self):
         self._history = []
@@ -399,25 +409,26 @@ class RegUser(BaseUser):
     def finish_init(self):
         """ This is broken into a separate function because __init__()
         cannot be a generator. """
-        self.channels = yield db.user_get_channels(self.id_)
-        self.vars_ = yield db.user_get_vars(self.id_,
+        state = yield db.user_get_init_state(self.id_,
             global_.var_defaults.get_persistent_var_names())
+        self.channels = state['channels']
+        self.vars_ = state['vars']
 
         self.vars_['formula'] = None
         for num in range(1, 10):
             self.vars_['f' + str(num)] = None
 
-        for f in (yield db.user_get_formula(self.id_)):
+        for f in state['formulas']:
             if f['num'] == 0:
                 self.vars_['formula'] = f['f']
             else:
                 self.vars_['f' + str(f['num'])] = f['f']
         assert('formula' in self.vars_)
-        for note in (yield db.user_get_notes(self.id_)):
+        for note in state['notes']:
             self.notes[note['num']] = note['txt']
         self._rating = None
         self.tz = pytz.timezone(self.vars_['tzone'])
-        yield self._load_titles()
+        self._set_titles(state['titles'])
 
     def get_display_name(self):
         """Get the name displayed for other users, e.g. admin(*)(SR).  Titles
@@ -426,10 +437,13 @@ class RegUser(BaseUser):
 
     @defer.inlineCallbacks
     def _load_titles(self):
+        self._set_titles((yield db.user_get_titles(self.id_)))
+
+    def _set_titles(self, rows):
         disp_list = []
         self._titles = set()
         self._on_duty_titles = set()
-        for t in (yield db.user_get_titles(self.id_)):
+        for t in rows:
             if t['title_flag'] and t['title_light']:
                 disp_list.append('(%s)' % t['title_flag'])
                 self._on_duty_titles.add(t['title_name'])
@@ -451,16 +465,19 @@ class RegUser(BaseUser):
             #u.session.conn.write(_("**** %s has arrived - you can't both be logged in. ****\n\n") % self.name)
             u.session.conn.loseConnection('logged in again')
 
+        # a game this user just finished may not have been saved yet
+        yield global_.games_writer.flush()
+        state = yield db.user_get_login_state(self.id_, self.last_logout,
+            set_first_login=not self.first_login)
+
         # notify
-        self.notified = set([dbu['user_name']
-            for dbu in (yield db.user_get_notified(self.id_))])
-        self.notifiers = set([dbu['user_name']
-            for dbu in (yield db.user_get_notifiers(self.id_))])
+        self.notified = set(state['notified'])
+        self.notifiers = set(state['notifiers'])
 
         # load ratings before officially coming online, because e.g.
         # the "who" command reads ratings of online players
-        yield self._load_ratings()
-        yield self.load_history()
+        self._set_ratings(state['ratings'])
+        self._set_history(state['history'])
 
         yield BaseUser.log_on(self, conn)
 
@@ -468,10 +485,9 @@ class RegUser(BaseUser):
         yield notify.notify_users(self, arrived=True)
 
         if not self.first_login:
-            yield db.user_set_first_login(self.id_)
-            self.first_login = yield db.user_get_first_login(self.id_)
+            self.first_login = state['first_login']
 
-        news = yield db.get_news_since(self.last_logout, is_admin=False)
+        news = state['news']
         if news:
             conn.write(ngettext('There is %d new news item since your last login:\n',
                 'There are %d new news items since your last login:\n', len(news))
@@ -483,7 +499,7 @@ class RegUser(BaseUser):
             conn.write(_('There are no new news items.\n'))
         conn.write('\n')
 
-        (mcount, ucount) = yield db.get_message_count(self.id_)
+        (mcount, ucount) = state['message_count']
         assert(mcount >= 0)
         assert(ucount >= 0)
         conn.write(ngettext('You have %(mcount)d message (%(ucount)d unread).\n',
@@ -492,18 +508,15 @@ class RegUser(BaseUser):
         conn.write(_('Use "messages u" to view unread messages and "clearmessages *" to clear all.\n'))
 
         # gnotify
-        self.gnotifiers = set([dbu['user_name']
-            for dbu in (yield db.user_get_gnotifiers(self.id_))])
-        self.gnotified = set([dbu['user_name']
-            for dbu in (yield db.user_get_gnotified(self.id_))])
+        self.gnotifiers = set(state['gnotifiers'])
+        self.gnotified = set(state['gnotified'])
 
-        for a in (yield db.user_get_aliases(self.id_)):
+        for a in state['aliases']:
             self.aliases[a['name']] = a['val']
+            self.compiled_aliases[a['name']] = alias.compile_alias(a['val'])
 
-        yield self.get_censor()
-        assert(self.censor is not None)
-        for dbu in (yield db.user_get_noplayed(self.id_)):
-            self.noplay.add(dbu['user_name'])
+        self.censor = set(state['censored'])
+        self.noplay.update(state['noplayed'])
 
     @defer.inlineCallbacks
     def load_history(self):
@@ -512,7 +525,9 @@ class RegUser(BaseUser):
         except AttributeError:
             pass
 
-        histrows = yield db.user_get_history(self.id_)
+        self._set_history((yield db.user_get_history(self.id_)))
+
+    def _set_history(self, histrows):
         histrows = list(histrows)
         for row in histrows:
             if row['white_user_id'] == self.id_:
@@ -559,8 +574,10 @@ class RegUser(BaseUser):
         d3 = db.user_set_last_logout(self.id_)
         yield defer.DeferredList([d1, d2, d3])
 
+    @defer.inlineCallbacks
     def get_log(self):
-        return db.user_get_log(self.name)
+        rows = yield db.user_get_log(self.name)
+        defer.returnValue(global_.user_log.merge(rows, 10, self.name))
 
     def set_admin_level(self, level):
         BaseUser.set_admin_level(self, level)
@@ -584,8 +601,11 @@ class RegUser(BaseUser):
                     passwd, self.passwd_hash)))
         defer.returnValue(ret)
 
+    @defer.inlineCallbacks
     def remove(self):
-        return db.user_delete(self.id_)
+        # write any log entries first, so they are removed too
+        yield global_.user_log.flush()
+        yield db.user_delete(self.id_)
 
     @defer.inlineCallbacks
     def set_var(self, v, val):
@@ -708,12 +728,10 @@ class RegUser(BaseUser):
     def get_titles(self):
         return BaseUser.get_titles(self)
 
-    @defer.inlineCallbacks
     def save_history(self, game_id, result_char, user_rating, color_char,
             opp_name, opp_rating, eco, flags, initial_time, inc,
             result_reason, when_ended, movetext, idn):
-        """Save history for a user.  Return a Deferred."""
-        entry = yield BaseUser.save_history(self, game_id, result_char,
+        entry = BaseUser.save_history(self, game_id, result_char,
             user_rating, color_char, opp_name, opp_rating, eco, flags,
             initial_time, inc, result_reason, when_ended, movetext, idn)
         # XXX hack
@@ -722,7 +740,7 @@ class RegUser(BaseUser):
             entry['guest_opp_name'] = entry['opp_name']
         else:
             entry['guest_opp_name'] = None
-        yield db.user_add_history(entry, self.id_)
+        return entry
 
     def clear_history(self):
         d = BaseUser.clear_history(self)
@@ -737,15 +755,31 @@ class RegUser(BaseUser):
         else:
             return rating.NoRating(is_guest=False)
 
-    @defer.inlineCallbacks
     def set_rating(self, speed_variant,
             rating, rd, volatility, win, loss, draw, ltime):
         """Set a new rating for a given speed and variant.  Return
         a Deferred."""
-        yield db.user_set_rating(self.id_, speed_variant.speed.id_,
-            speed_variant.variant.id_, rating, rd, volatility, win, loss,
-            draw, win + loss + draw, ltime)
-        yield self._load_ratings()  # TODO: don't reload all ratings
+        args = self.update_rating(speed_variant, rating, rd, volatility,
+            win, loss, draw, ltime)
+        return db.user_set_rating(*args)
+
+    def update_rating(self, speed_variant,
+            rating_, rd, volatility, win, loss, draw, ltime):
+        """Set a new rating in memory, without saving it.  Returns the
+        arguments to db.user_set_rating() for saving it. """
+        if self._rating is not None:
+            old = self._rating.get(speed_variant)
+            if old is not None:
+                (best, when_best) = (old.best, old.when_best)
+            else:
+                (best, when_best) = (None, None)
+            # the DB rounds ratings to integers
+            self._rating[speed_variant] = rating.Rating(
+                int(round(rating_)), rd, volatility, ltime, win, loss,
+                draw, best, when_best)
+        return (self.id_, speed_variant.speed.id_, speed_variant.variant.id_,
+            rating_, rd, volatility, win, loss, draw, win + loss + draw,
+            ltime)
 
     def del_rating(self, sv):
         """Delete a rating for a given speed and variant.  Return a
@@ -756,8 +790,11 @@ class RegUser(BaseUser):
 
     @defer.inlineCallbacks
     def _load_ratings(self):
+        self._set_ratings((yield db.user_get_all_ratings(self.id_)))
+
+    def _set_ratings(self, rows):
         self._rating = {}
-        for row in (yield db.user_get_all_ratings(self.id_)):
+        for row in rows:
             sv = speed_variant.from_ids(row['speed_id'],
                 row['variant_id'])
             self._rating[sv] = rating.Rating(row['rating'],
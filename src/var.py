@@ -27,6 +27,8 @@ import global_
 import partner
 import config
 
+from game_constants import PLAYED
+
 ivar_number = {}
 
 
@@ -51,6 +53,12 @@ def _set_pin_ivar(user, val):
             global_.online.pin_ivar.remove(user)
 
 
+def _set_seek_var(user, val):
+    """ Called when the seek var or the seekinfo or seekremove ivars
+    are set. """
+    global_.online.update_seek_audience(user)
+
+
 def _set_pin_var(user, val):
     """ Called when the pin var is set. """
     if val:
@@ -69,6 +77,14 @@ def _set_gin_var(user, val):
             global_.online.gin_var.remove(user)
 
 
+def _set_autoflag_var(user, val):
+    """ Called when the autoflag var is set.  The opponent's time may
+    have run out while autoflag was off. """
+    g = user.session.game
+    if val and g and g.gtype == PLAYED:
+        g.clock.check_autoflag()
+
+
 def _set_open_var(u, val):
     if not val:
         for offer in u.session.offers_sent[:]:
@@ -230,10 +246,13 @@ class FormulaVar(Var):
             if len(val) > self.max_len:
                 raise BadVarError()
             try:
-                formula.check_formula(None, val, self.num)
+                f = formula.compile_formula(val, self.num)
+                f(None)
             except formula.FormulaError:
                 raise BadVarError()
             yield user.set_formula(self, val)
+            # keep the compiled formula for checking challenges
+            user.compiled_formulas[self.name] = (val, f)
             user.write((_('''%(name)s set to "%(val)s".\n''') % {'name': self.name, 'val': val}))
 
 
@@ -366,13 +385,13 @@ def init_vars():
     BoolVar("bugopen", False, N_("You are now open for bughouse.\n"), N_("You are not open for bughouse.\n")).persist().add_as_var().set_hook(_set_bugopen_var)
     BoolVar("silence", False, N_("You will now play games in silence.\n"), N_("You will not play games in silence.\n")).persist().add_as_var()
     BoolVar("bell", True, N_("You will now hear beeps.\n"), N_("You will not hear beeps.\n")).persist().add_as_var()
-    BoolVar("autoflag", True, N_("Auto-flagging enabled.\n"), N_("Auto-flagging disabled.\n")).persist().add_as_var()
+    BoolVar("autoflag", True, N_("Auto-flagging enabled.\n"), N_("Auto-flagging disabled.\n")).persist().add_as_var().set_hook(_set_autoflag_var)
     BoolVar("ptime", False, N_("Your prompt will now show the time.\n"), N_("Your prompt will now not show the time.\n")).persist().add_as_var()
     BoolVar("kibitz", True, N_("You will now hear kibitzes.\n"), N_("You will not hear kibitzes.\n")).persist().add_as_var()
     BoolVar("notifiedby", True, N_("You will now hear if people notify you, but you don't notify them.\n"), N_("You will not hear if people notify you, but you don't notify them.\n")).persist().add_as_var()
     BoolVar("minmovetime", True, N_("You will request minimum move time when games start.\n"), N_("You will not request minimum move time when games start.\n")).persist().add_as_var()
     BoolVar("noescape", True, N_("You will request noescape when games start..\n"), N_("You will not request noescape when games start.\n")).persist().add_as_var()
-    BoolVar("seek", True, N_("You will now see seek ads.\n"), N_("You will not see seek ads.\n")).persist().add_as_var()
+    BoolVar("seek", True, N_("You will now see seek ads.\n"), N_("You will not see seek ads.\n")).persist().add_as_var().set_hook(_set_seek_var)
     #BoolVar("echo", True, N_("You will not hear communications echoed.\n"), N_("You will now not hear communications echoed.\n")).persist().add_as_var()
     BoolVar("examine", False, N_("You will now enter examine mode after a game.\n"), N_("You will now not enter examine mode after a game.\n")).persist().add_as_var()
     BoolVar("mailmess", False, N_("Your messages will be mailed to you.\n"), N_("Your messages will not be mailed to you.\n")).persist().add_as_var()
@@ -416,7 +435,7 @@ def init_ivars():
     # "help iv_list" on original FICS has this list
     BoolVar("compressmove", False).add_as_ivar(0)
     BoolVar("audiochat", False).add_as_ivar(1)
-    BoolVar("seekremove", False).add_as_ivar(2)
+    BoolVar("seekremove", False).add_as_ivar(2).set_hook(_set_seek_var)
     BoolVar("defprompt", False).add_as_ivar(3)
     BoolVar("lock", False).add_as_ivar(4)
     BoolVar("startpos", False).add_as_ivar(5)
@@ -425,7 +444,7 @@ def init_ivars():
     BoolVar("xdr", False).add_as_ivar(8)  # ignored, possibly related to xml
     BoolVar("pendinfo", False).add_as_ivar(9)
     BoolVar("graph", False).add_as_ivar(10)
-    BoolVar("seekinfo", False).add_as_ivar(11)
+    BoolVar("seekinfo", False).add_as_ivar(11).set_hook(_set_seek_var)
     BoolVar("extascii", False).add_as_ivar(12)
     BoolVar("nohighlight", False).add_as_ivar(13)
     BoolVar("vthighlight", False).add_as_ivar(14)
@@ -16,7 +16,11 @@
 # along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import re
+from array import array
+
 import time_format
+import eco
 
 from game_constants import (WHITE, BLACK, opp, PLAYED, EXAMINED, file_)
 
@@ -26,9 +30,136 @@ class IllegalMoveError(Exception):
         self.reason = reason
 
 
+# Python 2's array module has no 'Q' type, so the 64-bit Zobrist hashes
+# are stored as unsigned longs where those are wide enough, and in a
+# list otherwise.
+if array('L').itemsize >= 8:
+    def _hash_array(n):
+        return array('L', [0]) * n
+else:
+    def _hash_array(n):
+        return [0] * n
+
+# the clock time stored for moves whose clock time is not known
+_NO_TIME = float('nan')
+
+
+class PositionHistory(object):
+    """keeps past of past positions for repetition detection"""
+    def __init__(self):
+        self.hashes = _hash_array(40)
+        self.moves = [None] * 40
+        self.clock_times = array('d', [_NO_TIME]) * 40
+        # the number of times each hash occurs in the game so far
+        self.hash_counts = {}
+
+    def set_hash(self, ply, hash):
+        if ply >= len(self.hashes):
+            self.hashes.extend(_hash_array(ply - len(self.hashes) + 1))
+        self.hashes[ply] = hash
+        self.hash_counts[hash] = self.hash_counts.get(hash, 0) + 1
+
+    def remove_hash(self, ply):
+        """forget the position at the given ply, when the move
+        leading to it is undone"""
+        hash = self.hashes[ply]
+        count = self.hash_counts[hash]
+        if count == 1:
+            del self.hash_counts[hash]
+        else:
+            self.hash_counts[hash] = count - 1
+
+    def set_move(self, ply, mv):
+        if ply >= len(self.moves):
+            self.moves.extend([None] * (ply - len(self.moves) + 1))
+        self.moves[ply] = mv
+
+    def set_clock_time(self, ply, clock_time):
+        """record the time left on the clock of the player who made
+        the move at the given ply, or None if it is not known"""
+        if ply >= len(self.clock_times):
+            self.clock_times.extend(
+                [_NO_TIME] * (ply - len(self.clock_times) + 1))
+        if clock_time is None:
+            clock_time = _NO_TIME
+        self.clock_times[ply] = clock_time
+
+    def get_hash(self, ply):
+        return self.hashes[ply]
+
+    def get_hash_count(self, hash):
+        """get the number of times a position has occurred"""
+        return self.hash_counts.get(hash, 0)
+
+    def get_move(self, ply):
+        return self.moves[ply]
+
+    def get_clock_time(self, ply):
+        clock_time = self.clock_times[ply]
+        if clock_time != clock_time:
+            # NaN
+            return None
+        return clock_time
+
+    def clone(self):
+        """return a copy of the history"""
+        ret = PositionHistory.__new__(PositionHistory)
+        ret.hashes = self.hashes[:]
+        ret.moves = self.moves[:]
+        ret.clock_times = self.clock_times[:]
+        ret.hash_counts = self.hash_counts.copy()
+        return ret
+
+
+def perft(pos, depth):
+    """ Count the leaf nodes of the tree of legal moves from the given
+    position, to the given depth in plies.  The counts for well-known
+    positions are published, so this is a good way to test (and time)
+    the move generator.  The position should already have had
+    detect_check() called, as it is after each move in a game. """
+    if depth == 0:
+        return 1
+    moves = pos.generate_legal_moves()
+    if depth == 1:
+        return len(moves)
+    count = 0
+    for mv in moves:
+        pos.make_move(mv)
+        pos.detect_check()
+        count += perft(pos, depth - 1)
+        pos.undo_move(mv)
+    # undo_move() restores in_check, but not the other flags set by
+    # detect_check(), which now describe the last child position
+    pos.detect_check()
+    return count
+
+
+# Every string that some variant accepts as a move (in SAN, long
+# algebraic notation, castling or drop notation, with or without
+# decorators) is made up of these characters.
+_move_chars_re = re.compile(r'^[a-hA-H1-8NBRQKPnbrqkpOox=@+#?!-]{2,}$')
+
+
 class BaseVariant(object):
     """ Methods common to all variants. """
     can_adjourn = True
+
+    # the position and players the style12 frame is for
+    _style12_key = None
+
+    def get_move(self, s, conn):
+        """ Like parse_move(), but quickly rejects strings that cannot
+        be moves, such as most commands. """
+        if not _move_chars_re.match(s):
+            return None
+        return self.parse_move(s, conn)
+
+    def get_opening(self):
+        """ Get the ECO and NIC classification of the game, as
+        ((ply, eco, long_), (ply, nic)). """
+        return eco.classify(self.pos.history, self.pos.start_ply,
+            self.pos.ply)
+
     def to_style1(self, user):
         """ A human-readable board. """
         if self.game.gtype == PLAYED and user == self.game.black:
@@ -115,17 +246,7 @@ class BaseVariant(object):
     def to_style12(self, user):
         """ returns a style12 string for a given user """
         # <12> rnbqkbnr pppppppp -------- -------- -------- -------- PPPPPPPP RNBQKBNR W -1 1 1 1 1 0 473 GuestPPMD GuestCWVQ -1 1 0 39 39 60000 60000 1 none (0:00.000) none 1 0 0
-        board_str = ''
-        for r in range(7, -1, -1):
-            board_str += ' '
-            for f in range(8):
-                board_str += self.pos.board[0x10 * r + f]
-        side_str = 'W' if self.pos.wtm else 'B'
-        ep = -1 if not self.pos.ep else file_(self.pos.ep)
-        w_oo = int(self.pos.check_castle_flags(True, True))
-        w_ooo = int(self.pos.check_castle_flags(True, False))
-        b_oo = int(self.pos.check_castle_flags(False, True))
-        b_ooo = int(self.pos.check_castle_flags(False, False))
+        ms = user.session.ivars['ms']
         if self.game.gtype == EXAMINED:
             flip = 0
             if user in self.game.players:
@@ -137,7 +258,7 @@ class BaseVariant(object):
             white_clock = 0
             black_clock = 0
             white_name = list(self.game.players)[0].name
-            black_name = list(self.game.players)[0].name
+            black_name = white_name
             clock_is_ticking = 0
         elif self.game.gtype == PLAYED:
             if self.game.white == user:
@@ -152,7 +273,7 @@ class BaseVariant(object):
             else:
                 relation = -3
                 flip = 0
-            if user.session.ivars['ms']:
+            if ms:
                 white_clock = int(round(1000 * self.game.clock.get_white_time()))
                 black_clock = int(round(1000 * self.game.clock.get_black_time()))
             else:
@@ -165,34 +286,67 @@ class BaseVariant(object):
             assert(False)
         if user.vars_['flip']:
             flip = 0 if flip else 1
-        full_moves = self.pos.ply // 2 + 1
+
+        (head, mid, last_move, tail) = self._get_style12_frame(white_name,
+            black_name)
+        return '%s%d%s%d %d%s%d %d%s' % (head, relation, mid, white_clock,
+            black_clock, last_move[1 if ms else 0], flip, clock_is_ticking,
+            tail)
+
+    def _get_style12_frame(self, white_name, black_name):
+        """ Get the parts of a style12 board that are the same for all
+        users, as (head, mid, last_move, tail).  The user's relation to
+        the game goes after head, the clocks after mid, and the flip
+        and clock fields after last_move, which is a pair of strings
+        showing the time taken for the last move in seconds and in
+        milliseconds.  The parts are rendered once for each position
+        and reused for every player and observer. """
         last_mv = self.pos.get_last_move()
+        key = (self.pos.ply, self.pos.hash, self.pos.fifty_count, last_mv,
+            white_name, black_name)
+        if key == self._style12_key:
+            return self._style12_frame
+
+        # board_str begins with a space
+        board_str = ''.join([' ' +
+            self.pos.board[0x10 * r:0x10 * r + 8].tostring()
+            for r in range(7, -1, -1)])
+        side_str = 'W' if self.pos.wtm else 'B'
+        ep = -1 if not self.pos.ep else file_(self.pos.ep)
+        w_oo = int(self.pos.check_castle_flags(True, True))
+        w_ooo = int(self.pos.check_castle_flags(True, False))
+        b_oo = int(self.pos.check_castle_flags(False, True))
+        b_ooo = int(self.pos.check_castle_flags(False, False))
+        full_moves = self.pos.ply // 2 + 1
         if last_mv is None:
-            last_move_time_str = time_format.hms(0.0, user)
+            last_move_time = 0.0
             last_move_san = 'none'
             last_move_verbose = 'none'
             last_move_lag = 0
         else:
             assert(last_mv.time is not None)
-            last_move_time_str = time_format.hms(last_mv.time, user)
+            last_move_time = last_mv.time
             last_move_san = last_mv.to_san()
             last_move_verbose = last_mv.to_verbose_alg()
             last_move_lag = last_mv.lag
 
-        # board_str begins with a space
-        s = '\n<12>%s %s %d %d %d %d %d %d %d %s %s %d %d %d %d %d %d %d %d %s (%s) %s %d %d %d\n' % (
+        head = '\n<12>%s %s %d %d %d %d %d %d %d %s %s ' % (
             board_str, side_str, ep, w_oo, w_ooo, b_oo, b_ooo,
             self.pos.fifty_count, self.game.number, white_name,
-            black_name, relation, self.game.white_time,
-            self.game.inc, self.pos.material[1], self.pos.material[0],
-            white_clock, black_clock, full_moves, last_move_verbose,
-            last_move_time_str, last_move_san, flip,
-            clock_is_ticking, last_move_lag)
-
+            black_name)
+        mid = ' %d %d %d %d ' % (self.game.white_time, self.game.inc,
+            self.pos.material[1], self.pos.material[0])
+        last_move = tuple([' %d %s (%s) %s ' % (full_moves,
+                last_move_verbose, time_format.hms(last_move_time, ms=ms),
+                last_move_san)
+            for ms in (False, True)])
+        tail = ' %d\n' % last_move_lag
         if self.name in ['crazyhouse', 'bughouse']:
             # print <b1> lines
-            s += self.get_b1()
+            tail += self.get_b1()
 
-        return s
+        self._style12_key = key
+        self._style12_frame = (head, mid, last_move, tail)
+        return self._style12_frame
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -17,14 +17,16 @@
 #
 
 import re
-import copy
 import random
 from array import array
 
 from game_constants import (WHITE, BLACK, valid_sq, rank, file_)
 from game_constants import (A1, C1, D1, E1, F1, G1, H1,
     A8, C8, D8, E8, F8, G8, H8)
-from variant.base_variant import BaseVariant, IllegalMoveError
+from variant.base_variant import (BaseVariant, IllegalMoveError,
+    PositionHistory)
+from variant.tables import (piece_moves, dir, sliding_pieces, rays,
+    under_attack, update_pieces)
 
 """
 0x88 board representation; pieces are represented as ASCII,
@@ -36,23 +38,6 @@ class BadFenError(Exception):
     def __init__(self, reason=None):
         self.reason = reason
 
-piece_moves = {
-    'n': [-0x21, -0x1f, -0xe, -0x12, 0x12, 0xe, 0x1f, 0x21],
-    'b': [-0x11, -0xf, 0xf, 0x11],
-    'r': [-0x10, -1, 1, 0x10],
-    'q': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10],
-    'k': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10]
-}
-direction_table = array('i', [0 for i in range(0, 0x100)])
-
-
-def dir(fr, to):
-    """Returns the direction a queen needs to go to get from TO to FR,
-    or 0 if it's not possible."""
-    return direction_table[to - fr + 0x7f]
-
-sliding_pieces = frozenset(['b', 'r', 'q', 'B', 'R', 'Q'])
-
 # Use bughouse/crazyhouse piece values rather than those for normal chess.
 piece_material = {
     '-': 0,
@@ -137,6 +122,10 @@ zobrist = Zobrist()
 
 
 class Move(object):
+    __slots__ = ['pos', 'fr', 'to', 'pc', 'prom', 'is_oo', 'is_ooo', 'capture',
+        'is_capture', 'is_ep', 'new_ep', 'drop', 'time', 'lag', '_san',
+        '_verbose_alg', 'undo']
+
     def __init__(self, pos, fr, to, prom=None, is_oo=False,
             is_ooo=False, is_ep=False, new_ep=None, drop=None):
         self.pos = pos
@@ -152,7 +141,6 @@ class Move(object):
         self.new_ep = new_ep
         self.drop = drop
         self.time = None
-        self.clock_time = None
         self._san = None
         self._verbose_alg = None
         self.lag = 0
@@ -244,6 +232,7 @@ class Move(object):
             if (self.pos.in_check
                     or not self.pos.check_castle_flags(self.pos.wtm, True)
                     or self.pos.board[self.fr + 1] != '-'
+                    or self.pos.board[self.to] != '-'
                     or self.pos.under_attack(self.fr + 1, not self.pos.wtm)
                     or self.pos.under_attack(self.to, not self.pos.wtm)):
                 raise IllegalMoveError('illegal castling')
@@ -253,6 +242,8 @@ class Move(object):
             if (self.pos.in_check
                     or not self.pos.check_castle_flags(self.pos.wtm, False)
                     or self.pos.board[self.fr - 1] != '-'
+                    or self.pos.board[self.to] != '-'
+                    or self.pos.board[self.to - 1] != '-'
                     or self.pos.under_attack(self.fr - 1, not self.pos.wtm)
                     or self.pos.under_attack(self.to, not self.pos.wtm)):
                 raise IllegalMoveError('illegal castling')
@@ -344,30 +335,8 @@ class Move(object):
 
 class Undo(object):
     """information needed to undo a move"""
-    pass
-
-
-class PositionHistory(object):
-    """keeps past of past positions for repetition detection"""
-    def __init__(self):
-        self.hashes = [None] * 40
-        self.moves = [None] * 40
-
-    def set_hash(self, ply, hash):
-        if ply >= len(self.hashes):
-            self.hashes.extend([None] * (ply - len(self.hashes) + 1))
-        self.hashes[ply] = hash
-
-    def set_move(self, ply, mv):
-        if ply >= len(self.moves):
-            self.moves.extend([None] * (ply - len(self.moves) + 1))
-        self.moves[ply] = mv
-
-    def get_hash(self, ply):
-        return self.hashes[ply]
-
-    def get_move(self, ply):
-        return self.moves[ply]
+    __slots__ = ['ep', 'in_check', 'castle_flags', 'material', 'hash',
+        'holding_pc', 'capture_was_promoted']
 
 
 class Position(object):
@@ -407,6 +376,8 @@ class Position(object):
             ranks.reverse()
             self.hash = 0
             self.material = [0, 0]
+            # the squares of each side's pieces
+            self.pieces = [set(), set()]
             for (r, rank_str) in enumerate(ranks):
                 sq = 0x10 * r
                 for c in rank_str:
@@ -419,6 +390,7 @@ class Position(object):
                         self.hash ^= zobrist.piece_hash(sq, c)
                         self.material[piece_is_white(c)] += \
                             piece_material[c.lower()]
+                        self.pieces[piece_is_white(c)].add(sq)
                         if c == 'k':
                             if self.king_pos[0] is not None:
                                 # multiple kings
@@ -514,6 +486,21 @@ class Position(object):
         #except:
         #    raise BadFenError()
 
+    def clone(self):
+        """Return a copy of the position that can be changed without
+        affecting this one.  This is used to start new games from a
+        template position, and is much cheaper than copy.deepcopy()."""
+        pos = Position.__new__(Position)
+        pos.__dict__.update(self.__dict__)
+        pos.board = self.board[:]
+        pos.king_pos = self.king_pos[:]
+        pos.promoted = self.promoted[:]
+        pos.holding = self.holding.copy()
+        pos.material = self.material[:]
+        pos.pieces = [set(self.pieces[0]), set(self.pieces[1])]
+        pos.history = self.history.clone()
+        return pos
+
     def __iter__(self):
         for r in range(0, 8):
             for f in range(0, 8):
@@ -662,6 +649,15 @@ class Position(object):
                 self.board[A8] = '-'
                 self.hash ^= zobrist.piece_hash(A8, 'r') ^ \
                     zobrist.piece_hash(D8, 'r')
+        if mv.drop:
+            self.pieces[self.wtm].add(mv.to)
+        elif mv.is_ep or mv.is_oo or mv.is_ooo:
+            self._update_pieces(mv)
+        else:
+            self.pieces[self.wtm].discard(mv.fr)
+            self.pieces[self.wtm].add(mv.to)
+            if mv.is_capture:
+                self.pieces[not self.wtm].discard(mv.to)
 
         self.wtm = not self.wtm
         self.hash ^= zobrist.side_hash
@@ -709,11 +705,11 @@ class Position(object):
         hash = 0
         if self.wtm:
             hash ^= zobrist.side_hash
-        for (sq, pc) in self:
-            if pc != '-':
-                hash ^= zobrist.piece_hash(sq, pc)
-            if self.promoted[sq]:
-                hash ^= zobrist.promoted_hash[sq]
+        for pieces in self.pieces:
+            for sq in pieces:
+                hash ^= zobrist.piece_hash(sq, self.board[sq])
+                if self.promoted[sq]:
+                    hash ^= zobrist.promoted_hash[sq]
         if self.ep:
             hash ^= zobrist.ep_hash(self.ep)
         hash ^= zobrist.castle_hash(self.castle_flags)
@@ -729,6 +725,7 @@ class Position(object):
             self.bug_link.check_material()
             assert(self.bug_link.hash == self.bug_link.compute_hash())
         self.wtm = not self.wtm
+        self.history.remove_hash(self.ply)
         self.ply -= 1
         self.ep = mv.undo.ep
         self.board[mv.to] = mv.capture
@@ -798,6 +795,15 @@ class Position(object):
             else:
                 self.promoted[mv.to] = 0
 
+        if mv.drop:
+            self.pieces[self.wtm].discard(mv.to)
+        elif mv.is_ep or mv.is_oo or mv.is_ooo:
+            self._update_pieces(mv)
+        else:
+            self.pieces[self.wtm].discard(mv.to)
+            self.pieces[self.wtm].add(mv.fr)
+            if mv.is_capture:
+                self.pieces[not self.wtm].add(mv.to)
         assert(self.material == mv.undo.material)
         self.check_material()
         assert(self.hash == self.compute_hash())
@@ -805,11 +811,29 @@ class Position(object):
             self.bug_link.check_material()
             assert(self.bug_link.hash == self.bug_link.compute_hash())
 
+    def _update_pieces(self, mv):
+        """update the piece lists for the squares changed by an en passant
+        capture or castling, which move more than one piece"""
+        if mv.is_ep:
+            cap_sq = mv.to - 0x10 if mv.pc == 'P' else mv.to + 0x10
+            sqs = (mv.fr, mv.to, cap_sq)
+        elif mv.is_oo:
+            if mv.pc == 'K':
+                sqs = (mv.fr, mv.to, H1, F1)
+            else:
+                sqs = (mv.fr, mv.to, H8, F8)
+        elif mv.is_ooo:
+            if mv.pc == 'K':
+                sqs = (mv.fr, mv.to, A1, D1)
+            else:
+                sqs = (mv.fr, mv.to, A8, D8)
+        update_pieces(self.pieces, self.board, sqs)
+
     def check_material(self):
-        bmat = (sum([piece_material[pc.lower()]
-            for (sq, pc) in self if pc != '-' and not piece_is_white(pc)]))
-        wmat = sum([piece_material[pc.lower()]
-            for (sq, pc) in self if pc != '-' and piece_is_white(pc)])
+        bmat = sum([piece_material[self.board[sq].lower()]
+            for sq in self.pieces[0]])
+        wmat = sum([piece_material[self.board[sq].lower()]
+            for sq in self.pieces[1]])
 
         for (pc, count) in self.holding.iteritems():
             if pc.isupper():
@@ -869,11 +893,11 @@ class Position(object):
                 if pc.isupper() == self.wtm and count > 0:
                     return
 
-        for (sq, pc) in self:
-            #if pc != '-' and piece_is_white(pc) == self.wtm:
-            if pc not in ['-', 'K', 'k'] and piece_is_white(pc) == self.wtm:
-                if self._any_pc_moves(sq, pc):
-                    return
+        # trying moves changes the piece lists, so iterate over a copy
+        for sq in list(self.pieces[self.wtm]):
+            pc = self.board[sq]
+            if pc not in ['K', 'k'] and self._any_pc_moves(sq, pc):
+                return
 
         # there are no legal moves
         if self.in_check:
@@ -932,78 +956,86 @@ class Position(object):
                     is_ep=sq - 0x11 == self.ep).is_legal():
                 return True
         else:
-            for d in piece_moves[pc.lower()]:
-                cur_sq = sq + d
-                # we don't need to check castling because if castling
-                # is legal, some other king move must be also
-                while valid_sq(cur_sq):
+            # we don't need to check castling because if castling
+            # is legal, some other king move must be also
+            for ray in rays[pc.lower()][sq]:
+                for cur_sq in ray:
                     topc = self.board[cur_sq]
                     if topc == '-' or piece_is_white(topc) != self.wtm:
                         mv = Move(self, sq, cur_sq)
                         if mv.is_legal():
                             return True
-                    if not pc in sliding_pieces or self.board[cur_sq] != '-':
+                    if topc != '-':
+                        break
+
+    def generate_legal_moves(self):
+        """Return a list of all the legal moves in the position.  Like
+        the move parsers, this relies on in_check being up to date."""
+        moves = []
+        for sq in self.pieces[self.wtm]:
+            self._gen_pc_moves(sq, self.board[sq], moves)
+        ksq = self.king_pos[self.wtm]
+        if self.check_castle_flags(self.wtm, True):
+            moves.append(Move(self, ksq, ksq + 2, is_oo=True))
+        if self.check_castle_flags(self.wtm, False):
+            moves.append(Move(self, ksq, ksq - 2, is_ooo=True))
+        moves = [mv for mv in moves if mv.is_legal()]
+
+        # dropping a piece cannot put one's own king in check, so
+        # drops only need to be tested when already in check
+        for pc in ('PNBRQ' if self.wtm else 'pnbrq'):
+            if self.holding[pc] > 0:
+                for (sq, topc) in self:
+                    if topc != '-':
+                        continue
+                    if pc in ['p', 'P'] and rank(sq) in [0, 7]:
+                        continue
+                    mv = Move(self, None, sq, drop=pc)
+                    if not self.in_check or mv.is_legal():
+                        moves.append(mv)
+        return moves
+
+    def _gen_pc_moves(self, sq, pc, moves):
+        """add the pseudo-legal moves of the piece on sq to moves"""
+        if pc == 'P' or pc == 'p':
+            if pc == 'P':
+                (d, start_rank) = (0x10, 1)
+            else:
+                (d, start_rank) = (-0x10, 6)
+            to = sq + d
+            if self.board[to] == '-':
+                self._gen_pawn_moves(sq, to, moves)
+                if rank(sq) == start_rank and self.board[to + d] == '-':
+                    moves.append(Move(self, sq, to + d, new_ep=to))
+            for to in [sq + d - 1, sq + d + 1]:
+                if self._pawn_cap_at(to):
+                    self._gen_pawn_moves(sq, to, moves)
+                elif to == self.ep:
+                    moves.append(Move(self, sq, to, is_ep=True))
+        else:
+            for ray in rays[pc.lower()][sq]:
+                for to in ray:
+                    topc = self.board[to]
+                    if topc == '-' or piece_is_white(topc) != self.wtm:
+                        moves.append(Move(self, sq, to))
+                    if topc != '-':
                         break
-                    cur_sq += d
+
+    def _gen_pawn_moves(self, fr, to, moves):
+        """add a pawn move to moves, or all the promotions if the pawn
+        reaches the last rank"""
+        if rank(to) in [0, 7]:
+            for prom in ('QRBN' if self.wtm else 'qrbn'):
+                moves.append(Move(self, fr, to, prom=prom))
+        else:
+            moves.append(Move(self, fr, to))
 
     def _is_pc_at(self, pc, sq):
         return valid_sq(sq) and self.board[sq] == pc
 
     def under_attack(self, sq, wtm):
         """determine whether a square is attacked by the given side"""
-        # pawn attacks
-        if wtm:
-            if (self._is_pc_at('P', sq - 0x11)
-                    or self._is_pc_at('P', sq - 0xf)):
-                return True
-        else:
-            if (self._is_pc_at('p', sq + 0x11)
-                    or self._is_pc_at('p', sq + 0xf)):
-                return True
-
-        #  knight attacks
-        npc = 'N' if wtm else 'n'
-        for d in piece_moves['n']:
-            if self._is_pc_at(npc, sq + d):
-                return True
-
-        # king attacks
-        kpc = 'K' if wtm else 'k'
-        for d in piece_moves['k']:
-            if self._is_pc_at(kpc, sq + d):
-                return True
-
-        # bishop/queen attacks
-        for d in piece_moves['b']:
-            cur_sq = sq + d
-            while valid_sq(cur_sq):
-                if self.board[cur_sq] != '-':
-                    if wtm:
-                        if self.board[cur_sq] in ['B', 'Q']:
-                            return True
-                    else:
-                        if self.board[cur_sq] in ['b', 'q']:
-                            return True
-                    # square blocked
-                    break
-                cur_sq += d
-
-        # rook/queen attacks
-        for d in piece_moves['r']:
-            cur_sq = sq + d
-            while valid_sq(cur_sq):
-                if self.board[cur_sq] != '-':
-                    if wtm:
-                        if self.board[cur_sq] in ['R', 'Q']:
-                            return True
-                    else:
-                        if self.board[cur_sq] in ['r', 'q']:
-                            return True
-                    # square blocked
-                    break
-                cur_sq += d
-
-        return False
+        return under_attack(self.board, sq, wtm)
 
     lalg_re = re.compile(r'([a-h][1-8])-?([a-h][1-8])(?:=([NBRQ]))?$', re.I)
     def move_from_lalg(self, s):
@@ -1196,7 +1228,9 @@ class Position(object):
                 raise IllegalMoveError('square is occupied')
             if pc in ['p', 'P'] and rank(to) in [0, 7]:
                 raise IllegalMoveError('cannot drop a pawn on the first or eighth rank')
-            return Move(self, None, to, drop=pc)
+            mv = Move(self, None, to, drop=pc)
+            mv.check_legal()
+            return mv
         return None
 
     def move_from_castle(self, s):
@@ -1224,17 +1258,12 @@ class Position(object):
         '''given a piece (not including a pawn) and a destination square,
         return a list of all legal source squares'''
         ret = []
-        is_sliding = pc in sliding_pieces
-        for d in piece_moves[pc.lower()]:
-            cur_sq = sq
-            while 1:
-                cur_sq += d
-                if not valid_sq(cur_sq):
-                    break
+        for ray in rays[pc.lower()][sq]:
+            for cur_sq in ray:
                 if self.board[cur_sq] == pc:
                     if Move(self, cur_sq, sq).is_legal():
                         ret.append(cur_sq)
-                if not (self.board[cur_sq] == '-' and is_sliding):
+                if self.board[cur_sq] != '-':
                     break
         return ret
 
@@ -1247,26 +1276,17 @@ class Position(object):
         """check for draw by repetition"""
 
         # Note that the most recent possible identical position is
-        # 4 ply ago, and we only have to check every other move.
-        # This is a well-known chess engine optimization.
+        # 4 ply ago, so there can be no threefold repetition before
+        # ply 8.
         if self.ply < 8:
             return False
 
-        # TODO: it's not clear to me when we can stop searching for
-        # repetitions.  It seems to me that pawn pushes, captures,
-        # and drops are all theoretically reversible.  Maybe someone
-        # with zh knowledge can help optimize. -- wtm
-        stop = self.start_ply
-
-        count = 0
+        # Pawn pushes, captures and drops are all theoretically
+        # reversible, so every position since the start of the game
+        # counts.
         hash = self.history.get_hash(self.ply)
-        i = self.ply - 4
-        while i >= stop:
-            if self.history.get_hash(i) == hash:
-                count += 1
-                if count == 2:
-                    return True
-            i -= 2
+        if self.history.get_hash_count(hash) >= 3:
+            return True
 
         # Also check the previous position, because unlike OTB chess,
         # we do not provide a way to write down a move and offer a draw
@@ -1291,15 +1311,9 @@ class Position(object):
         # The old fics grants the draw request, unreasonably in my
         # opinion.  My change should close the loophole.
         if self.ply > 8 and (side == WHITE) == self.wtm:
-            count = 0
             hash = self.history.get_hash(self.ply - 1)
-            i = self.ply - 5
-            while i >= stop:
-                if self.history.get_hash(i) == hash:
-                    count += 1
-                    if count == 2:
-                        return True
-                i -= 2
+            if self.history.get_hash_count(hash) >= 3:
+                return True
 
         return False
 
@@ -1366,7 +1380,7 @@ class Bughouse(BaseVariant):
 
     def __init__(self, game):
         self.game = game
-        self.pos = copy.deepcopy(initial_pos)
+        self.pos = initial_pos.clone()
         self.name = 'bughouse'
         assert(game.white.session.partner)
         assert(game.black.session.partner)
@@ -1444,21 +1458,6 @@ class Bughouse(BaseVariant):
         return s
 
 
-def init_direction_table():
-    for r in range(8):
-        for f in range(8):
-            sq = 0x10 * r + f
-            for d in piece_moves['q']:
-                cur_sq = sq + d
-                while valid_sq(cur_sq):
-                    assert(0 <= cur_sq - sq + 0x7f <= 0xff)
-                    if direction_table[cur_sq - sq + 0x7f] != 0:
-                        assert(d == direction_table[cur_sq - sq + 0x7f])
-                    else:
-                        direction_table[cur_sq - sq + 0x7f] = d
-                    cur_sq += d
-init_direction_table()
-
 initial_pos = Position('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1')
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
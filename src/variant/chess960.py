@@ -23,15 +23,16 @@ http://www.dwheeler.com/essays/Fischer_Random_Chess.html
 
 import re
 import random
-
-from twisted.internet import defer
+import itertools
 from array import array
 
-import db
 from game_constants import (WHITE, BLACK, valid_sq, rank, file_)
 from game_constants import (A1, C1, D1, F1, G1, H1,
     A8, C8, D8, F8, G8, H8)
-from variant.base_variant import BaseVariant, IllegalMoveError
+from variant.base_variant import (BaseVariant, IllegalMoveError,
+    PositionHistory)
+from variant.tables import (piece_moves, dir, sliding_pieces, rays,
+    under_attack, update_pieces)
 
 """
 0x88 board representation; pieces are represented as ASCII,
@@ -43,23 +44,6 @@ class BadFenError(Exception):
     def __init__(self, reason=None):
         self.reason = reason
 
-piece_moves = {
-    'n': [-0x21, -0x1f, -0xe, -0x12, 0x12, 0xe, 0x1f, 0x21],
-    'b': [-0x11, -0xf, 0xf, 0x11],
-    'r': [-0x10, -1, 1, 0x10],
-    'q': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10],
-    'k': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10]
-}
-direction_table = array('i', [0 for i in range(0, 0x100)])
-
-
-def dir(fr, to):
-    """Returns the direction a queen needs to go to get from TO to FR,
-    or 0 if it's not possible."""
-    return direction_table[to - fr + 0x7f]
-
-sliding_pieces = frozenset(['b', 'r', 'q', 'B', 'R', 'Q'])
-
 piece_material = {
     '-': 0,
     'p': 1,
@@ -129,6 +113,10 @@ zobrist = Zobrist()
 
 
 class Move(object):
+    __slots__ = ['pos', 'fr', 'to', 'pc', 'prom', 'is_oo', 'is_ooo', 'capture',
+        'is_capture', 'is_ep', 'new_ep', 'time', 'lag', '_san', '_verbose_alg',
+        'undo']
+
     def __init__(self, pos, fr, to, prom=None, is_oo=False,
             is_ooo=False, is_ep=False, new_ep=None):
         self.pos = pos
@@ -143,7 +131,6 @@ class Move(object):
         self.is_ep = is_ep
         self.new_ep = new_ep
         self.time = None
-        self.clock_time = None
         self._san = None
         self._verbose_alg = None
         self.lag = 0
@@ -245,7 +232,8 @@ class Move(object):
             else:
                 rsq = 0x70 + pos.hside_rook_file
                 assert(pos.board[rsq] == 'r')
-            sqs = [self.fr, self.to, rsq]
+            # the king, the rook and the squares they move to
+            sqs = [self.fr, self.to, rsq, F1 if pos.wtm else F8]
             for sq in range(min(sqs), max(sqs) + 1):
                 if sq != rsq and sq != self.fr and pos.board[sq] != '-':
                     raise IllegalMoveError('castling blocked')
@@ -275,7 +263,7 @@ class Move(object):
             else:
                 rsq = 0x70 + pos.aside_rook_file
                 assert(pos.board[rsq] == 'r')
-            sqs = [self.fr, self.to, rsq]
+            sqs = [self.fr, self.to, rsq, D1 if pos.wtm else D8]
             for sq in range(min(sqs), max(sqs) + 1):
                 if sq != rsq and sq != self.fr and pos.board[sq] != '-':
                     raise IllegalMoveError('castling blocked')
@@ -375,30 +363,8 @@ class Move(object):
 
 class Undo(object):
     """information needed to undo a move"""
-    pass
-
-
-class PositionHistory(object):
-    """keeps past of past positions for repetition detection"""
-    def __init__(self):
-        self.hashes = [None] * 40
-        self.moves = [None] * 40
-
-    def set_hash(self, ply, hash):
-        if ply >= len(self.hashes):
-            self.hashes.extend([None] * (ply - len(self.hashes) + 1))
-        self.hashes[ply] = hash
-
-    def set_move(self, ply, mv):
-        if ply >= len(self.moves):
-            self.moves.extend([None] * (ply - len(self.moves) + 1))
-        self.moves[ply] = mv
-
-    def get_hash(self, ply):
-        return self.hashes[ply]
-
-    def get_move(self, ply):
-        return self.moves[ply]
+    __slots__ = ['ep', 'in_check', 'castle_flags', 'fifty_count', 'material',
+        'hash']
 
 
 class Position(object):
@@ -438,6 +404,8 @@ class Position(object):
             ranks.reverse()
             self.hash = 0
             self.material = [0, 0]
+            # the squares of each side's pieces
+            self.pieces = [set(), set()]
             self.aside_rook_file = None
             self.hside_rook_file = None
             for (r, rank_str) in enumerate(ranks):
@@ -452,6 +420,7 @@ class Position(object):
                         self.hash ^= zobrist.piece_hash(sq, c)
                         self.material[piece_is_white(c)] += \
                             piece_material[c.lower()]
+                        self.pieces[piece_is_white(c)].add(sq)
                         if c == 'k':
                             if self.king_pos[0] is not None:
                                 # multiple kings
@@ -516,7 +485,7 @@ class Position(object):
                     elif c == 'q':
                         if b_ooo:
                             raise BadFenError()
-                        for sq in range(A8, self.king_pos[1]):
+                        for sq in range(A8, self.king_pos[0]):
                             if self.board[sq] == 'r':
                                 self._set_aside_rook_file_(file_(sq))
                                 break
@@ -614,6 +583,20 @@ class Position(object):
         #except:
         #    raise BadFenError()
 
+    def clone(self):
+        """Return a copy of the position that can be changed without
+        affecting this one.  This is used to start new games from a
+        template position, and is much cheaper than copy.deepcopy()."""
+        pos = Position.__new__(Position)
+        pos.__dict__.update(self.__dict__)
+        pos.board = self.board[:]
+        pos.king_pos = self.king_pos[:]
+        pos.castle_mask = self.castle_mask[:]
+        pos.material = self.material[:]
+        pos.pieces = [set(self.pieces[0]), set(self.pieces[1])]
+        pos.history = self.history.clone()
+        return pos
+
     def __iter__(self):
         for r in range(0, 8):
             for f in range(0, 8):
@@ -713,6 +696,13 @@ class Position(object):
                 self.board[D8] = 'r'
                 self.hash ^= zobrist.piece_hash(0x70 + self.aside_rook_file,
                     'r') ^ zobrist.piece_hash(D8, 'r')
+        if mv.is_ep or mv.is_oo or mv.is_ooo:
+            self._update_pieces(mv)
+        else:
+            self.pieces[self.wtm].discard(mv.fr)
+            self.pieces[self.wtm].add(mv.to)
+            if mv.is_capture:
+                self.pieces[not self.wtm].discard(mv.to)
 
         self.castle_flags &= self.castle_mask[mv.fr] & self.castle_mask[mv.to]
         if self.castle_flags != mv.undo.castle_flags:
@@ -760,9 +750,9 @@ class Position(object):
         hash = 0
         if self.wtm:
             hash ^= zobrist.side_hash
-        for (sq, pc) in self:
-            if pc != '-':
-                hash ^= zobrist.piece_hash(sq, pc)
+        for pieces in self.pieces:
+            for sq in pieces:
+                hash ^= zobrist.piece_hash(sq, self.board[sq])
         if self.ep:
             hash ^= zobrist.ep_hash(self.ep)
         hash ^= zobrist.castle_hash(self.castle_flags)
@@ -772,9 +762,27 @@ class Position(object):
         """undo the move"""
         self._check_material()
         self.wtm = not self.wtm
+        self.history.remove_hash(self.ply)
         self.ply -= 1
         self.ep = mv.undo.ep
-        self.board[mv.to] = mv.capture
+        if mv.is_oo or mv.is_ooo:
+            # The king and rook can start on each other's destination
+            # squares, so clear both destinations before putting the
+            # pieces back.
+            if mv.is_oo:
+                (rook_fr, rook_to) = (self.hside_rook_file, F1)
+            else:
+                (rook_fr, rook_to) = (self.aside_rook_file, D1)
+            rook = 'R'
+            if not self.wtm:
+                (rook_fr, rook_to) = (rook_fr + 0x70, rook_to + 0x70)
+                rook = 'r'
+            assert(self.board[rook_to] == rook)
+            self.board[mv.to] = '-'
+            self.board[rook_to] = '-'
+            self.board[rook_fr] = rook
+        else:
+            self.board[mv.to] = mv.capture
         self.board[mv.fr] = mv.pc
         self.in_check = mv.undo.in_check
         self.castle_flags = mv.undo.castle_flags
@@ -794,37 +802,40 @@ class Position(object):
             else:
                 assert(self.board[mv.to + 0x10] == '-')
                 self.board[mv.to + 0x10] = 'P'
+        if mv.is_ep or mv.is_oo or mv.is_ooo:
+            self._update_pieces(mv)
+        else:
+            self.pieces[self.wtm].discard(mv.to)
+            self.pieces[self.wtm].add(mv.fr)
+            if mv.is_capture:
+                self.pieces[not self.wtm].add(mv.to)
+        self._check_material()
+        assert(self.hash == self._compute_hash())
+
+    def _update_pieces(self, mv):
+        """update the piece lists for the squares changed by an en passant
+        capture or castling, which move more than one piece"""
+        if mv.is_ep:
+            cap_sq = mv.to - 0x10 if mv.pc == 'P' else mv.to + 0x10
+            sqs = (mv.fr, mv.to, cap_sq)
         elif mv.is_oo:
-            if self.wtm:
-                assert(self.board[F1] == 'R')
-                self.board[self.hside_rook_file] = 'R'
-                if mv.fr != F1:
-                    self.board[F1] = '-'
+            if mv.pc == 'K':
+                sqs = (mv.fr, mv.to, self.hside_rook_file, F1)
             else:
-                assert(self.board[F8] == 'r')
-                self.board[0x70 + self.hside_rook_file] = 'r'
-                if mv.fr != F8:
-                    self.board[F8] = '-'
+                sqs = (mv.fr, mv.to, 0x70 + self.hside_rook_file, F8)
         elif mv.is_ooo:
-            if self.wtm:
-                assert(self.board[D1] == 'R')
-                self.board[self.aside_rook_file] = 'R'
-                if mv.fr != D1:
-                    self.board[D1] = '-'
+            if mv.pc == 'K':
+                sqs = (mv.fr, mv.to, self.aside_rook_file, D1)
             else:
-                assert(self.board[D8] == 'r')
-                self.board[0x70 + self.aside_rook_file] = 'r'
-                if mv.fr != D8:
-                    self.board[D8] = '-'
-        self._check_material()
-        assert(self.hash == self._compute_hash())
+                sqs = (mv.fr, mv.to, 0x70 + self.aside_rook_file, D8)
+        update_pieces(self.pieces, self.board, sqs)
 
     def _check_material(self):
-        bmat = sum([piece_material[pc.lower()]
-            for (sq, pc) in self if pc != '-' and not piece_is_white(pc)])
+        bmat = sum([piece_material[self.board[sq].lower()]
+            for sq in self.pieces[0]])
         assert(bmat == self.material[0])
-        assert(self.material[1] == sum([piece_material[pc.lower()]
-            for (sq, pc) in self if pc != '-' and piece_is_white(pc)]))
+        assert(self.material[1] == sum([piece_material[self.board[sq].lower()]
+            for sq in self.pieces[1]]))
 
     def detect_check(self):
         """detect whether the player to move is in check, checkmated,
@@ -845,10 +856,11 @@ class Position(object):
         self.black_has_mating_material = self.material[0] > 3
         if (not self.white_has_mating_material or
                 not self.black_has_mating_material):
-            for (sq, pc) in self:
-                if pc == 'P':
+            for sq in self.pieces[1]:
+                if self.board[sq] == 'P':
                     self.white_has_mating_material = True
-                elif pc == 'p':
+            for sq in self.pieces[0]:
+                if self.board[sq] == 'p':
                     self.black_has_mating_material = True
 
     def get_last_move(self):
@@ -860,11 +872,11 @@ class Position(object):
         ksq = self.king_pos[self.wtm]
         if self._any_pc_moves(ksq, self.board[ksq]):
             return True
-        for (sq, pc) in self:
-            #if pc != '-' and piece_is_white(pc) == self.wtm:
-            if pc not in ['-', 'K', 'k'] and piece_is_white(pc) == self.wtm:
-                if self._any_pc_moves(sq, pc):
-                    return True
+        # trying moves changes the piece lists, so iterate over a copy
+        for sq in list(self.pieces[self.wtm]):
+            pc = self.board[sq]
+            if pc not in ['K', 'k'] and self._any_pc_moves(sq, pc):
+                return True
         return False
 
     def _pawn_cap_at(self, sq):
@@ -905,78 +917,74 @@ class Position(object):
                     is_ep=sq - 0x11 == self.ep).is_legal():
                 return True
         else:
-            for d in piece_moves[pc.lower()]:
-                cur_sq = sq + d
-                # we don't need to check castling because if castling
-                # is legal, some other king move must be also
-                while valid_sq(cur_sq):
+            # we don't need to check castling because if castling
+            # is legal, some other king move must be also
+            for ray in rays[pc.lower()][sq]:
+                for cur_sq in ray:
                     topc = self.board[cur_sq]
                     if topc == '-' or piece_is_white(topc) != self.wtm:
                         mv = Move(self, sq, cur_sq)
                         if mv.is_legal():
                             return True
-                    if not pc in sliding_pieces or self.board[cur_sq] != '-':
+                    if topc != '-':
                         break
-                    cur_sq += d
+
+    def generate_legal_moves(self):
+        """Return a list of all the legal moves in the position.  Like
+        the move parsers, this relies on in_check being up to date."""
+        moves = []
+        for sq in self.pieces[self.wtm]:
+            self._gen_pc_moves(sq, self.board[sq], moves)
+        ksq = self.king_pos[self.wtm]
+        if self.check_castle_flags(self.wtm, True):
+            moves.append(Move(self, ksq, G1 if self.wtm else G8,
+                is_oo=True))
+        if self.check_castle_flags(self.wtm, False):
+            moves.append(Move(self, ksq, C1 if self.wtm else C8,
+                is_ooo=True))
+        return [mv for mv in moves if mv.is_legal()]
+
+    def _gen_pc_moves(self, sq, pc, moves):
+        """add the pseudo-legal moves of the piece on sq to moves"""
+        if pc == 'P' or pc == 'p':
+            if pc == 'P':
+                (d, start_rank) = (0x10, 1)
+            else:
+                (d, start_rank) = (-0x10, 6)
+            to = sq + d
+            if self.board[to] == '-':
+                self._gen_pawn_moves(sq, to, moves)
+                if rank(sq) == start_rank and self.board[to + d] == '-':
+                    moves.append(Move(self, sq, to + d, new_ep=to))
+            for to in [sq + d - 1, sq + d + 1]:
+                if self._pawn_cap_at(to):
+                    self._gen_pawn_moves(sq, to, moves)
+                elif to == self.ep:
+                    moves.append(Move(self, sq, to, is_ep=True))
+        else:
+            for ray in rays[pc.lower()][sq]:
+                for to in ray:
+                    topc = self.board[to]
+                    if topc == '-' or piece_is_white(topc) != self.wtm:
+                        moves.append(Move(self, sq, to))
+                    if topc != '-':
+                        break
+
+    def _gen_pawn_moves(self, fr, to, moves):
+        """add a pawn move to moves, or all the promotions if the pawn
+        reaches the last rank"""
+        if rank(to) in [0, 7]:
+            for prom in ('QRBN' if self.wtm else 'qrbn'):
+                moves.append(Move(self, fr, to, prom=prom))
+        else:
+            moves.append(Move(self, fr, to))
 
     def _is_pc_at(self, pc, sq):
         return valid_sq(sq) and self.board[sq] == pc
 
     def under_attack(self, sq, wtm):
         """determine whether a square is attacked by the given side"""
-        # pawn attacks
-        if wtm:
-            if (self._is_pc_at('P', sq - 0x11)
-                    or self._is_pc_at('P', sq - 0xf)):
-                return True
-        else:
-            if (self._is_pc_at('p', sq + 0x11)
-                    or self._is_pc_at('p', sq + 0xf)):
-                return True
-
-        #  knight attacks
-        npc = 'N' if wtm else 'n'
-        for d in piece_moves['n']:
-            if self._is_pc_at(npc, sq + d):
-                return True
-
-        # king attacks
-        kpc = 'K' if wtm else 'k'
-        for d in piece_moves['k']:
-            if self._is_pc_at(kpc, sq + d):
-                return True
-
-        # bishop/queen attacks
-        for d in piece_moves['b']:
-            cur_sq = sq + d
-            while valid_sq(cur_sq):
-                if self.board[cur_sq] != '-':
-                    if wtm:
-                        if self.board[cur_sq] in ['B', 'Q']:
-                            return True
-                    else:
-                        if self.board[cur_sq] in ['b', 'q']:
-                            return True
-                    # square blocked
-                    break
-                cur_sq += d
-
-        # rook/queen attacks
-        for d in piece_moves['r']:
-            cur_sq = sq + d
-            while valid_sq(cur_sq):
-                if self.board[cur_sq] != '-':
-                    if wtm:
-                        if self.board[cur_sq] in ['R', 'Q']:
-                            return True
-                    else:
-                        if self.board[cur_sq] in ['r', 'q']:
-                            return True
-                    # square blocked
-                    break
-                cur_sq += d
-
-        return False
+        return under_attack(self.board, sq, wtm)
 
     lalg_re = re.compile(r'([a-h][1-8])-([a-h][1-8])(?:=([NBRQ]))?$', re.I)
     def move_from_lalg(self, s):
@@ -1184,17 +1192,12 @@ class Position(object):
         '''given a piece (not including a pawn) and a destination square,
         return a list of all legal source squares'''
         ret = []
-        is_sliding = pc in sliding_pieces
-        for d in piece_moves[pc.lower()]:
-            cur_sq = sq
-            while 1:
-                cur_sq += d
-                if not valid_sq(cur_sq):
-                    break
+        for ray in rays[pc.lower()][sq]:
+            for cur_sq in ray:
                 if self.board[cur_sq] == pc:
                     if Move(self, cur_sq, sq).is_legal():
                         ret.append(cur_sq)
-                if not (self.board[cur_sq] == '-' and is_sliding):
+                if self.board[cur_sq] != '-':
                     break
         return ret
 
@@ -1210,21 +1213,18 @@ class Position(object):
         """check for draw by repetition"""
 
         # Note that the most recent possible identical position is
-        # 4 ply ago, and we only have to check every other move.
-        # This is a well-known chess engine optimization.
+        # 4 ply ago, so there can be no threefold repetition before
+        # ply 8.
         if self.ply < 8:
             return False
-        stop = max(self.ply - self.fifty_count, self.start_ply)
 
-        count = 0
+        # The history counts every position since the start of the
+        # game, but since positions before the last capture or pawn
+        # move cannot occur again, that is the same as counting only
+        # the positions since then.
         hash = self.history.get_hash(self.ply)
-        i = self.ply - 4
-        while i >= stop:
-            if self.history.get_hash(i) == hash:
-                count += 1
-                if count == 2:
-                    return True
-            i -= 2
+        if self.history.get_hash_count(hash) >= 3:
+            return True
 
         # Also check the previous position, because unlike OTB chess,
         # we do not provide a way to write down a move and offer a draw
@@ -1248,16 +1248,15 @@ class Position(object):
         #
         # The old fics grants the draw request, unreasonably in my
         # opinion.  My change should close the loophole.
-        if self.ply > 8 and (side == WHITE) == self.wtm:
-            count = 0
+        #
+        # As above, only positions since the last capture or pawn move
+        # count, so the previous position does not if the last move was
+        # one.
+        if (self.ply > 8 and (side == WHITE) == self.wtm and
+                self.fifty_count > 0):
             hash = self.history.get_hash(self.ply - 1)
-            i = self.ply - 5
-            while i >= stop:
-                if self.history.get_hash(i) == hash:
-                    count += 1
-                    if count == 2:
-                        return True
-                i -= 2
+            if self.history.get_hash_count(hash) >= 3:
+                return True
 
         return False
 
@@ -1265,16 +1264,59 @@ class Position(object):
         return bool(self.castle_flags & (1 << (2 * int(wtm) + int(is_oo))))
 
 
+# the ways of placing two knights on the five squares left after
+# the bishops and queen are placed, in the order of the standard
+# numbering of starting positions
+knight_placements = list(itertools.combinations(range(5), 2))
+
+
+def fen_from_idn(idn):
+    """Get the FEN of a starting position, given its number in the
+    standard (Scharnagl) numbering, in which 518 is the normal chess
+    position."""
+    assert(0 <= idn <= 959)
+    row = [None] * 8
+    (n, b) = divmod(idn, 4)
+    # light-squared bishop
+    row[2 * b + 1] = 'B'
+    (n, b) = divmod(n, 4)
+    # dark-squared bishop
+    row[2 * b] = 'B'
+    (n, q) = divmod(n, 6)
+    empty = [f for f in range(8) if row[f] is None]
+    row[empty[q]] = 'Q'
+    empty = [f for f in range(8) if row[f] is None]
+    for i in knight_placements[n]:
+        row[empty[i]] = 'N'
+    # the rooks go on either side of the king
+    empty = [f for f in range(8) if row[f] is None]
+    for (f, pc) in zip(empty, 'RKR'):
+        row[f] = pc
+    row = ''.join(row)
+    return '%s/pppppppp/8/8/8/8/PPPPPPPP/%s w KQkq - 0 1' % (row.lower(), row)
+
+# starting positions that have been used, by idn
+initial_pos = {}
+
+
+def initial_pos_from_idn(idn):
+    """Get a new copy of the starting position with the given idn."""
+    try:
+        pos = initial_pos[idn]
+    except KeyError:
+        pos = Position(fen_from_idn(idn))
+        initial_pos[idn] = pos
+    return pos.clone()
+
+
 class Chess960(BaseVariant):
     def __init__(self, game):
         self.game = game
         self.name = 'chess960'
 
-    @defer.inlineCallbacks
     def set_idn(self, idn):
         self.idn = idn
-        fen = yield db.fen_from_idn(self.idn)
-        self.pos = Position(fen)
+        self.pos = initial_pos_from_idn(idn)
 
     def parse_move(self, s, conn):
         """Try to parse a move.  If it looks like a move but
@@ -1315,19 +1357,4 @@ class Chess960(BaseVariant):
         return WHITE if self.pos.wtm else BLACK
 
 
-def init_direction_table():
-    for r in range(8):
-        for f in range(8):
-            sq = 0x10 * r + f
-            for d in piece_moves['q']:
-                cur_sq = sq + d
-                while valid_sq(cur_sq):
-                    assert(0 <= cur_sq - sq + 0x7f <= 0xff)
-                    if direction_table[cur_sq - sq + 0x7f] != 0:
-                        assert(d == direction_table[cur_sq - sq + 0x7f])
-                    else:
-                        direction_table[cur_sq - sq + 0x7f] = d
-                    cur_sq += d
-init_direction_table()
-
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -17,12 +17,14 @@
 #
 
 import re
-import copy
 import random
 from array import array
 
 from game_constants import (WHITE, BLACK, valid_sq, rank, file_)
-from variant.base_variant import BaseVariant, IllegalMoveError
+from variant.base_variant import (BaseVariant, IllegalMoveError,
+    PositionHistory)
+from variant.tables import (piece_moves, dir, sliding_pieces, rays,
+    under_attack, update_pieces)
 """
 0x88 board representation; pieces are represented as ASCII,
 the same as FEN. A blank square is '-'.
@@ -33,23 +35,6 @@ class BadFenError(Exception):
     def __init__(self, reason=None):
         self.reason = reason
 
-piece_moves = {
-    'n': [-0x21, -0x1f, -0xe, -0x12, 0x12, 0xe, 0x1f, 0x21],
-    'b': [-0x11, -0xf, 0xf, 0x11],
-    'r': [-0x10, -1, 1, 0x10],
-    'q': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10],
-    'k': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10]
-}
-direction_table = array('i', [0 for i in range(0, 0x100)])
-
-
-def dir(fr, to):
-    """Returns the direction a queen needs to go to get from TO to FR,
-    or 0 if it's not possible."""
-    return direction_table[to - fr + 0x7f]
-
-sliding_pieces = frozenset(['b', 'r', 'q', 'B', 'R', 'Q'])
-
 # Use suicide piece values rather than those for normal chess:
 piece_material = {
     '-': 0,
@@ -110,6 +95,9 @@ zobrist = Zobrist()
 
 
 class Move(object):
+    __slots__ = ['pos', 'fr', 'to', 'pc', 'prom', 'capture', 'is_capture',
+        'is_ep', 'new_ep', 'time', 'lag', '_san', '_verbose_alg', 'undo']
+
     def __init__(self, pos, fr, to, prom=None, is_ep=False, new_ep=None):
         self.pos = pos
         self.fr = fr
@@ -121,7 +109,6 @@ class Move(object):
         self.is_ep = is_ep
         self.new_ep = new_ep
         self.time = None
-        self.clock_time = None
         self._san = None
         self._verbose_alg = None
         self.lag = 0
@@ -202,10 +189,8 @@ class Move(object):
         """Test whether a move ignores a possible capture.
         This test is common to all move formats."""
         if not self.is_capture and not self.is_ep:
-            for (sq, pc) in self.pos:
-                if (pc != '-' and
-                        (self.pos.wtm != piece_is_white(pc)) and
-                        self.pos.under_attack(sq, self.pos.wtm)):
+            for sq in self.pos.pieces[not self.pos.wtm]:
+                if self.pos.under_attack(sq, self.pos.wtm):
                     raise IllegalMoveError('must capture')
 
     def to_san(self):
@@ -280,30 +265,7 @@ class Move(object):
 
 class Undo(object):
     """information needed to undo a move"""
-    pass
-
-
-class PositionHistory(object):
-    """keeps past of past positions for repetition detection"""
-    def __init__(self):
-        self.hashes = [None] * 40
-        self.moves = [None] * 40
-
-    def set_hash(self, ply, hash):
-        if ply >= len(self.hashes):
-            self.hashes.extend([None] * (ply - len(self.hashes) + 1))
-        self.hashes[ply] = hash
-
-    def set_move(self, ply, mv):
-        if ply >= len(self.moves):
-            self.moves.extend([None] * (ply - len(self.moves) + 1))
-        self.moves[ply] = mv
-
-    def get_hash(self, ply):
-        return self.hashes[ply]
-
-    def get_move(self, ply):
-        return self.moves[ply]
+    __slots__ = ['ep', 'fifty_count', 'material', 'hash']
 
 
 class Position(object):
@@ -332,6 +294,8 @@ class Position(object):
             ranks.reverse()
             self.hash = 0
             self.material = [0, 0]
+            # the squares of each side's pieces
+            self.pieces = [set(), set()]
             for (r, rank_str) in enumerate(ranks):
                 sq = 0x10 * r
                 for c in rank_str:
@@ -344,6 +308,7 @@ class Position(object):
                         self.hash ^= zobrist.piece_hash(sq, c)
                         self.material[piece_is_white(c)] += \
                             piece_material[c.lower()]
+                        self.pieces[piece_is_white(c)].add(sq)
                         if c.lower() == 'p':
                             if rank(sq) in [0, 7]:
                                 # pawn on 1st or 8th rank
@@ -386,6 +351,18 @@ class Position(object):
         #except:
         #    raise BadFenError()
 
+    def clone(self):
+        """Return a copy of the position that can be changed without
+        affecting this one.  This is used to start new games from a
+        template position, and is much cheaper than copy.deepcopy()."""
+        pos = Position.__new__(Position)
+        pos.__dict__.update(self.__dict__)
+        pos.board = self.board[:]
+        pos.material = self.material[:]
+        pos.pieces = [set(self.pieces[0]), set(self.pieces[1])]
+        pos.history = self.history.clone()
+        return pos
+
     def __iter__(self):
         for r in range(0, 8):
             for f in range(0, 8):
@@ -438,6 +415,13 @@ class Position(object):
                 assert(self.board[mv.to + 0x10] == 'P')
                 self.hash ^= zobrist.piece_hash(mv.to + 0x10, 'P')
                 self.board[mv.to + 0x10] = '-'
+        if mv.is_ep:
+            self._update_pieces(mv)
+        else:
+            self.pieces[self.wtm].discard(mv.fr)
+            self.pieces[self.wtm].add(mv.to)
+            if mv.is_capture:
+                self.pieces[not self.wtm].discard(mv.to)
 
         self.wtm = not self.wtm
         self.hash ^= zobrist.side_hash
@@ -455,9 +439,9 @@ class Position(object):
         hash = 0
         if self.wtm:
             hash ^= zobrist.side_hash
-        for (sq, pc) in self:
-            if pc != '-':
-                hash ^= zobrist.piece_hash(sq, pc)
+        for pieces in self.pieces:
+            for sq in pieces:
+                hash ^= zobrist.piece_hash(sq, self.board[sq])
         if self.ep:
             hash ^= zobrist.ep_hash(self.ep)
         return hash
@@ -465,6 +449,7 @@ class Position(object):
     def undo_move(self, mv):
         """undo the move"""
         self.wtm = not self.wtm
+        self.history.remove_hash(self.ply)
         self.ply -= 1
         self.ep = mv.undo.ep
         self.board[mv.to] = mv.capture
@@ -480,35 +465,48 @@ class Position(object):
             else:
                 assert(self.board[mv.to + 0x10] == '-')
                 self.board[mv.to + 0x10] = 'P'
+        if mv.is_ep:
+            self._update_pieces(mv)
+        else:
+            self.pieces[self.wtm].discard(mv.to)
+            self.pieces[self.wtm].add(mv.fr)
+            if mv.is_capture:
+                self.pieces[not self.wtm].add(mv.to)
         #self._check_material()
         #assert(self.hash == self._compute_hash())
 
+    def _update_pieces(self, mv):
+        """update the piece lists for the squares changed by an en passant
+        capture"""
+        cap_sq = mv.to - 0x10 if mv.pc == 'P' else mv.to + 0x10
+        update_pieces(self.pieces, self.board, (mv.fr, mv.to, cap_sq))
+
     def _check_material(self):
-        bmat = sum([piece_material[pc.lower()]
-            for (sq, pc) in self if pc != '-' and not piece_is_white(pc)])
+        bmat = sum([piece_material[self.board[sq].lower()]
+            for sq in self.pieces[0]])
         assert(bmat == self.material[0])
-        assert(self.material[1] == sum([piece_material[pc.lower()]
-            for (sq, pc) in self if pc != '-' and piece_is_white(pc)]))
+        assert(self.material[1] == sum([piece_material[self.board[sq].lower()]
+            for sq in self.pieces[1]]))
 
     def detect_check(self):
         """detect whether the player to move is out of material
         (has committed suicide) or stalemated, or if the game
         is drawn by opposite color bishops"""
-        self.is_suicide = not any(pc != '-' and
-            (piece_is_white(pc) if self.wtm else not piece_is_white(pc))
-            for (sq, pc) in self)
+        self.is_suicide = not self.pieces[self.wtm]
 
         self.is_stalemate = not self._any_legal_moves()
         if self.is_stalemate:
-            white_material = sum(piece_material[pc.lower()]
-                for (sq, pc) in self if pc != '-' and piece_is_white(pc))
-            black_material = sum(piece_material[pc.lower()]
-                for (sq, pc) in self if pc != '-' and not piece_is_white(pc))
+            white_material = sum(piece_material[self.board[sq].lower()]
+                for sq in self.pieces[1])
+            black_material = sum(piece_material[self.board[sq].lower()]
+                for sq in self.pieces[0])
             self.is_stalemate_white = white_material < black_material
             self.is_stalemate_black = white_material > black_material
 
         self.is_draw_bishops = False
-        for (sq, pc) in self:
+        all_pieces = self.pieces[0] | self.pieces[1]
+        for sq in all_pieces:
+            pc = self.board[sq]
             if pc == 'B':
                 if (rank(sq) ^ file_(sq)) & 1 != 0:
                     break
@@ -521,7 +519,8 @@ class Position(object):
             self.is_draw_bishops = True
             return
 
-        for (sq, pc) in self:
+        for sq in all_pieces:
+            pc = self.board[sq]
             if pc == 'B':
                 if (rank(sq) ^ file_(sq)) & 1 == 0:
                     break
@@ -539,10 +538,9 @@ class Position(object):
     def _any_legal_moves(self):
         if self.ep:
             return True
-        for (sq, pc) in self:
-            if pc != '-' and piece_is_white(pc) == self.wtm:
-                if self._any_pc_moves(sq, pc):
-                    return True
+        for sq in self.pieces[self.wtm]:
+            if self._any_pc_moves(sq, self.board[sq]):
+                return True
         return False
 
     def _pawn_cap_at(self, sq):
@@ -567,74 +565,64 @@ class Position(object):
             if self._pawn_cap_at(sq - 0x11):
                 return True
         else:
-            for d in piece_moves[pc.lower()]:
-                cur_sq = sq + d
-                while valid_sq(cur_sq):
-                    topc = self.board[cur_sq]
+            for ray in rays[pc.lower()][sq]:
+                topc = self.board[ray[0]]
+                if topc == '-' or piece_is_white(topc) != self.wtm:
+                    return True
+
+    def generate_legal_moves(self):
+        """Return a list of all the legal moves in the position."""
+        moves = []
+        for sq in self.pieces[self.wtm]:
+            self._gen_pc_moves(sq, self.board[sq], moves)
+        # This is the test made by Move.check_legal(), done once for
+        # all the moves: if any piece can be captured, a move that is
+        # not a capture is illegal.
+        if [mv for mv in moves if mv.is_capture]:
+            moves = [mv for mv in moves if mv.is_capture or mv.is_ep]
+        return moves
+
+    def _gen_pc_moves(self, sq, pc, moves):
+        """add the pseudo-legal moves of the piece on sq to moves"""
+        if pc == 'P' or pc == 'p':
+            if pc == 'P':
+                (d, start_rank) = (0x10, 1)
+            else:
+                (d, start_rank) = (-0x10, 6)
+            to = sq + d
+            if self.board[to] == '-':
+                self._gen_pawn_moves(sq, to, moves)
+                if rank(sq) == start_rank and self.board[to + d] == '-':
+                    moves.append(Move(self, sq, to + d, new_ep=to))
+            for to in [sq + d - 1, sq + d + 1]:
+                if self._pawn_cap_at(to):
+                    self._gen_pawn_moves(sq, to, moves)
+                elif to == self.ep:
+                    moves.append(Move(self, sq, to, is_ep=True))
+        else:
+            for ray in rays[pc.lower()][sq]:
+                for to in ray:
+                    topc = self.board[to]
                     if topc == '-' or piece_is_white(topc) != self.wtm:
-                        return True
-                    if not pc in sliding_pieces or self.board[cur_sq] != '-':
+                        moves.append(Move(self, sq, to))
+                    if topc != '-':
                         break
-                    cur_sq += d
+
+    def _gen_pawn_moves(self, fr, to, moves):
+        """add a pawn move to moves, or all the promotions if the pawn
+        reaches the last rank"""
+        if rank(to) in [0, 7]:
+            for prom in ('QRBNK' if self.wtm else 'qrbnk'):
+                moves.append(Move(self, fr, to, prom=prom))
+        else:
+            moves.append(Move(self, fr, to))
 
     def _is_pc_at(self, pc, sq):
         return valid_sq(sq) and self.board[sq] == pc
 
     def under_attack(self, sq, wtm):
         """determine whether a square is attacked by the given side"""
-        # pawn attacks
-        if wtm:
-            if (self._is_pc_at('P', sq - 0x11)
-                    or self._is_pc_at('P', sq - 0xf)):
-                return True
-        else:
-            if (self._is_pc_at('p', sq + 0x11)
-                    or self._is_pc_at('p', sq + 0xf)):
-                return True
-
-        #  knight attacks
-        npc = 'N' if wtm else 'n'
-        for d in piece_moves['n']:
-            if self._is_pc_at(npc, sq + d):
-                return True
-
-        # king attacks
-        kpc = 'K' if wtm else 'k'
-        for d in piece_moves['k']:
-            if self._is_pc_at(kpc, sq + d):
-                return True
-
-        # bishop/queen attacks
-        for d in piece_moves['b']:
-            cur_sq = sq + d
-            while valid_sq(cur_sq):
-                if self.board[cur_sq] != '-':
-                    if wtm:
-                        if self.board[cur_sq] in ['B', 'Q']:
-                            return True
-                    else:
-                        if self.board[cur_sq] in ['b', 'q']:
-                            return True
-                    # square blocked
-                    break
-                cur_sq += d
-
-        # rook/queen attacks
-        for d in piece_moves['r']:
-            cur_sq = sq + d
-            while valid_sq(cur_sq):
-                if self.board[cur_sq] != '-':
-                    if wtm:
-                        if self.board[cur_sq] in ['R', 'Q']:
-                            return True
-                    else:
-                        if self.board[cur_sq] in ['r', 'q']:
-                            return True
-                    # square blocked
-                    break
-                cur_sq += d
-
-        return False
+        return under_attack(self.board, sq, wtm)
 
     lalg_re = re.compile(r'([a-h][1-8])-?([a-h][1-8])(?:=([KNBRQ]))?$', re.I)
     def move_from_lalg(self, s):
@@ -808,17 +796,12 @@ class Position(object):
         '''given a piece (not including a pawn) and a destination square,
         return a list of all legal source squares'''
         ret = []
-        is_sliding = pc in sliding_pieces
-        for d in piece_moves[pc.lower()]:
-            cur_sq = sq
-            while 1:
-                cur_sq += d
-                if not valid_sq(cur_sq):
-                    break
+        for ray in rays[pc.lower()][sq]:
+            for cur_sq in ray:
                 if self.board[cur_sq] == pc:
                     if Move(self, cur_sq, sq).is_legal():
                         ret.append(cur_sq)
-                if not (self.board[cur_sq] == '-' and is_sliding):
+                if self.board[cur_sq] != '-':
                     break
         return ret
 
@@ -830,21 +813,18 @@ class Position(object):
         """check for draw by repetition"""
 
         # Note that the most recent possible identical position is
-        # 4 ply ago, and we only have to check every other move.
-        # This is a well-known chess engine optimization.
+        # 4 ply ago, so there can be no threefold repetition before
+        # ply 8.
         if self.ply < 8:
             return False
-        stop = max(self.ply - self.fifty_count, self.start_ply)
 
-        count = 0
+        # The history counts every position since the start of the
+        # game, but since positions before the last capture or pawn
+        # move cannot occur again, that is the same as counting only
+        # the positions since then.
         hash = self.history.get_hash(self.ply)
-        i = self.ply - 4
-        while i >= stop:
-            if self.history.get_hash(i) == hash:
-                count += 1
-                if count == 2:
-                    return True
-            i -= 2
+        if self.history.get_hash_count(hash) >= 3:
+            return True
 
         # Also check the previous position, because unlike OTB chess,
         # we do not provide a way to write down a move and offer a draw
@@ -868,16 +848,15 @@ class Position(object):
         #
         # The old fics grants the draw request, unreasonably in my
         # opinion.  My change should close the loophole.
-        if self.ply > 8 and (side == WHITE) == self.wtm:
-            count = 0
+        #
+        # As above, only positions since the last capture or pawn move
+        # count, so the previous position does not if the last move was
+        # one.
+        if (self.ply > 8 and (side == WHITE) == self.wtm and
+                self.fifty_count > 0):
             hash = self.history.get_hash(self.ply - 1)
-            i = self.ply - 5
-            while i >= stop:
-                if self.history.get_hash(i) == hash:
-                    count += 1
-                    if count == 2:
-                        return True
-                i -= 2
+            if self.history.get_hash_count(hash) >= 3:
+                return True
 
         return False
 
@@ -925,7 +904,7 @@ class Suicide(BaseVariant):
     """suicide chess"""
     def __init__(self, game):
         self.game = game
-        self.pos = copy.deepcopy(initial_pos)
+        self.pos = initial_pos.clone()
         self.name = 'suicide'
 
     def parse_move(self, s, conn):
@@ -987,21 +966,6 @@ class Suicide(BaseVariant):
         return s
 
 
-def init_direction_table():
-    for r in range(8):
-        for f in range(8):
-            sq = 0x10 * r + f
-            for d in piece_moves['q']:
-                cur_sq = sq + d
-                while valid_sq(cur_sq):
-                    assert(0 <= cur_sq - sq + 0x7f <= 0xff)
-                    if direction_table[cur_sq - sq + 0x7f] != 0:
-                        assert(d == direction_table[cur_sq - sq + 0x7f])
-                    else:
-                        direction_table[cur_sq - sq + 0x7f] = d
-                    cur_sq += d
-init_direction_table()
-
 initial_pos = Position('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1')
 
 # vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
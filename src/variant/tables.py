@@ -0,0 +1,158 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Move and attack tables for the 0x88 board, shared by all the
+variants.  The tables are computed once, when the module is loaded,
+so that generating moves and detecting attacks only has to look
+squares up instead of walking the board."""
+
+from array import array
+
+from game_constants import valid_sq
+
+piece_moves = {
+    'n': [-0x21, -0x1f, -0xe, -0x12, 0x12, 0xe, 0x1f, 0x21],
+    'b': [-0x11, -0xf, 0xf, 0x11],
+    'r': [-0x10, -1, 1, 0x10],
+    'q': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10],
+    'k': [-0x11, -0xf, 0xf, 0x11, -0x10, -1, 1, 0x10]
+}
+direction_table = array('i', [0 for i in range(0, 0x100)])
+
+
+def dir(fr, to):
+    """Returns the direction a queen needs to go to get from TO to FR,
+    or 0 if it's not possible."""
+    return direction_table[to - fr + 0x7f]
+
+sliding_pieces = frozenset(['b', 'r', 'q', 'B', 'R', 'Q'])
+
+# rays[pc][sq] has, for each direction the piece pc (lowercase,
+# not a pawn) can move from sq, a tuple of the squares in that direction,
+# nearest first.  A piece that does not slide has at most one square in
+# each direction.
+rays = {}
+
+# the squares a knight or king on a square attacks, which are also
+# the squares from which a knight or king attacks that square
+knight_sqs = [()] * 0x80
+king_sqs = [()] * 0x80
+
+# pawn_sqs[wtm][sq] is the squares from which a pawn of the given
+# side attacks sq
+pawn_sqs = [[()] * 0x80, [()] * 0x80]
+
+
+def init_tables():
+    for pc in piece_moves:
+        rays[pc] = [()] * 0x80
+    for r in range(8):
+        for f in range(8):
+            sq = 0x10 * r + f
+            for d in piece_moves['q']:
+                cur_sq = sq + d
+                while valid_sq(cur_sq):
+                    assert(0 <= cur_sq - sq + 0x7f <= 0xff)
+                    if direction_table[cur_sq - sq + 0x7f] != 0:
+                        assert(d == direction_table[cur_sq - sq + 0x7f])
+                    else:
+                        direction_table[cur_sq - sq + 0x7f] = d
+                    cur_sq += d
+
+            for (pc, moves) in piece_moves.iteritems():
+                sq_rays = []
+                for d in moves:
+                    ray = []
+                    cur_sq = sq + d
+                    while valid_sq(cur_sq):
+                        ray.append(cur_sq)
+                        if pc not in sliding_pieces:
+                            break
+                        cur_sq += d
+                    if ray:
+                        sq_rays.append(tuple(ray))
+                rays[pc][sq] = tuple(sq_rays)
+
+            knight_sqs[sq] = tuple(ray[0] for ray in rays['n'][sq])
+            king_sqs[sq] = tuple(ray[0] for ray in rays['k'][sq])
+            pawn_sqs[0][sq] = tuple(s for s in (sq + 0x11, sq + 0xf)
+                if valid_sq(s))
+            pawn_sqs[1][sq] = tuple(s for s in (sq - 0x11, sq - 0xf)
+                if valid_sq(s))
+init_tables()
+
+
+def under_attack(board, sq, wtm):
+    """determine whether a square is attacked by the given side"""
+    if wtm:
+        (p, n, b, r, q, k) = 'PNBRQK'
+    else:
+        (p, n, b, r, q, k) = 'pnbrqk'
+
+    for s in pawn_sqs[wtm][sq]:
+        if board[s] == p:
+            return True
+
+    for s in knight_sqs[sq]:
+        if board[s] == n:
+            return True
+
+    for s in king_sqs[sq]:
+        if board[s] == k:
+            return True
+
+    # bishop/queen attacks
+    for ray in rays['b'][sq]:
+        for s in ray:
+            pc = board[s]
+            if pc != '-':
+                if pc == b or pc == q:
+                    return True
+                # square blocked
+                break
+
+    # rook/queen attacks
+    for ray in rays['r'][sq]:
+        for s in ray:
+            pc = board[s]
+            if pc != '-':
+                if pc == r or pc == q:
+                    return True
+                # square blocked
+                break
+
+    return False
+
+
+def update_pieces(pieces, board, sqs):
+    """Bring the lists of each side's pieces, which are sets of
+    squares indexed by wtm, up to date with the board on the given
+    squares."""
+    for sq in sqs:
+        pc = board[sq]
+        if pc == '-':
+            pieces[0].discard(sq)
+            pieces[1].discard(sq)
+        elif pc.isupper():
+            pieces[1].add(sq)
+            pieces[0].discard(sq)
+        else:
+            pieces[0].add(sq)
+            pieces[1].discard(sq)
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
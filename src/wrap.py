@@ -0,0 +1,114 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Word wrapping for output to users.
+
+The results are the same as filling each line of the text with a
+textwrap.TextWrapper using the options we have always used, but most
+output has no lines longer than the user's width, and in that case
+the text is returned without being decoded or split into words. """
+
+import re
+import textwrap
+
+# XXX this doesn't remove whitespace at the beginning of
+# indented lines like original FICS
+SUBSEQUENT_INDENT = r'\   '
+
+# the regex textwrap uses to split unicode text into words
+_wordsep_re = re.compile(textwrap.TextWrapper.wordsep_re.pattern, re.U)
+
+
+class Wrapper(object):
+    def __init__(self, width):
+        self.width = width
+
+    def fits(self, data):
+        """ Check whether no line of the given text is longer than the
+        width (counting the newline, as textwrap does).  For UTF-8
+        text this can give false negatives, but never false
+        positives. """
+        if '\t' in data:
+            # tabs would be expanded
+            return False
+        return len(max(data.split('\n'), key=len)) < self.width
+
+    def wrap(self, data):
+        """ Wrap a str or unicode string, returning a UTF-8 str. """
+        if self.fits(data):
+            if type(data) == unicode:
+                data = data.encode('utf-8')
+            return data
+        if type(data) != unicode:
+            data = data.decode('utf-8')
+        # we have to split the text into lines before
+        # wrapping
+        # relevant: http://bugs.python.org/issue1859
+        width = self.width
+        wrapped_lines = [line if len(line) <= width and '\t' not in line
+                else self.fill_line(line)
+            for line in data.splitlines(True)]
+        return ''.join(wrapped_lines).encode('utf-8')
+
+    def fill_line(self, line):
+        """ Wrap a single unicode line, like TextWrapper.fill() with
+        expand_tabs=True, replace_whitespace=False,
+        drop_whitespace=False, break_long_words=True, and the
+        subsequent indent. """
+        chunks = [c for c in _wordsep_re.split(line.expandtabs()) if c]
+        lines = []
+        indent = ''
+        width = self.width
+        i = 0
+        n = len(chunks)
+        while i < n:
+            cur_line = []
+            cur_len = 0
+            while i < n:
+                l = len(chunks[i])
+                if cur_len + l <= width:
+                    cur_line.append(chunks[i])
+                    cur_len += l
+                    i += 1
+                else:
+                    break
+            if i < n and len(chunks[i]) > width:
+                # break a word that is too long to fit on a line
+                space_left = width - cur_len if width >= 1 else 1
+                cur_line.append(chunks[i][:space_left])
+                chunks[i] = chunks[i][space_left:]
+            if cur_line:
+                lines.append(indent + ''.join(cur_line))
+                if not indent:
+                    indent = SUBSEQUENT_INDENT
+                    width = self.width - len(indent)
+        return '\n'.join(lines)
+
+
+_wrappers = {}
+
+
+def get_wrapper(width):
+    """ Get the shared wrapper for the given width. """
+    try:
+        return _wrappers[width]
+    except KeyError:
+        w = _wrappers[width] = Wrapper(width)
+        return w
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
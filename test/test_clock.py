@@ -205,8 +205,7 @@ class TestFlag(Test):
     @with_player('TestPlayer')
     def test_autoflag_nomove(self):
         """ Test when a player forfeits on time without making a move. The
-        server make take a few seconds to award the forfeit, since it
-        checks at the heartbeat timer. """
+        server awards the forfeit as soon as the clock runs out. """
         t = self.connect_as_admin()
         t2 = self.connect_as('testplayer')
 
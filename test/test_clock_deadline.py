@@ -0,0 +1,185 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of flag deadlines using a fake reactor, so they don't need
+a running server. """
+
+import sys
+
+from twisted.trial import unittest
+from twisted.internet import task, defer
+
+sys.path.append('src/')
+
+import clock
+from game_constants import WHITE, BLACK
+
+# how late a flag may be, in seconds
+EPSILON = 0.001
+
+
+class FakeUser(object):
+    def __init__(self, name, autoflag=True):
+        self.name = name
+        self.vars_ = {'autoflag': autoflag}
+
+
+class FakePos(object):
+    white_has_mating_material = True
+    black_has_mating_material = True
+
+
+class FakeVariant(object):
+    def __init__(self):
+        self.pos = FakePos()
+
+
+class FakeGame(object):
+    number = 1
+
+    def __init__(self, inc=0, autoflag=True):
+        self.inc = inc
+        self.is_active = True
+        self.white = FakeUser('WhitePlayer', autoflag)
+        self.black = FakeUser('BlackPlayer', autoflag)
+        self.variant = FakeVariant()
+        self.results = []
+
+    def get_side_user(self, side):
+        return self.white if side == WHITE else self.black
+
+    def result(self, msg, result_code):
+        self.is_active = False
+        self.results.append((msg, result_code))
+        return defer.succeed(None)
+
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.patch(clock, 'reactor', self.reactor)
+
+    def make_clock(self, name, white_time, black_time, **kw):
+        g = FakeGame(**kw)
+        c = clock.clock_names[name](g, white_time, black_time)
+        return (g, c)
+
+    def move(self, c, side, ply, secs):
+        """ Let secs pass, then make a move for side. """
+        self.reactor.advance(secs)
+        c.got_move(side, ply, None, False)
+        if ply > 2:
+            c.add_increment(side)
+        c.start(BLACK if side == WHITE else WHITE)
+
+    def expect_flag(self, g, secs, result):
+        """ Check that the flag falls in secs, but not before. """
+        self.reactor.advance(secs - EPSILON)
+        self.assertEqual(g.results, [])
+        self.reactor.advance(2 * EPSILON)
+        self.assertEqual(len(g.results), 1)
+        self.assertEqual(g.results[0][1], result)
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+
+    def test_fischer(self):
+        (g, c) = self.make_clock('fischer', 10.0, 10.0, inc=2)
+        c.start(WHITE)
+        self.move(c, WHITE, 1, 1.0)
+        self.move(c, BLACK, 2, 3.0)
+        self.move(c, WHITE, 3, 4.0)
+        # black has 7 + 0 seconds left
+        self.expect_flag(g, 7.0, '1-0')
+
+    def test_fischer_increment(self):
+        (g, c) = self.make_clock('fischer', 10.0, 10.0, inc=2)
+        c.start(WHITE)
+        self.move(c, WHITE, 1, 1.0)
+        self.move(c, BLACK, 2, 1.0)
+        self.move(c, WHITE, 3, 4.0)
+        self.move(c, BLACK, 4, 1.0)
+        # white has 9 - 4 + 2 seconds left
+        self.expect_flag(g, 7.0, '0-1')
+
+    def test_bronstein(self):
+        (g, c) = self.make_clock('bronstein', 10.0, 10.0, inc=2)
+        c.start(WHITE)
+        self.move(c, WHITE, 1, 1.0)
+        self.move(c, BLACK, 2, 1.0)
+        self.move(c, WHITE, 3, 1.5)
+        self.move(c, BLACK, 4, 5.0)
+        # white gets back only the 1.5 seconds used
+        self.expect_flag(g, 9.0, '0-1')
+
+    def test_hourglass(self):
+        (g, c) = self.make_clock('hourglass', 10.0, 10.0)
+        c.start(WHITE)
+        self.move(c, WHITE, 1, 4.0)
+        # the 4 seconds white used go to black
+        self.expect_flag(g, 14.0, '1-0')
+
+    def test_overtime(self):
+        g = FakeGame()
+        g.overtime_move_num = 2
+        g.overtime_bonus = 1
+        c = clock.OvertimeClock(g, 10.0, 10.0)
+        c.start(WHITE)
+        self.move(c, WHITE, 1, 1.0)
+        self.move(c, BLACK, 2, 1.0)
+        self.move(c, WHITE, 3, 2.0)
+        self.move(c, BLACK, 4, 1.0)
+        # white reached the time control on move 2
+        self.expect_flag(g, 67.0, '0-1')
+
+    def test_moretime(self):
+        (g, c) = self.make_clock('fischer', 10.0, 10.0)
+        c.start(WHITE)
+        self.reactor.advance(5.0)
+        c.moretime(WHITE, 30)
+        self.expect_flag(g, 35.0, '0-1')
+
+    def test_stop(self):
+        (g, c) = self.make_clock('fischer', 10.0, 10.0)
+        c.start(WHITE)
+        self.reactor.advance(5.0)
+        c.stop()
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+        self.reactor.advance(10.0)
+        self.assertEqual(g.results, [])
+
+    def test_no_autoflag(self):
+        (g, c) = self.make_clock('fischer', 10.0, 10.0, autoflag=False)
+        c.start(WHITE)
+        self.reactor.advance(11.0)
+        self.assertEqual(g.results, [])
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+
+    def test_autoflag_turned_on(self):
+        (g, c) = self.make_clock('fischer', 10.0, 10.0, autoflag=False)
+        c.start(WHITE)
+        self.reactor.advance(11.0)
+        g.black.vars_['autoflag'] = True
+        c.check_autoflag()
+        self.assertEqual(len(g.results), 1)
+        self.assertEqual(g.results[0][1], '0-1')
+
+    def test_untimed(self):
+        c = clock.UntimedClock()
+        c.start(WHITE)
+        self.assertEqual(self.reactor.getDelayedCalls(), [])
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,123 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of saving finished games in batches, using a fake reactor
+and DB, so they don't need a running server. """
+
+import sys
+
+from twisted.trial import unittest
+from twisted.internet import task, defer
+
+sys.path.append('src/')
+
+import game_writer
+
+
+class BadGame(Exception):
+    pass
+
+
+class FakeDb(object):
+    def __init__(self):
+        self.batches = []
+        self.pending = []
+        self.next_id = 1
+
+    def game_complete_many(self, completions):
+        self.batches.append(list(completions))
+        d = defer.Deferred()
+        self.pending.append((completions, d))
+        return d
+
+    def finish_write(self):
+        (completions, d) = self.pending.pop(0)
+        if [c for c in completions if c.game.get('bad')]:
+            d.errback(BadGame())
+        else:
+            game_ids = range(self.next_id, self.next_id + len(completions))
+            self.next_id += len(completions)
+            d.callback(game_ids)
+
+
+def make_completion(bad=False):
+    c = game_writer.Completion({'idn': None, 'bad': bad})
+    c.history.append((1, {'game_id': None}))
+    return c
+
+
+class TestGameWriter(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.db = FakeDb()
+        self.patch(game_writer, 'reactor', self.reactor)
+        self.patch(game_writer, 'db', self.db)
+        self.writer = game_writer.GameWriter()
+
+    def test_batch(self):
+        completions = [make_completion() for i in range(3)]
+        game_ids = []
+        for c in completions:
+            self.writer.add(c).addCallback(game_ids.append)
+        self.assertEqual(self.db.batches, [])
+        self.reactor.advance(game_writer.FLUSH_DELAY)
+        self.assertEqual(self.db.batches, [completions])
+        self.db.finish_write()
+        self.assertEqual(game_ids, [1, 2, 3])
+        self.assertEqual([c.history[0][1]['game_id'] for c in completions],
+            [1, 2, 3])
+
+    def test_flush_count(self):
+        for i in range(game_writer.FLUSH_COUNT):
+            self.writer.add(make_completion())
+        self.assertEqual(len(self.db.batches), 1)
+        self.assertEqual(len(self.db.batches[0]), game_writer.FLUSH_COUNT)
+
+    def test_one_write_at_a_time(self):
+        self.writer.add(make_completion())
+        self.reactor.advance(game_writer.FLUSH_DELAY)
+        self.writer.add(make_completion())
+        self.writer.add(make_completion())
+        self.reactor.advance(game_writer.FLUSH_DELAY)
+        self.assertEqual(len(self.db.batches), 1)
+        done = []
+        self.writer.flush().addCallback(done.append)
+        self.db.finish_write()
+        self.assertEqual(len(self.db.batches), 2)
+        self.assertEqual(len(self.db.batches[1]), 2)
+        self.assertEqual(done, [])
+        self.db.finish_write()
+        self.assertEqual(len(done), 1)
+
+    def test_failure(self):
+        good = make_completion()
+        bad = make_completion(bad=True)
+        results = []
+        self.writer.add(good).addCallback(results.append)
+        self.writer.add(bad).addErrback(lambda f: results.append(
+            f.check(BadGame)))
+        self.writer.flush()
+        self.db.finish_write()
+        # each game is retried on its own
+        self.assertEqual(self.db.batches[1:], [[good]])
+        self.db.finish_write()
+        self.assertEqual(self.db.batches[2:], [[bad]])
+        self.db.finish_write()
+        self.assertEqual(results, [1, BadGame])
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,134 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of the batched user log, using a fake reactor and DB, so they
+don't need a running server. """
+
+import sys
+
+from twisted.trial import unittest
+from twisted.internet import task, defer
+
+sys.path.append('src/')
+
+import log_writer
+
+
+class FakeDb(object):
+    def __init__(self):
+        self.inserts = []
+        self.trims = []
+        self.pending = []
+
+    def user_log_add_many(self, entries):
+        self.inserts.append(list(entries))
+        d = defer.Deferred()
+        self.pending.append(d)
+        return d
+
+    def user_log_trim(self, user_names, keep):
+        self.trims.append((sorted(user_names), keep))
+        return defer.succeed(None)
+
+    def finish_writes(self):
+        pending = self.pending
+        self.pending = []
+        for d in pending:
+            d.callback(None)
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.reactor = task.Clock()
+        self.reactor.advance(1000000000)
+        self.db = FakeDb()
+        self.patch(log_writer, 'reactor', self.reactor)
+        self.patch(log_writer, 'db', self.db)
+        self.writer = log_writer.LogWriter()
+
+    def test_batch(self):
+        self.writer.add('SomePlayer', True, '127.0.0.1')
+        self.writer.add('OtherPlayer', True, '127.0.0.2')
+        self.writer.add('SomePlayer', False, '127.0.0.1')
+        self.assertEqual(self.db.inserts, [])
+        self.reactor.advance(log_writer.FLUSH_DELAY)
+        self.assertEqual(len(self.db.inserts), 1)
+        self.assertEqual([e[0:3] for e in self.db.inserts[0]],
+            [('SomePlayer', 'login', '127.0.0.1'),
+            ('OtherPlayer', 'login', '127.0.0.2'),
+            ('SomePlayer', 'logout', '127.0.0.1')])
+
+    def test_flush_count(self):
+        for i in range(log_writer.FLUSH_COUNT):
+            self.writer.add('Player%d' % i, True, '127.0.0.1')
+        self.assertEqual(len(self.db.inserts), 1)
+        self.assertEqual(len(self.db.inserts[0]), log_writer.FLUSH_COUNT)
+        self.reactor.advance(log_writer.FLUSH_DELAY)
+        self.assertEqual(len(self.db.inserts), 1)
+
+    def test_flush_waits_for_writes(self):
+        self.writer.add('SomePlayer', True, '127.0.0.1')
+        self.writer.flush()
+        d = self.writer.flush()
+        fired = []
+        d.addCallback(fired.append)
+        self.assertEqual(fired, [])
+        self.db.finish_writes()
+        self.assertEqual(len(fired), 1)
+
+    def test_merge(self):
+        self.writer.add('SomePlayer', True, '127.0.0.1')
+        self.writer.flush()
+        self.reactor.advance(60)
+        self.writer.add('OtherPlayer', True, '127.0.0.2')
+        self.reactor.advance(60)
+        self.writer.add('SomePlayer', False, '127.0.0.1')
+
+        # the first entry has been written but the write has not
+        # finished yet
+        written = dict(zip(log_writer._fields, self.db.inserts[0][0]))
+        old = dict(written)
+        old['log_when'] = old['log_when'].replace(year=2000)
+        rows = [written, old]
+
+        log = self.writer.merge(rows, 10, 'SomePlayer')
+        self.assertEqual([r['log_which'] for r in log],
+            ['logout', 'login', 'login'])
+        self.assertEqual(log[2]['log_when'].year, 2000)
+
+        log = self.writer.merge(rows, 3)
+        self.assertEqual([r['log_who_name'] for r in log],
+            ['SomePlayer', 'OtherPlayer', 'SomePlayer'])
+
+        self.db.finish_writes()
+        self.reactor.advance(log_writer.FLUSH_DELAY)
+        self.db.finish_writes()
+        self.assertEqual(self.writer.merge(rows, 10), rows)
+
+    def test_trim(self):
+        self.writer.add('SomePlayer', True, '127.0.0.1')
+        self.writer.add('OtherPlayer', True, '127.0.0.2')
+        self.writer.trim()
+        self.assertEqual(self.db.trims, [])
+        self.db.finish_writes()
+        self.assertEqual(self.db.trims,
+            [(['OtherPlayer', 'SomePlayer'], log_writer.LOG_SIZE)])
+        self.writer.trim()
+        self.assertEqual(len(self.db.trims), 1)
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
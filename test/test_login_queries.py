@@ -0,0 +1,105 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Count the database round trips and queries made when a registered
+user logs in, using a fake connection pool, so these tests don't need
+a running server or database. """
+
+import sys
+
+from twisted.trial import unittest
+from twisted.internet import defer
+
+sys.path.append('src/')
+
+import db
+
+
+class FakeTxn(object):
+    """ A cursor that records queries and returns canned rows. """
+    def __init__(self, queries):
+        self.queries = queries
+        self._rows = []
+
+    def execute(self, sql, args=None):
+        self.queries.append(sql)
+        if 'COUNT(*)' in sql:
+            self._rows = [{'c': 3, 's': 1}]
+        elif 'SELECT user_first_login' in sql:
+            self._rows = [{'user_first_login': 'now'}]
+        elif 'SELECT tzone' in sql:
+            self._rows = [{'tzone': 'UTC'}]
+        elif 'FROM channel_user' in sql:
+            self._rows = [{'channel_id': 1}, {'channel_id': 53}]
+        elif 'user_notify.notified' in sql:
+            self._rows = [{'user_name': 'SomePlayer'}]
+        else:
+            self._rows = []
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakePool(object):
+    """ Counts round trips to the database. """
+    def __init__(self):
+        self.round_trips = 0
+        self.queries = []
+
+    def runInteraction(self, f, *args):
+        self.round_trips += 1
+        return defer.succeed(f(FakeTxn(self.queries), *args))
+
+    def runQuery(self, sql, args=None):
+        self.round_trips += 1
+        self.queries.append(sql)
+        return defer.succeed([])
+
+    runOperation = runQuery
+
+
+class TestLoginQueries(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        self.patch(db, 'adb', self.pool)
+
+    @defer.inlineCallbacks
+    def test_init_state(self):
+        state = yield db.user_get_init_state(7, ['tzone'])
+        self.assertEqual(self.pool.round_trips, 1)
+        self.assertEqual(len(self.pool.queries), 5)
+        self.assertEqual(state['channels'], [1, 53])
+        self.assertEqual(state['vars'], {'tzone': 'UTC'})
+
+    @defer.inlineCallbacks
+    def test_login_state(self):
+        state = yield db.user_get_login_state(7, None, set_first_login=False)
+        self.assertEqual(self.pool.round_trips, 1)
+        self.assertEqual(len(self.pool.queries), 11)
+        self.assertEqual(state['notified'], ['SomePlayer'])
+        self.assertEqual(state['message_count'], (3, 1))
+        self.assertTrue('first_login' not in state)
+
+    @defer.inlineCallbacks
+    def test_first_login(self):
+        state = yield db.user_get_login_state(7, None, set_first_login=True)
+        self.assertEqual(self.pool.round_trips, 1)
+        self.assertEqual(len(self.pool.queries), 13)
+        self.assertEqual(state['first_login'], 'now')
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,84 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of the check that skips move parsing for input that cannot
+be a move, which don't need a running server. """
+
+from __future__ import absolute_import
+
+import sys
+
+from twisted.trial import unittest
+
+sys.path.insert(0, 'src/')
+
+from variant.base_variant import IllegalMoveError
+from variant import chess, chess960, crazyhouse, suicide
+
+
+class TestMovePrecheck(unittest.TestCase):
+    def check_moves(self, v, moves):
+        """ Check that each spelling of the legal moves is still
+        parsed, then make the given moves. """
+        for s in moves:
+            for mv in v.pos.generate_legal_moves():
+                san = mv.to_san()
+                for t in [san, san + '+', san.lower(), str(mv),
+                        str(mv).upper()]:
+                    try:
+                        parsed = v.parse_move(t, None)
+                    except IllegalMoveError:
+                        self.assertRaises(IllegalMoveError, v.get_move,
+                            t, None)
+                    else:
+                        if parsed:
+                            self.assertEqual(v.get_move(t, None).to_san(),
+                                parsed.to_san())
+            mv = v.get_move(s, None)
+            mv.to_san()
+            v.pos.make_move(mv)
+            v.pos.detect_check()
+
+    def test_chess(self):
+        v = chess.Chess(None)
+        v.pos.detect_check()
+        self.check_moves(v, ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5', 'O-O'])
+
+    def test_chess960(self):
+        v = chess960.Chess960(None)
+        v.set_idn(0)
+        v.pos.detect_check()
+        self.check_moves(v, ['g4', 'e5', 'g5', 'Nf6', 'gxf6'])
+
+    def test_crazyhouse(self):
+        v = crazyhouse.Crazyhouse(None)
+        v.pos.detect_check()
+        self.check_moves(v, ['e4', 'd5', 'exd5', 'Qxd5', 'P@e4'])
+
+    def test_suicide(self):
+        v = suicide.Suicide(None)
+        v.pos.detect_check()
+        self.check_moves(v, ['e4', 'd5', 'exd5', 'Qxd5'])
+
+    def test_not_moves(self):
+        v = chess.Chess(None)
+        v.pos.detect_check()
+        for s in ['tell', 'say hi', 'match GuestABCD', 'e4 e5', '1', '']:
+            self.assertEqual(v.get_move(s, None), None)
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
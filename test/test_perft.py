@@ -0,0 +1,105 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of the legal move generators, using perft counts for
+well-known positions.  The deeper searches are in
+scripts/bench-perft.py. """
+
+from __future__ import absolute_import
+
+import sys
+
+from twisted.trial import unittest
+
+sys.path.insert(0, 'src/')
+
+from variant.base_variant import perft, IllegalMoveError
+from variant import chess, chess960, crazyhouse, bughouse, suicide
+
+INITIAL_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+KIWIPETE_FEN = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+
+
+class TestPerft(unittest.TestCase):
+    def check_perft(self, pos, counts):
+        for (i, count) in enumerate(counts):
+            self.assertEqual(perft(pos, i + 1), count)
+
+    def test_chess(self):
+        self.check_perft(chess.Position(INITIAL_FEN), [20, 400, 8902])
+        self.check_perft(chess.Position(KIWIPETE_FEN), [48, 2039])
+        self.check_perft(chess.Position(
+            '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'), [14, 191, 2812])
+        self.check_perft(chess.Position(
+            'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8'),
+            [44, 1486])
+
+    def test_chess960(self):
+        self.check_perft(chess960.Position(
+            'bqnb1rkr/pp3ppp/3ppn2/2p5/5P2/P2P4/NPP1P1PP/BQ1BNRKR w KQkq - 2 9'),
+            [21, 528])
+
+    def test_crazyhouse(self):
+        self.check_perft(crazyhouse.Position(KIWIPETE_FEN), [48, 2039])
+
+    def test_bughouse(self):
+        pos = bughouse.Position(INITIAL_FEN)
+        pos.bug_link = bughouse.Position(INITIAL_FEN)
+        pos.bug_link.bug_link = pos
+        pos.add_to_holding('P', True)
+        pos.add_to_holding('n', True)
+        self.check_perft(pos, [52, 2662])
+
+    def test_suicide(self):
+        pos = suicide.Position(
+            'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1')
+        pos.detect_check()
+        self.check_perft(pos, [20, 400, 8067])
+        pos = suicide.Position('4k3/1P6/8/3pP3/8/8/6p1/4K3 w - d6 0 1')
+        pos.detect_check()
+        self.check_perft(pos, [12, 125, 1125])
+
+
+class TestMoves(unittest.TestCase):
+    def test_castling_blocked(self):
+        pos = chess.Position('r3k2r/8/8/8/8/8/8/RN2K1nR w KQkq - 0 1')
+        self.assertRaises(IllegalMoveError, pos.move_from_castle, 'O-O')
+        self.assertRaises(IllegalMoveError, pos.move_from_castle, 'O-O-O')
+        self.assertFalse([mv for mv in pos.generate_legal_moves()
+            if mv.is_oo or mv.is_ooo])
+
+    def test_chess960_castling_blocked(self):
+        # the rook would move onto d1
+        pos = chess960.Position('rk1n3r/8/8/8/8/8/8/RK1N3R w KQkq - 0 1')
+        self.assertRaises(IllegalMoveError, pos.move_from_castle, 'O-O-O')
+        self.assertFalse([mv for mv in pos.generate_legal_moves()
+            if mv.is_ooo])
+
+    def test_drop_in_check(self):
+        pos = crazyhouse.Position('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2')
+        for s in ['exd5', 'Qxd5', 'Nf3', 'Qe4']:
+            pos.make_move(pos.move_from_san(s))
+            pos.detect_check()
+        self.assertTrue(pos.in_check)
+        self.assertRaises(IllegalMoveError, pos.move_from_drop, 'P@h5')
+        self.assertTrue(pos.move_from_drop('P@e2'))
+        drops = [mv.to for mv in pos.generate_legal_moves() if mv.drop]
+        self.assertEqual(sorted(drops), [chess.str_to_sq('e2'),
+            chess.str_to_sq('e3')])
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,103 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of starting new games from template positions, which don't
+need a running server. """
+
+from __future__ import absolute_import
+
+import os
+import re
+import sys
+import copy
+
+from twisted.trial import unittest
+
+sys.path.insert(0, 'src/')
+
+from variant import chess, chess960, crazyhouse, bughouse, suicide
+
+# like src/, relative to the top of the source tree; trial runs the
+# tests from another directory
+chess960_sql = os.path.abspath('db/chess960.sql')
+
+
+class TestClone(unittest.TestCase):
+    def state(self, pos):
+        d = pos.__dict__.copy()
+        d['board'] = pos.board.tostring()
+        # bughouse games link the positions on the two boards
+        d.pop('bug_link', None)
+        # moves past the current ply are scratch moves left over from
+        # legality tests
+        d['history'] = (pos.history.hashes, pos.history.moves[:pos.ply])
+        return d
+
+    def check_clone(self, pos, moves):
+        pos.detect_check()
+        before = self.state(pos)
+        clone = pos.clone()
+        self.assertEqual(self.state(clone), self.state(copy.deepcopy(pos)))
+        for s in moves:
+            mv = clone.move_from_san(s)
+            clone.make_move(mv)
+            clone.detect_check()
+        # the template is unchanged
+        self.assertEqual(self.state(pos), before)
+        self.assertNotEqual(clone.hash, pos.hash)
+
+    def test_chess(self):
+        self.check_clone(chess.initial_pos, ['e4', 'd5', 'exd5', 'Qxd5'])
+
+    def test_crazyhouse(self):
+        self.check_clone(crazyhouse.initial_pos,
+            ['e4', 'd5', 'exd5', 'Qxd5'])
+
+    def test_bughouse(self):
+        pos = bughouse.initial_pos.clone()
+        pos.bug_link = bughouse.initial_pos.clone()
+        pos.bug_link.bug_link = pos
+        self.check_clone(pos, ['e4', 'd5', 'exd5', 'Qxd5'])
+
+    def test_suicide(self):
+        self.check_clone(suicide.initial_pos, ['e4', 'd5', 'exd5', 'Qxd5'])
+
+    def test_chess960(self):
+        self.check_clone(chess960.initial_pos_from_idn(0),
+            ['b4', 'b6', 'Bb2', 'Bb7', 'Bxg7'])
+        v = chess960.Chess960(None)
+        v.set_idn(518)
+        self.assertEqual(v.pos.board.tostring(),
+            chess.initial_pos.board.tostring())
+        self.assertFalse(v.pos is chess960.initial_pos[518])
+
+
+class TestIdn(unittest.TestCase):
+    def test_fen_from_idn(self):
+        """ The positions match the ones in the database. """
+        count = 0
+        for line in open(chess960_sql):
+            m = re.match(r'INSERT INTO chess960_pos VALUES\((\d+),"(.*)"\);',
+                line)
+            if m:
+                self.assertEqual(chess960.fen_from_idn(int(m.group(1))),
+                    m.group(2))
+                count += 1
+        self.assertEqual(count, 960)
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,111 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of the position history kept for repetition detection and
+takebacks, which don't need a running server. """
+
+from __future__ import absolute_import
+
+import sys
+
+from twisted.trial import unittest
+
+sys.path.insert(0, 'src/')
+
+from game_constants import WHITE, BLACK
+from variant import chess, chess960, crazyhouse
+
+
+class TestRepetition(unittest.TestCase):
+    def play(self, pos, moves):
+        for s in moves:
+            mv = pos.move_from_san(s)
+            pos.make_move(mv)
+            pos.detect_check()
+
+    def test_repetition(self):
+        pos = chess.initial_pos.clone()
+        self.play(pos, ['Nf3', 'Nf6', 'Ng1', 'Ng8'] * 2)
+        self.assertEqual(pos.history.get_hash_count(pos.hash), 3)
+        self.assertTrue(pos.is_draw_repetition(WHITE))
+        self.assertTrue(pos.is_draw_repetition(BLACK))
+
+        pos.undo_move(pos.get_last_move())
+        self.assertEqual(pos.history.get_hash_count(pos.hash), 2)
+        self.assertFalse(pos.is_draw_repetition(WHITE))
+
+    def test_previous_position(self):
+        pos = chess.initial_pos.clone()
+        self.play(pos, ['Nf3', 'Nf6', 'Ng1', 'Ng8'] * 2 + ['e4'])
+        # only the player to move can claim the previous position
+        self.assertFalse(pos.is_draw_repetition(WHITE))
+        self.assertFalse(pos.is_draw_repetition(BLACK))
+
+        pos = chess.initial_pos.clone()
+        self.play(pos, ['Nf3', 'Nf6', 'Ng1', 'Ng8'] * 2 + ['Nc3'])
+        self.assertFalse(pos.is_draw_repetition(WHITE))
+        self.assertTrue(pos.is_draw_repetition(BLACK))
+
+    def test_crazyhouse(self):
+        pos = crazyhouse.initial_pos.clone()
+        self.play(pos, ['Nf3', 'Nf6', 'Ng1', 'Ng8'] * 2)
+        self.assertTrue(pos.is_draw_repetition(WHITE))
+
+    def test_clone(self):
+        pos = chess.initial_pos.clone()
+        self.play(pos, ['Nf3', 'Nf6', 'Ng1', 'Ng8'])
+        clone = pos.clone()
+        self.play(clone, ['Nf3', 'Nf6', 'Ng1', 'Ng8'])
+        self.assertEqual(pos.history.get_hash_count(pos.hash), 2)
+        self.assertEqual(clone.history.get_hash_count(clone.hash), 3)
+
+
+class TestClockTimes(unittest.TestCase):
+    def test_clock_times(self):
+        pos = chess.initial_pos.clone()
+        pos.history.set_clock_time(0, 179.5)
+        pos.history.set_clock_time(1, None)
+        pos.history.set_clock_time(100, 12.25)
+        self.assertEqual(pos.history.get_clock_time(0), 179.5)
+        self.assertEqual(pos.history.get_clock_time(1), None)
+        self.assertEqual(pos.history.get_clock_time(99), None)
+        self.assertEqual(pos.history.get_clock_time(100), 12.25)
+        self.assertEqual(chess.initial_pos.history.get_clock_time(0), None)
+
+
+class TestUndo(unittest.TestCase):
+    def check_castle_undo(self, fen, s):
+        pos = chess960.Position(fen)
+        board = pos.board.tostring()
+        mv = pos.move_from_castle(s)
+        pos.make_move(mv)
+        pos.undo_move(mv)
+        self.assertEqual(pos.board.tostring(), board)
+
+    def test_chess960_castle_undo(self):
+        # the king starts on the rook's destination square
+        self.check_castle_undo(
+            'qbrnbkrn/pppppppp/8/8/8/8/PPPPPPPP/QBR2KR1 w KQkq - 0 1', 'O-O')
+        # the rook does not move
+        self.check_castle_undo(
+            'rk3r2/pppppppp/8/8/8/8/PPPPPPPP/RK3R2 w KQkq - 0 1', 'O-O')
+        # the king does not move
+        self.check_castle_undo(
+            'r1k3r1/pppppppp/8/8/8/8/PPPPPPPP/R1K3R1 w KQkq - 0 1', 'O-O-O')
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
@@ -0,0 +1,123 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of the style12 boards rendered for players and observers,
+which don't need a running server. """
+
+from __future__ import absolute_import
+
+import sys
+
+from twisted.trial import unittest
+
+sys.path.insert(0, 'src/')
+
+from game_constants import PLAYED
+from variant import chess, crazyhouse
+
+
+class FakeSession(object):
+    def __init__(self, ms):
+        self.ivars = {'ms': ms}
+
+
+class FakeUser(object):
+    def __init__(self, name, ms=True, flip=False):
+        self.name = name
+        self.session = FakeSession(ms)
+        self.vars_ = {'flip': flip}
+
+
+class FakeClock(object):
+    is_ticking = True
+
+    def get_white_time(self):
+        return 61.5
+
+    def get_black_time(self):
+        return 59.25
+
+
+class FakeGame(object):
+    def __init__(self):
+        self.gtype = PLAYED
+        self.number = 7
+        self.white = FakeUser('GuestA')
+        self.black = FakeUser('GuestB', ms=False)
+        self.players = set([self.white, self.black])
+        self.observers = set()
+        self.white_time = 1
+        self.inc = 0
+        self.clock = FakeClock()
+
+
+class TestStyle12(unittest.TestCase):
+    def setUp(self):
+        self.game = FakeGame()
+        self.variant = chess.Chess(self.game)
+        self.variant.pos.detect_check()
+
+    def move(self, s, secs):
+        mv = self.variant.pos.move_from_san(s)
+        mv.time = secs
+        self.variant.do_move(mv)
+
+    def test_initial(self):
+        self.assertEqual(self.variant.to_style12(self.game.white),
+            '\n<12> rnbqkbnr pppppppp -------- -------- -------- -------- PPPPPPPP RNBQKBNR W -1 1 1 1 1 0 7 GuestA GuestB 1 1 0 39 39 61500 59250 1 none (0:00.000) none 0 1 0\n')
+
+    def test_users(self):
+        self.move('e4', 2.5)
+        obs = FakeUser('GuestC', flip=True)
+        self.game.observers.add(obs)
+        self.assertEqual(self.variant.to_style12(self.game.white),
+            '\n<12> rnbqkbnr pppppppp -------- -------- ----P--- -------- PPPP-PPP RNBQKBNR B -1 1 1 1 1 0 7 GuestA GuestB -1 1 0 39 39 61500 59250 1 P/e2-e4 (0:02.500) e4 0 1 0\n')
+        self.assertEqual(self.variant.to_style12(self.game.black),
+            '\n<12> rnbqkbnr pppppppp -------- -------- ----P--- -------- PPPP-PPP RNBQKBNR B -1 1 1 1 1 0 7 GuestA GuestB 1 1 0 39 39 62 59 1 P/e2-e4 (0:02) e4 1 1 0\n')
+        self.assertEqual(self.variant.to_style12(obs),
+            '\n<12> rnbqkbnr pppppppp -------- -------- ----P--- -------- PPPP-PPP RNBQKBNR B -1 1 1 1 1 0 7 GuestA GuestB 0 1 0 39 39 61500 59250 1 P/e2-e4 (0:02.500) e4 1 1 0\n')
+
+    def test_new_move(self):
+        """ The shared part of the board is redrawn when a different
+        move leads to the same position. """
+        self.move('Nf3', 1.0)
+        self.move('Nf6', 1.0)
+        self.move('Nc3', 1.0)
+        before = self.variant.to_style12(self.game.white)
+        self.assertTrue(' N/b1-c3 (0:01.000) Nc3 ' in before)
+        for i in range(3):
+            self.variant.undo_move()
+        self.move('Nc3', 1.0)
+        self.move('Nf6', 1.0)
+        self.move('Nf3', 1.0)
+        after = self.variant.to_style12(self.game.white)
+        self.assertTrue(' N/g1-f3 (0:01.000) Nf3 ' in after)
+        self.assertEqual(before.split(' N/')[0], after.split(' N/')[0])
+
+    def test_holdings(self):
+        v = crazyhouse.Crazyhouse(self.game)
+        v.pos.detect_check()
+        for s in ['e4', 'd5', 'exd5']:
+            mv = v.pos.move_from_san(s)
+            mv.time = 1.0
+            v.pos.make_move(mv)
+            v.pos.detect_check()
+        self.assertTrue(v.to_style12(self.game.black).endswith(
+            '\n<b1> game 7 white [P] black []\n'))
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent
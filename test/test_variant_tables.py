@@ -0,0 +1,123 @@
+# Copyright (C) 2010  Wil Mahan <wmahan+fatics@gmail.com>
+#
+# This file is part of FatICS.
+#
+# FatICS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FatICS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with FatICS.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+""" Tests of the attack tables and piece lists shared by the variants,
+which don't need a running server. """
+
+from __future__ import absolute_import
+
+import sys
+
+from twisted.trial import unittest
+
+sys.path.insert(0, 'src/')
+
+from game_constants import valid_sq
+from variant import tables
+from variant.base_variant import IllegalMoveError
+from variant import chess, chess960, crazyhouse, suicide
+
+
+def slow_under_attack(board, sq, wtm):
+    """ Walk the board from sq, the way under_attack() used to. """
+    for d in tables.piece_moves['q'] + tables.piece_moves['n']:
+        cur_sq = sq + d
+        while valid_sq(cur_sq):
+            pc = board[cur_sq]
+            if pc != '-':
+                if pc.isupper() == wtm:
+                    p = pc.lower()
+                    if p == 'p':
+                        if cur_sq == sq + d and (d in [-0x11, -0xf] if wtm
+                                else d in [0x11, 0xf]):
+                            return True
+                    elif d in tables.piece_moves[p] and (p in 'bqr'
+                            or cur_sq == sq + d):
+                        return True
+                break
+            if d in tables.piece_moves['n']:
+                break
+            cur_sq += d
+    return False
+
+
+class TestTables(unittest.TestCase):
+    def check_pieces(self, pos):
+        for wtm in [False, True]:
+            sqs = set(sq for (sq, pc) in pos
+                if pc != '-' and pc.isupper() == wtm)
+            self.assertEqual(pos.pieces[wtm], sqs)
+
+    def test_under_attack(self):
+        for fen in ['r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP1B1PPP/R2QKB1R w KQ - 0 8',
+                'k7/8/1Q6/8/3pP3/8/5n2/7K b - - 0 1']:
+            pos = chess.Position(fen)
+            for (sq, pc) in pos:
+                for wtm in [False, True]:
+                    self.assertEqual(pos.under_attack(sq, wtm),
+                        slow_under_attack(pos.board, sq, wtm))
+
+    def test_chess(self):
+        pos = chess.Position('r3k2r/pppq1ppp/8/3Pp3/8/8/PPPQ1PPP/R3K2R w KQkq e6 0 1')
+        self.check_pieces(pos)
+        moves = []
+        for s in ['d5-e6', 'O-O-O', 'O-O', 'f7-e6']:
+            mv = pos.move_from_castle(s) or pos.move_from_lalg(s)
+            pos.make_move(mv)
+            pos.detect_check()
+            self.check_pieces(pos)
+            moves.append(mv)
+        for mv in reversed(moves):
+            pos.undo_move(mv)
+            self.check_pieces(pos)
+
+    def test_chess960(self):
+        # the king castles onto its own rook's square
+        pos = chess960.Position('1r4kr/pppppppp/8/8/8/8/PPPPPPPP/1R4KR w KQkq - 0 1')
+        mv = pos.move_from_castle('O-O')
+        pos.make_move(mv)
+        self.check_pieces(pos)
+        self.assertEqual(pos.board.tostring()[0:8], '-R---RK-')
+        pos.undo_move(mv)
+        self.check_pieces(pos)
+
+    def test_crazyhouse_drop(self):
+        pos = crazyhouse.Position('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2')
+        for s in ['exd5', 'Qxd5']:
+            mv = pos.move_from_san(s)
+            pos.make_move(mv)
+            pos.detect_check()
+        mv = pos.move_from_drop('P@c4')
+        pos.make_move(mv)
+        self.check_pieces(pos)
+        pos.undo_move(mv)
+        self.check_pieces(pos)
+
+    def test_suicide(self):
+        pos = suicide.Position('8/8/8/8/8/1b6/P7/B7 b - - 0 1')
+        pos.detect_check()
+        self.assertFalse(pos.is_draw_bishops)
+        # the capture is forced
+        self.assertRaises(IllegalMoveError, pos.move_from_san, 'Bc4')
+        mv = pos.move_from_san('Bxa2')
+        pos.make_move(mv)
+        pos.detect_check()
+        self.check_pieces(pos)
+        self.assertTrue(pos.is_draw_bishops)
+
+# vim: expandtab tabstop=4 softtabstop=4 shiftwidth=4 smarttab autoindent